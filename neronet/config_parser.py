@@ -4,16 +4,31 @@ configuration files and the relating error class
 """
 
 import os
-import itertools
-import copy
+import hashlib
+import json
+import multiprocessing
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
 import yaml
 
 import neronet.core
 import neronet.node
 import neronet.experiment
+import neronet.database
+import neronet.sweep
 
 EXPERIMENT_CONFIG_FILENAME = 'config.yaml'
+PARSE_CACHE_DIR = 'parse_cache'
+PARSE_CACHE_VERSION = 2
+
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
 
 class FormatError(Exception):
     """ Exception raised when experiment config file is poorly formatted
@@ -30,6 +45,62 @@ class FormatError(Exception):
     def __str__(self):
         return '\n'.join([''] + self.error_msgs)
 
+class Scope(Mapping):
+    """ A read-only view of a block of an experiment configuration file
+
+    The view layers the fields defined in the block over the fields it
+    inherits from the enclosing block. Lookups of the inherited fields fall
+    through to the parent scope, so nested blocks share the data of their
+    parents instead of copying it and only the values computed for the block
+    itself (the overrides) are allocated.
+
+    Attributes:
+        data (dict): The fields defined in the block
+        parent (Scope): The scope of the enclosing block
+        inherited (frozenset): The fields inherited from the parent scope
+        overrides (dict): Fields computed for the block, taking precedence
+            over the data
+    """
+
+    def __init__(self, data, parent=None, inherited=(), overrides=None):
+        self.data = data if isinstance(data, dict) else {}
+        self.parent = parent
+        self.inherited = frozenset(inherited) if parent is not None \
+                            else frozenset()
+        self.overrides = overrides if overrides is not None else {}
+
+    def __getitem__(self, key):
+        if key in self.overrides:
+            return self.overrides[key]
+        if key in self.data:
+            return self.data[key]
+        if key in self.inherited:
+            return self.parent[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.overrides or key in self.data or \
+                key in self.inherited
+
+    def __iter__(self):
+        return iter(set(self.overrides) | set(self.data) | self.inherited)
+
+    def __len__(self):
+        return len(set(self.overrides) | set(self.data) | self.inherited)
+
+def _parse_folder(folder):
+    """Parses the sweeps of an experiment folder in a worker process of
+    `ConfigParser.parse_sweep_tree`
+
+    Returns:
+        tuple: The folder, the list of sweeps and the error message, which is
+        None if the folder was parsed successfully
+    """
+    try:
+        return folder, ConfigParser().parse_sweeps(folder), None
+    except Exception as e:
+        return folder, [], str(e).strip() or type(e).__name__
+
 class ConfigParser():
     """ Configuration file parser for neronet configuration files
     """
@@ -101,11 +172,23 @@ class ConfigParser():
                                 % node_id)
             if 'sbatch_args' not in fields:
                 fields['sbatch_args'] = None
+            for field in ('slots', 'pack_workers'):
+                value = fields.get(field)
+                if value is not None and (isinstance(value, bool) or
+                        not isinstance(value, int) or value < 1):
+                    errors.append('%s: %s should be a positive integer' \
+                                    % (node_id, field))
+            slurm_mode = fields.get('slurm_mode', neronet.node.SlurmMode.job)
+            if not neronet.node.SlurmMode.is_member(slurm_mode):
+                errors.append('%s: invalid slurm mode "%s" for node' % \
+                                (node_id, slurm_mode))
 
             if not errors:
                 nodes[node_id] = neronet.node.Node(node_id,
                         fields['type'], fields['ssh_address'],
-                        fields['sbatch_args'])
+                        fields['sbatch_args'], slots=fields.get('slots'),
+                        slurm_mode=slurm_mode,
+                        pack_workers=fields.get('pack_workers', 1))
 
         groups = nodes_data.get('groups', {})
         for group_name, group_nodes in groups.iteritems():
@@ -136,36 +219,43 @@ class ConfigParser():
     def check_database(self, database_data):
         pass
 
-    def load_configurations(self, nodes_filename, database_filename):
-        """Loads all the configurations
+    def load_preferences(self, preferences_filename):
+        """Loads the preferences file
 
         Parameters:
-            nodes_filename (str): name of the nodes file
-            database_filename (str): name of the database file
+            preferences_filename (str): name of the preferences file
 
         Returns:
-            tuple of dicts: a tuple of node and database as dicts
+            dict: the preferences
 
         Raises:
             FormatError: if the data wasn't correctly formated
         """
-        errors = []
-        nodes = {}
-        try:
-            nodes = self.load_nodes(nodes_filename)
-        except FormatError as e:
-            errors += e.error_msgs
-        try:
-            database = self.load_database(database_filename)
-        except FormatError as e:
-            errors += e.error_msgs
-        if errors:
-            raise FormatError(errors)
-        return nodes, database
+        preferences_default = {'database': neronet.database.Backend.yaml,
+                               'transfer': neronet.node.Transfer.rsync}
+        preferences = self.load_config(preferences_filename,
+                            dict(preferences_default), self.check_preferences)
+        for field, value in preferences_default.items():
+            preferences.setdefault(field, value)
+        return preferences
 
-    def save_database(self, database_filename, database):
-        self.write_yaml(os.path.join(neronet.core.USER_DATA_DIR_ABS, \
-                        database_filename), database)
+    def check_preferences(self, preferences_data):
+        """Checks the format of the preferences
+
+        Parameters:
+            preferences_data (dict): the preferences
+
+        Raises:
+            FormatError: if the data wasn't correctly formated
+        """
+        backend = preferences_data.get('database',
+                                       neronet.database.Backend.yaml)
+        if not neronet.database.Backend.is_member(backend):
+            raise FormatError(['invalid database backend "%s"' % backend])
+        transfer = preferences_data.get('transfer',
+                                        neronet.node.Transfer.rsync)
+        if not neronet.node.Transfer.is_member(transfer):
+            raise FormatError(['invalid transfer method "%s"' % transfer])
 
     def save_nodes(self, nodes_filename, nodes):
         node_field_dict = {}
@@ -173,6 +263,12 @@ class ConfigParser():
             dct = {'type': v.ctype, 'ssh_address': v.ssh_address}
             if v.sbatch_args:
                 dct['sbatch_args'] = v.sbatch_args
+            if v.slots:
+                dct['slots'] = v.slots
+            if v.slurm_mode != neronet.node.SlurmMode.job:
+                dct['slurm_mode'] = v.slurm_mode
+            if v.pack_workers != 1:
+                dct['pack_workers'] = v.pack_workers
             node_field_dict[k] = dct
         nodes_data = {'nodes': node_field_dict,
                 'groups': nodes['groups']}
@@ -180,16 +276,50 @@ class ConfigParser():
                         nodes_filename), nodes_data)
 
     def load_yaml(self, filename):
-        """Loads yaml file"""
+        """Loads yaml file
+
+        The file is parsed with the safe (libyaml when available) loader.
+        Files written by older versions may contain Python object tags, those
+        are loaded with the full loader instead.
+        """
         with open(filename, 'r') as f:
-            data = yaml.load(f.read())
+            return self.parse_yaml(f.read())
+
+    def parse_yaml(self, text):
+        """Parses yaml text, see `load_yaml`"""
+        try:
+            data = yaml.load(text, Loader=SafeLoader)
+        except yaml.constructor.ConstructorError:
+            data = yaml.load(text, Loader=yaml.Loader)
         if not data: data = {}
         return data
 
     def write_yaml(self, filename, data):
-        """Writes a yaml file"""
+        """Writes a yaml file of plain data types"""
         with open(filename, 'w') as f:
-            f.write(yaml.dump(data, default_flow_style=False))
+            yaml.dump(data, f, Dumper=SafeDumper, default_flow_style=False)
+
+    def write_yaml_items(self, filename, data):
+        """Writes a dictionary of plain data types as a yaml file whose
+        items can be read one at a time
+
+        Each item is written as a block of its own, so the file is the same
+        mapping as written by `write_yaml` and the block of an item parses
+        to a mapping of the item alone.
+
+        Returns:
+            dict: The byte offset and length of the block of each key
+        """
+        offsets = {}
+        offset = 0
+        with open(filename, 'wb') as f:
+            for key in sorted(data):
+                block = yaml.dump({key: data[key]}, Dumper=SafeDumper,
+                                  default_flow_style=False).encode('utf-8')
+                f.write(block)
+                offsets[key] = [offset, len(block)]
+                offset += len(block)
+        return offsets
 
     def parse_experiments(self, folder):
         """ Parses the configuration file found inside the given folder and
@@ -202,6 +332,31 @@ class ConfigParser():
             experiments (dict): Dictionary containing the experiments created
             according to the configuration file in the experiment folder
 
+        Raises:
+            IOError: If the folder or configuration file doesn't
+            exists
+
+            FormatError: If the configuration file isn't in the correct format
+        """
+        return [experiment for sweep in self.parse_sweeps(folder)
+                for experiment in sweep.experiments()]
+
+    def parse_sweeps(self, folder):
+        """ Parses the configuration file found inside the given folder into
+        parameter sweeps, whose experiments are created only when needed.
+
+        The parsed sweep definitions are cached in the user data directory.
+        If neither the configuration file nor the code files of the
+        experiments have changed since, the sweeps are created from the cache
+        without parsing or validating the configuration again.
+
+        Args:
+            folder (str): The name of the experiment folder
+
+        Returns:
+            sweeps (list): The neronet.sweep.Sweep of each experiment ID
+            defined in the configuration file
+
         Raises:
             IOError: If the folder or configuration file doesn't
             exists
@@ -219,11 +374,136 @@ class ConfigParser():
         if os.stat(config_file).st_size == 0:
             raise FormatError(['empty config file'])
         
-        with open(config_file, 'r') as file:
-            data = yaml.load(file.read())
+        with open(config_file, 'rb') as file:
+            text = file.read()
+        config_stamp = [os.stat(config_file).st_mtime,
+                        hashlib.sha1(text).hexdigest()]
+        definitions = self._load_parse_cache(folder, config_stamp)
+        if definitions is not None:
+            return [neronet.sweep.Sweep(definition)
+                    for definition in definitions]
+        data = yaml.load(text, Loader=SafeLoader)
+        sweeps = self.parse_experiment_sweeps(folder, data)
+        self._write_parse_cache(folder, config_stamp,
+                                [sweep.definition for sweep in sweeps])
+        return sweeps
+
+    def find_experiment_folders(self, root):
+        """Finds the experiment folders under the given folder
+
+        Hidden folders are skipped.
+
+        Args:
+            root (str): The folder to search
+
+        Returns:
+            folders (list): The sorted paths of the folders, including root,
+            that contain a configuration file
+
+        Raises:
+            IOError: If the folder doesn't exist
+        """
+        if not os.path.isdir(root):
+            raise IOError('no such folder')
+        folders = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [name for name in dirnames
+                           if not name.startswith('.')]
+            if EXPERIMENT_CONFIG_FILENAME in filenames:
+                folders.append(dirpath)
+        return sorted(folders)
+
+    def parse_sweep_tree(self, root, processes=None):
+        """Parses the configuration files of all experiment folders under the
+        given folder in parallel, see `parse_sweeps`
+
+        A folder that can't be parsed doesn't prevent parsing the others.
+
+        Args:
+            root (str): The folder to search for experiment folders
+            processes (int): The number of worker processes. Defaults to the
+                number of CPUs.
+
+        Returns:
+            tuple: A list of (folder, sweeps) of the successfully parsed
+            folders and a dictionary of the error messages of the other
+            folders
+
+        Raises:
+            IOError: If the folder doesn't exist
+        """
+        folders = self.find_experiment_folders(root)
+        processes = min(processes or multiprocessing.cpu_count(),
+                        len(folders))
+        if processes > 1:
+            pool = multiprocessing.Pool(processes)
+            try:
+                results = pool.map(_parse_folder, folders)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_parse_folder(folder) for folder in folders]
+        parsed = []
+        errors = {}
+        for folder, sweeps, error in results:
+            if error is None:
+                parsed.append((folder, sweeps))
+            else:
+                errors[folder] = error
+        return parsed, errors
+
+    def _parse_cache_path(self, folder):
+        """Returns the path of the parse cache file of the folder"""
+        key = hashlib.sha1(os.path.abspath(folder).encode('utf-8'))
+        return os.path.join(neronet.core.USER_DATA_DIR_ABS, PARSE_CACHE_DIR,
+                            key.hexdigest() + '.json')
+
+    def _code_digests(self, folder, definitions):
+        """Returns the digests of the code files of the experiments"""
+        filenames = set()
+        for definition in definitions:
+            filenames.add(definition['main_code_file'])
+            filenames.update(definition.get('required_files') or [])
+        return dict((filename, neronet.experiment.file_digest(
+                        os.path.join(folder, filename)))
+                    for filename in filenames)
+
+    def _load_parse_cache(self, folder, config_stamp):
+        """Returns the cached sweep definitions of the folder, or None
+        if there are none or the configuration or code files have changed"""
+        try:
+            with open(self._parse_cache_path(folder), 'r') as f:
+                cache = json.load(f)
+            if cache['version'] != PARSE_CACHE_VERSION or \
+                    cache['config'] != config_stamp or \
+                    cache['code'] != self._code_digests(folder,
+                                                        cache['definitions']):
+                return None
+            return cache['definitions']
+        except Exception:
+            return None
+
+    def _write_parse_cache(self, folder, config_stamp, definitions):
+        """Caches the sweep definitions parsed from the folder
+
+        Definitions that can't be stored as JSON (e.g. parameters with YAML
+        timestamps) aren't cached.
+        """
+        path = self._parse_cache_path(folder)
+        cache = {'version': PARSE_CACHE_VERSION, 'config': config_stamp,
+                 'code': self._code_digests(folder, definitions),
+                 'definitions': definitions}
+        try:
+            text = json.dumps(cache)
+        except (TypeError, ValueError):
+            return
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path + '.tmp', 'w') as f:
+            f.write(text)
+        os.rename(path + '.tmp', path)
 
-        return self.parse_experiment_data(folder, data)
-        
     def parse_experiment_data(self, folder, data):
         """ Parses experiment configuration data to experiments
 
@@ -236,8 +516,24 @@ class ConfigParser():
         Raises:
             FormatError: If the configuration file isn't in the correct format
         """
+        return [experiment for sweep in
+                self.parse_experiment_sweeps(folder, data)
+                for experiment in sweep.experiments()]
+
+    def parse_experiment_sweeps(self, folder, data):
+        """ Parses experiment configuration data to parameter sweeps
+
+        Parameters:
+            data (dict): Experiment configuration data
+
+        Returns:
+            sweeps (list): The neronet.sweep.Sweep of each experiment ID
+            defined by the data
+        Raises:
+            FormatError: If the configuration file isn't in the correct format
+        """
         errors = []
-        experiments = []
+        sweeps = []
         definable_fields = neronet.experiment.MANDATORY_FIELDS | \
                             neronet.experiment.OPTIONAL_FIELDS
 
@@ -392,8 +688,8 @@ class ConfigParser():
                                             "folder %s" \
                                         % (exp_id, required_file, folder))
             if 'conditions' in data:
-                for condition in data['conditions']:
-                    cond_errors = self.check_condition(condition)
+                for condition in data['conditions'].values():
+                    cond_errors = self.check_conditions(condition)
                     for error in cond_errors:
                         errors.append(exp_id + ": " + error)
             #TODO: Ask Samuel
@@ -401,6 +697,18 @@ class ConfigParser():
                 pass
             if 'custom_msg' in data:
                 check_type('custom_msg', 'string')
+            if 'resources' in data:
+                if check_type('resources', 'dict'):
+                    resources = neronet.experiment.RESOURCES
+                    for resource, amount in data['resources'].items():
+                        if resource not in resources:
+                            errors.append("%s: unknown resource '%s', "
+                                    "should be one of %s" % (exp_id,
+                                    resource, ', '.join(resources)))
+                        elif isinstance(amount, bool) or \
+                                not isinstance(amount, int) or amount < 1:
+                            errors.append("%s: resource %s should be a "
+                                    "positive integer" % (exp_id, resource))
 
         def _process_data(scope):
             #Find experiment ids
@@ -416,29 +724,25 @@ class ConfigParser():
             defined_fields = set(scope) - potential_exp_ids
 
             for experiment_id in experiment_ids:
-                experiment_scope = copy.deepcopy(scope[experiment_id])
+                experiment_scope = Scope(scope[experiment_id], scope,
+                                         defined_fields)
                 experiment_id = experiment_id[1:]
-                #Turn empty experiment scope from None to a dict
-                if not experiment_scope:
-                    experiment_scope = {}
-                               
-                #Populate experiment scope with scope
-                for field in defined_fields:
-                    if field not in experiment_scope:
-                        experiment_scope[field] = copy.deepcopy(scope[field])
-                    if field == 'parameters':
-                        parameters = copy.deepcopy(scope['parameters'])
-                        if field in experiment_scope:
-                            for name, value in \
-                                    experiment_scope['parameters'].items():
-                                parameters[name] = value
-                        experiment_scope['parameters'] = parameters
-                    if field == 'outputs':
-                        if isinstance(experiment_scope['outputs'], list) and \
-                                'stdout.log' not in experiment_scope['outputs']:
-                            experiment_scope['outputs'].append('stdout.log')
-                    else:
-                        experiment_scope['outputs'] = ['stdout.log']
+
+                #Merge the parameters with the inherited ones
+                own_parameters = experiment_scope.data.get('parameters')
+                if 'parameters' in defined_fields and \
+                        isinstance(own_parameters, dict):
+                    parameters = dict(scope['parameters'])
+                    parameters.update(own_parameters)
+                    experiment_scope.overrides['parameters'] = parameters
+                #Every experiment outputs stdout.log
+                outputs = experiment_scope.get('outputs')
+                if outputs is None:
+                    experiment_scope.overrides['outputs'] = ['stdout.log']
+                elif isinstance(outputs, list) and \
+                        'stdout.log' not in outputs:
+                    experiment_scope.overrides['outputs'] = \
+                        outputs + ['stdout.log']
 
                 #Create experiment data dict
                 experiment_data = {field: value for field, value in \
@@ -451,38 +755,24 @@ class ConfigParser():
                 
                 #Create the experiments if there hasn't been any errors
                 if not errors:
-                    params = []
-                    if 'parameters' in experiment_data:
-                        params = self._param_combinations( \
-                                    experiment_data['parameters'])
                     if 'conditions' in experiment_data:
                         conditions = {}
-                        for condition_name in experiment_data[field]:
-                            condition = experiment_data['conditions'][condition_name]
+                        for condition_name in experiment_data['conditions']:
+                            condition = dict(experiment_data['conditions'][condition_name])
                             condition['name'] = condition_name
                             condition['killvalue'] = float(condition['killvalue'])
-                            conditions[condition_name] = \
-                                    neronet.experiment.ExperimentWarning(**condition)
-                            experiment_data['conditions'] = conditions
+                            conditions[condition_name] = condition
+                        experiment_data['conditions'] = conditions
 
                     experiment_data['path'] = os.path.abspath(folder)
-                    for param in params:
-                        experiment_data['parameters'] = param
-                        if len(params) > 1:
-                            keys = sorted(param)
-                            param_strings = [key + '-' + \
-                                            str(param[key]) for key in keys]
-                            name = '_'.join([experiment_id] + param_strings)
-                            experiment_data['experiment_id'] = name
-                        experiments.append( \
-                            neronet.experiment.Experiment(**experiment_data))
+                    sweeps.append(neronet.sweep.Sweep(experiment_data))
                 _process_data(experiment_scope) 
-        _process_data(data)
+        _process_data(Scope(data))
  
         if errors:
             raise FormatError(errors)
-        if experiments:
-            return experiments
+        if any(len(sweep) for sweep in sweeps):
+            return sweeps
         else:
             raise FormatError(['no experiments defined in config file'])
 
@@ -503,30 +793,3 @@ class ConfigParser():
                     err.append("Invalid syntax at experiment warning 'killvalue' attribute")
         return err
             
-
-    def _param_combinations(self,params):
-        """ A helper function to create all combinatorial subsets of the value
-        lists
-
-        Args:
-            params (dict): dictionary containing the variable names as keys and the
-            values as single value or lists. Single values will be converted to lists.
-
-        Return:
-            param_combinations (list of dicts): List of all combinatorial
-            subsets as dicts of the keys (variable names).
-
-        """
-        values = params.values()
-        
-        #Horrific, type checking!
-        values = [value if isinstance(value, list) else [value] \
-                        for value in values]
-        keys = params.keys()
-        #Creates all the combinatorial subsets
-        value_combinations = list(itertools.product(*values))
-        
-        #Maps the values to the keys
-        param_combinations = [dict(zip(keys, values)) \
-                                for values in value_combinations]
-        return param_combinations
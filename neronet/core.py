@@ -6,10 +6,18 @@
 import os
 import sys
 import datetime
+import hashlib
 import subprocess
 import shlex
 import importlib
 import traceback
+import time
+import threading
+
+try:
+    reload
+except NameError:
+    from importlib import reload
 
 TIME_OUT = 5.0
 """float: how long the socket waits before failing when sending data
@@ -17,9 +25,65 @@ TIME_OUT = 5.0
 NERONET_DIR_NAME = '.neronet'
 USER_DATA_DIR = '~/' + NERONET_DIR_NAME # Remember to os.path.expanduser
 USER_DATA_DIR_ABS = os.path.expanduser(USER_DATA_DIR)
+NERONET_ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+"""str: The folder of the neronet package, resolved at import as __file__
+may be relative to the working directory
+"""
 
 class Runresult: """A class for holding shell command execution results."""
 
+RUNTIME_DIGEST_FILENAME = '.runtime_digest'
+"""str: The file in the neronet package folder of a node holding the digest
+of the installed runtime, see `runtime_digest`
+"""
+
+BLOBS_DIR_NAME = 'blobs'
+"""str: The folder in the user data folder of a node holding the files of the
+submitted experiments named by their SHA-1 digests
+"""
+
+MANIFEST_FILENAME = 'manifest.json'
+"""str: The file in a submitted experiment folder mapping the paths of the
+experiment files to the digests of their blobs
+"""
+
+_runtime_digest = (None, None)
+"""tuple: The file stamps and the digest last computed by `runtime_digest`
+"""
+
+def runtime_digest():
+    """Returns a hash of the source files of the neronet package
+
+    The hash identifies the runtime installed on a node, so that it's
+    uploaded only when it differs from the local one. It's recomputed only if
+    the modification time or size of some file has changed.
+
+    Returns:
+        str: The hex digest
+    """
+    global _runtime_digest
+    root = NERONET_ROOT_DIR
+    stamps = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(name for name in dirnames
+                             if not name.startswith(('.', '__pycache__')))
+        for filename in sorted(filenames):
+            if filename.endswith(('.pyc', '.pyo')) or \
+                    filename.startswith('.'):
+                continue
+            path = os.path.join(dirpath, filename)
+            stat = os.stat(path)
+            stamps.append((os.path.relpath(path, root), stat.st_mtime,
+                           stat.st_size))
+    if _runtime_digest[0] != stamps:
+        digest = hashlib.sha1()
+        for relpath, mtime, size in stamps:
+            digest.update(relpath.encode('utf-8') + b'\0')
+            with open(os.path.join(root, relpath), 'rb') as f:
+                digest.update(hashlib.sha1(f.read()).digest())
+        _runtime_digest = (stamps, digest.hexdigest())
+    return _runtime_digest[1]
+
 def remove_data():
     """Removes the neronet data files
     """
@@ -55,6 +119,72 @@ def osrun(cmd):
     return res
 
 
+class OperationTimeout(RuntimeError):
+    """Raised when an operation run by `parallel_map` doesn't finish in time
+    """
+
+def parallel_map(func, items, workers=8, timeout=None):
+    """Calls the function with each item in a bounded pool of threads
+
+    At most `workers` calls run at the same time. A call still running
+    `timeout` seconds after it started is abandoned: it's reported as timed
+    out and no longer counts towards the limit, so one unresponsive node
+    doesn't hold up the others. The abandoned call keeps running in the
+    background and its result is discarded.
+
+    Args:
+        func (function): The function to call
+        items (list): The arguments of the calls
+        workers (int): The maximum number of calls running at a time
+        timeout (float): The time limit of each call in seconds, or None
+
+    Returns:
+        list: A (result, error) tuple for each item in order. The error is
+        the exception raised by the call, OperationTimeout if the call timed
+        out, or None if it returned normally.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    waiting = list(range(len(items)))
+    waiting.reverse()
+    running = {}
+    condition = threading.Condition()
+
+    def call(index):
+        try:
+            result = (func(items[index]), None)
+        except Exception as err:
+            result = (None, err)
+        with condition:
+            if index in running:
+                del running[index]
+                results[index] = result
+            condition.notify()
+
+    with condition:
+        while waiting or running:
+            while waiting and len(running) < workers:
+                index = waiting.pop()
+                running[index] = time.time()
+                thread = threading.Thread(target=call, args=(index,))
+                thread.daemon = True
+                thread.start()
+            wait_time = None
+            if timeout is not None:
+                now = time.time()
+                for index, start_time in list(running.items()):
+                    if now - start_time >= timeout:
+                        del running[index]
+                        results[index] = (None, OperationTimeout(
+                            '%s timed out after %s seconds' %
+                            (items[index], timeout)))
+                if running:
+                    wait_time = max(0.0, min(running.values()) + timeout -
+                                         now)
+            if running:
+                condition.wait(wait_time)
+    return results
+
 def get_hostname():
     return osrun('hostname').out.strip()
 
@@ -91,7 +221,97 @@ def lod_to_dol(self, lod):
                 key[dol].appen(value)
     return dol
 
-#IMPORTANT: This function shouldn't be used if the module cannot be imported
+IMPORT_RETRY_INTERVAL = 5.0
+"""float: Seconds after which an import that failed before a module file was
+found is retried
+"""
+
+_resolved_modules = {}
+
+def _module_file(module):
+    """Returns the path of the source file of the module, if any"""
+    path = getattr(module, '__file__', None)
+    if path and path.endswith(('.pyc', '.pyo')) and os.path.exists(path[:-1]):
+        path = path[:-1]
+    return path
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except (OSError, TypeError):
+        return None
+
+def _resolve_module(module_name):
+    """Imports a module, trying to first find it from neronet/scripts and
+    then from the python path
+
+    The results, including failures, are cached by the module name. A cached
+    result is discarded when the modification time of the module file
+    changes, in which case the module is reloaded. Failures that happened
+    before a module file was found are retried after IMPORT_RETRY_INTERVAL
+    seconds.
+
+    Returns:
+        tuple: The module (None on failure) and the error message (None on
+            success)
+    """
+    cached = _resolved_modules.get(module_name)
+    if cached:
+        module, error, path, stamp = cached
+        if path is not None and _mtime(path) == stamp:
+            return module, error
+        if path is None and time.time() - stamp < IMPORT_RETRY_INTERVAL:
+            return module, error
+    error = None
+    if cached and cached[0] is not None and \
+            sys.modules.get(cached[0].__name__) is cached[0]:
+        module = cached[0]
+        try:
+            reload(module)
+        except Exception:
+            error = traceback.format_exc()
+    else:
+        module = None
+        try:
+            module = importlib.import_module("neronet.scripts." + module_name)
+        except ImportError:
+            # Only a module missing from neronet/scripts is looked up from
+            # the python path
+            errors = [traceback.format_exc()]
+            try:
+                module = importlib.import_module(module_name)
+            except Exception:
+                errors.append(traceback.format_exc())
+                error = '\n'.join(errors)
+        except Exception:
+            error = traceback.format_exc()
+    path = _module_file(module)
+    _resolved_modules[module_name] = (module, error, path,
+                                      _mtime(path) if path else time.time())
+    return module, error
+
+def resolve_import(module_name, obj_name):
+    """Resolves an object of a module, trying to first find the module from
+    neronet/scripts and then from the python path
+
+    The module is imported and cached by `_resolve_module`.
+
+    Parameters:
+        module_name (str): name of the module to be imported from
+        obj_name (str): name of the object to be imported
+
+    Returns:
+        tuple: The object (None on failure) and the error message (None on
+            success)
+    """
+    module, error = _resolve_module(module_name)
+    if error:
+        return None, error
+    try:
+        return getattr(module, obj_name), None
+    except AttributeError:
+        return None, traceback.format_exc()
+
 def import_from(module_name, obj_name):
     """Import object from module, tries to first find module from
     neronet/scripts
@@ -106,15 +326,12 @@ def import_from(module_name, obj_name):
     Raises:
         ImportError: If the module to be imported couldn't be imported
     """
-    #FIXME: Remove dependancy for neronet.scripts.
-    try:
-        module = importlib.import_module("neronet.scripts." + module_name)
-        obj = getattr(module, obj_name)
-        return obj
-    except:
+    obj, error = resolve_import(module_name, obj_name)
+    if error:
         raise ImportError("Something went wrong while trying to "
                         "import %s from %s:\n" % (obj_name, module_name) + \
-                            traceback.format_exc())
+                            error)
+    return obj
 
 def can_import(module_name, obj_name):
     """Checks if object can be imported from module or if the module exists
@@ -126,13 +343,29 @@ def can_import(module_name, obj_name):
     Returns:
         boolean: True if the object can be imported
     """
-    #FIXME: Remove dependancy for neronet.scripts.
-    try:
-        module = importlib.import_module("neronet.scripts." + module_name)
-        obj = getattr(module, obj_name)
-    except:
-        return False
-    return True
+    return resolve_import(module_name, obj_name)[1] is None
+
+PLOT_BACKEND = 'Agg'
+"""str: The matplotlib backend used for plotting. The plots are saved to files
+so a backend that doesn't need a display is used.
+"""
+
+def import_pyplot():
+    """Imports matplotlib.pyplot using PLOT_BACKEND
+
+    Plotting functions should call this when they plot instead of importing
+    pyplot at the module level, so that importing their modules, e.g. to
+    check the output processors of an experiment, doesn't load matplotlib.
+    The backend isn't changed if pyplot has already been imported.
+
+    Returns:
+        module: matplotlib.pyplot
+    """
+    if 'matplotlib.pyplot' not in sys.modules:
+        import matplotlib
+        matplotlib.use(PLOT_BACKEND)
+    import matplotlib.pyplot
+    return sys.modules['matplotlib.pyplot']
 
 def create_config_template(expid='exp_id', runcmdprefix='python', maincodefile='main.py', *params):
     # Creates a config file with the required fields.
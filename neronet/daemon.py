@@ -15,12 +15,37 @@ import pickle
 import re
 import datetime
 import shutil
+import struct
 #import threading
 
 import neronet.core
 
 TIMEOUT = 3.0
 
+FRAME_HEADER = struct.Struct('!I')
+"""Struct: The header of a frame of the bridge protocol, the length of the
+pickled data that follows it"""
+
+def write_frame(stream, data):
+  """Writes the data as a frame of the bridge protocol to a binary stream."""
+  byts = pickle.dumps(data, -1)
+  stream.write(FRAME_HEADER.pack(len(byts)) + byts)
+  stream.flush()
+
+def read_frame(stream):
+  """Reads a frame of the bridge protocol from a binary stream.
+
+  Returns:
+    The data of the frame or None if the stream has ended."""
+  header = stream.read(FRAME_HEADER.size)
+  if len(header) < FRAME_HEADER.size:
+    return None
+  length, = FRAME_HEADER.unpack(header)
+  byts = stream.read(length)
+  if len(byts) < length:
+    return None
+  return pickle.loads(byts)
+
 class Query():
   """A daemon query class."""
 
@@ -182,7 +207,7 @@ class Daemon(object):
 
         # Decouple from parent environment and make sure we have a clean
         # daemon directory to store log output etc.
-        os.umask(0027)
+        os.umask(0o027)
         if os.path.exists(self._pdir):
             # Clean up any daemon related files and wait for any possible
             # existing deamon to notice the cleanup and exit and then cleanup
@@ -284,7 +309,7 @@ class Daemon(object):
     def _handle(self, conn):
         self.log('Handle %s...' % (str(conn.getsockname())))
         conn.settimeout(self._tdo/6)
-        result = ''
+        result = b''
         try:
             while True:
                 self.log('Receiving data...')
@@ -309,8 +334,12 @@ class Daemon(object):
             else:
                 self._reply['msgbody'] = 'Unsupported query "%s"!' % (name)
         self.log('Sending the reply %s...' % (self._reply))
-        # Send the reply to the connected socket
-        conn.sendall(pickle.dumps(self._reply, -1))
+        # Send the reply to the connected socket and close the connection,
+        # which tells the client that the reply is complete
+        try:
+            conn.sendall(pickle.dumps(self._reply, -1))
+        finally:
+            conn.close()
 
     def qry_uptime(self):
         self._reply['rv'] = 0
@@ -396,13 +425,25 @@ class QueryInterface(object):
                 data = {'name': name, 'args': pargs, 'kwargs': kwargs}
                 #self.inf('Sending data...')
                 sckt.sendall(pickle.dumps(data, -1))
+                # Signal the end of the query so that the daemon doesn't wait
+                # for more data
+                sckt.shutdown(socket.SHUT_WR)
                 #self.inf('Listening for a reply...')
+                byts = b''
+                try:
+                    while True:
+                        chunk = sckt.recv(4096)
+                        if not chunk:
+                            break
+                        byts += chunk
+                except socket.timeout:
+                    # Use the reply if it arrived in full
+                    pass
                 try:
-                    byts = sckt.recv(4096)
                     data = pickle.loads(byts) if byts else None
                     #self.inf('Received reply: %s' % (data))
-                except socket.timeout:
-                    #self.inf('No reply received!')
+                except Exception:
+                    #self.inf('No complete reply received!')
                     data = None
                 #self.inf('Closing socket.')
                 sckt.close()
@@ -484,7 +525,8 @@ class Cli(QueryInterface):
             'stop': self.func_stop,
             'restart': self.func_restart,
             'query': self.func_query,
-            'input': self.func_input
+            'input': self.func_input,
+            'bridge': self.func_bridge
         }
 
     def parse_arguments(self, cli_args=None):
@@ -578,3 +620,44 @@ class Cli(QueryInterface):
         except self.NoPortFileError:
             reply = {'rv': 1, 'msgbody': 'No port file!'}
         #print('Reply %s' % (reply))
+
+    def func_bridge(self):
+        """Forward queries framed on stdin to the daemon until stdin ends."""
+        outstream = getattr(sys.stdout, 'buffer', sys.stdout)
+        # Keep any printed messages out of the replies
+        sys.stdout = sys.stderr
+        self.bridge(getattr(sys.stdin, 'buffer', sys.stdin), outstream)
+
+    def bridge(self, instream, outstream):
+        """Forward queries from a stream to the daemon.
+
+        Each query is read as a frame (see `read_frame`) holding a dict with
+        the query name and optionally its arguments, and the reply of the
+        daemon is written as a frame to the output stream. A reply is written
+        for every query, also when the daemon can't be reached.
+
+        The bridge keeps the SSH connection open; each query still makes
+        its own local connection to the daemon. The daemon handles one
+        connection at a time between its timeouts, so a connection held
+        open by the bridge would stall the kids and the periodic work of
+        the daemon for as long as Neroman keeps the bridge open. A local
+        connection costs far less than the SSH connection it replaces.
+
+        Args:
+            instream (file): The binary stream to read the queries from
+            outstream (file): The binary stream to write the replies to
+        """
+        while True:
+            data = read_frame(instream)
+            if data is None:
+                break
+            try:
+                reply = self.query(data['name'], *data.get('args', ()),
+                                   **data.get('kwargs', {}))
+            except self.NoPortFileError:
+                reply = {'rv': 1, 'msgbody': 'No port file!'}
+            except Exception as err:
+                reply = {'rv': 1, 'msgbody': str(err)}
+            if reply is None:
+                reply = {'rv': 1, 'msgbody': 'No reply received!'}
+            write_frame(outstream, reply)
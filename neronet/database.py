@@ -0,0 +1,886 @@
+# -*- coding: utf-8 -*-
+"""This module defines the experiment databases used by Neroman.
+
+Two backends are available:
+
+* yaml: The experiments are persisted as a snapshot file (``default.yaml``)
+  and an append-only journal of changes made since the snapshot was written.
+  A mutation only appends a record to the journal, so persisting it costs
+  O(1) instead of rewriting the whole database. When the journal grows large
+  it is compacted into a new snapshot.
+* sqlite: The experiments are stored in an SQLite database
+  (``default.sqlite``) with indexed columns for the state, node, collection
+  and modification time of each experiment, so that queries such as "all
+  running experiments on node X" are index lookups.
+
+Both backends can also store parameter sweeps (see neronet.sweep) whose
+experiments are virtual: they are listed by the database but created and
+stored only when first accessed, e.g. when submitted or inspected.
+
+Attributes:
+    JOURNAL_SUFFIX (str): The suffix of the journal file name
+    INDEX_SUFFIX (str): The suffix of the snapshot index file name
+    SWEEPS_SUFFIX (str): The suffix of the sweeps file name
+    COMPACT_MIN_RECORDS (int): The minimum number of journal records before
+        the journal is compacted into the snapshot
+"""
+
+import os
+import json
+import pickle
+import sqlite3
+import collections
+import itertools
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+import neronet.core
+import neronet.experiment
+import neronet.scheduler
+import neronet.sweep
+
+JOURNAL_SUFFIX = '.journal'
+SWEEPS_SUFFIX = '.sweeps'
+INDEX_SUFFIX = '.index'
+COMPACT_MIN_RECORDS = 1000
+
+class Backend:
+    """A simple class to represent the possible database backends"""
+    yaml = 'yaml'
+    sqlite = 'sqlite'
+    _members = set(['yaml', 'sqlite'])
+
+    @classmethod
+    def is_member(cls, arg):
+        return arg in cls._members
+
+Summary = collections.namedtuple('Summary',
+        ['id', 'state', 'node_id', 'collection', 'warnings', 'fingerprint',
+         'demand'])
+"""namedtuple: The cheap to load key and state summary of an experiment. The
+demand is the neronet.scheduler.Demand of the experiment."""
+
+def summarize(experiment):
+    """Returns the summary of the experiment"""
+    return Summary(experiment.id, experiment.state, experiment.node_id,
+                   _as_list(experiment.collection),
+                   bool(experiment.get_warnings()), experiment.fingerprint,
+                   neronet.scheduler.demand(experiment))
+
+def summarize_record(record):
+    """Returns the summary of the experiment record"""
+    return Summary(record['experiment_id'], record['states_info'][-1][0],
+                   record['node_id'], _as_list(record['collection']),
+                   bool(record['warnings']), record.get('fingerprint'),
+                   neronet.scheduler.demand_of(record.get('resources')))
+
+def _load_summary(fields):
+    """Returns the summary of the fields read from JSON
+
+    Raises:
+        TypeError: If the fields are of a summary written by an older
+            version
+    """
+    summary = Summary(*fields)
+    return summary._replace(demand=neronet.scheduler.Demand(*summary.demand))
+
+class Database(MutableMapping):
+    """A dictionary of experiments by experiment ID.
+
+    Changes made with item assignment and deletion are tracked
+    automatically. Experiments modified in place must be marked with
+    `touch`. The tracked changes are persisted with `save`.
+
+    The experiment keys and summaries are available without loading the
+    experiments themselves, which are materialized only when accessed.
+    Subclasses implement the storage and may override the query methods
+    with faster ones.
+
+    The experiments of the sweeps added with `add_sweep` are virtual until
+    stored. Reading a virtual experiment returns a transient experiment
+    created from its sweep; changes to it are stored by assigning it back to
+    the database, which takes it out of the sweep. Subclasses store the sweep
+    records and include the virtual experiments in their mapping methods
+    with the helpers below.
+    """
+
+    _sweeps = None
+
+    def touch(self, exp_id):
+        """Marks an experiment modified in place as changed
+
+        Transient virtual experiments aren't stored by touching them; assign
+        them to the database instead.
+        """
+        raise NotImplementedError()
+
+    def save(self):
+        """Persists the tracked changes"""
+        raise NotImplementedError()
+
+    def _read_sweeps(self):
+        """Returns the stored sweep records"""
+        raise NotImplementedError()
+
+    def _write_sweeps(self, records, deleted):
+        """Stores the changed sweep records and removes the deleted ones"""
+        raise NotImplementedError()
+
+    def sweeps(self):
+        """Returns the stored sweeps by ID"""
+        if self._sweeps is None:
+            self._sweeps = dict((record['definition']['experiment_id'],
+                                 neronet.sweep.Sweep.from_record(record))
+                                for record in self._read_sweeps())
+            self._changed_sweeps = set()
+        return self._sweeps
+
+    def add_sweep(self, sweep):
+        """Adds a sweep whose experiments are created only when accessed
+
+        A sweep with the same ID is replaced. Its experiments that have been
+        created or deleted stay so in the new sweep.
+        """
+        old_sweep = self.sweeps().get(sweep.id)
+        if old_sweep:
+            for index in old_sweep.taken:
+                new_index = sweep.index(old_sweep[index]['experiment_id'])
+                if new_index is not None:
+                    sweep.taken.add(new_index)
+        self._sweeps[sweep.id] = sweep
+        self._changed_sweeps.add(sweep.id)
+
+    def _save_sweeps(self):
+        """Stores the sweeps changed since the last call"""
+        if self._sweeps is None or not self._changed_sweeps:
+            return
+        self._write_sweeps([self._sweeps[sweep_id].to_record() for sweep_id
+                            in self._changed_sweeps
+                            if sweep_id in self._sweeps],
+                           [sweep_id for sweep_id in self._changed_sweeps
+                            if sweep_id not in self._sweeps])
+        self._changed_sweeps = set()
+
+    def _find_virtual(self, exp_id):
+        """Returns the (sweep, number) of the virtual experiment with the
+        given ID, or None if there is no such experiment"""
+        for sweep in self.sweeps().values():
+            index = sweep.index(exp_id)
+            if index is not None and index not in sweep.taken:
+                return sweep, index
+        return None
+
+    def _take_virtual(self, exp_id):
+        """Removes the experiment from the virtual experiments
+
+        Returns:
+            tuple: The (sweep, number) of the experiment
+
+        Raises:
+            KeyError: if there is no such virtual experiment
+        """
+        virtual = self._find_virtual(exp_id)
+        if virtual is None:
+            raise KeyError(exp_id)
+        sweep, index = virtual
+        sweep.taken.add(index)
+        self._changed_sweeps.add(sweep.id)
+        return virtual
+
+    def _virtual_experiment(self, exp_id):
+        """Creates a transient experiment for the virtual experiment with
+        the given ID
+
+        Raises:
+            KeyError: if there is no such virtual experiment
+        """
+        virtual = self._find_virtual(exp_id)
+        if virtual is None:
+            raise KeyError(exp_id)
+        sweep, index = virtual
+        return sweep.experiment(index)
+
+    def _store_virtual(self, exp_id):
+        """Takes the experiment out of its sweep if it's virtual, so that it
+        can be stored"""
+        if self._find_virtual(exp_id) is not None:
+            self._take_virtual(exp_id)
+
+    def _virtual_ids(self):
+        """Generates the IDs of the virtual experiments"""
+        for sweep in list(self.sweeps().values()):
+            for index, exp_id in sweep.ids():
+                if index not in sweep.taken:
+                    yield exp_id
+
+    def _virtual_count(self):
+        return sum(len(sweep) - len(sweep.taken)
+                   for sweep in self.sweeps().values())
+
+    def _virtual_summary(self, sweep, exp_id):
+        """Returns the summary of a virtual experiment of the sweep"""
+        return Summary(exp_id, neronet.experiment.Experiment.State.defined,
+                       None, sweep.collection, False, None,
+                       neronet.scheduler.demand_of(
+                           sweep.definition.get('resources')))
+
+    def _virtual_summaries(self):
+        """Returns the summaries of the virtual experiments"""
+        summaries = []
+        for sweep in self.sweeps().values():
+            for index, exp_id in sweep.ids():
+                if index not in sweep.taken:
+                    summaries.append(self._virtual_summary(sweep, exp_id))
+        return summaries
+
+    def _find_virtual_experiments(self, state=None, node_id=None,
+                                  collection=None):
+        """Returns transient experiments for the virtual experiments matching
+        all the given criteria, see `find`
+
+        Virtual experiments are always defined and on no node, so the sweeps
+        are skipped for other queries without looking at their experiments.
+        """
+        if node_id is not None or state not in (None,
+                neronet.experiment.Experiment.State.defined):
+            return []
+        experiments = []
+        for sweep in self.sweeps().values():
+            if collection is not None and collection not in sweep.collection:
+                continue
+            experiments += [sweep.experiment(index) for index in
+                            range(len(sweep)) if index not in sweep.taken]
+        return experiments
+
+    def summary(self, exp_id):
+        """Returns the summary of the experiment, or None if there is no
+        experiment with the given ID"""
+        virtual = self._find_virtual(exp_id)
+        if virtual is not None:
+            return self._virtual_summary(virtual[0], exp_id)
+        if exp_id not in self:
+            return None
+        return summarize(self[exp_id])
+
+    def summaries(self, virtual=True):
+        """Returns the summaries of all the experiments
+
+        Parameters:
+            virtual (bool): Whether to include the virtual experiments
+
+        Returns:
+            list: The Summary of each experiment
+        """
+        return [self.summary(exp_id) for exp_id in self
+                if virtual or self._find_virtual(exp_id) is None]
+
+    def find(self, state=None, node_id=None, collection=None):
+        """Finds the experiments matching all the given criteria
+
+        Only the matching experiments are loaded. The virtual experiments
+        are returned as transient experiments.
+
+        Parameters:
+            state (str): The state of the experiments
+            node_id (str): The ID of the node the experiments are on
+            collection (str): A collection the experiments are part of
+
+        Returns:
+            list: The matching experiments
+        """
+        return [self[summary.id] for summary in self.summaries(virtual=False)
+                if (state is None or summary.state == state) and
+                (node_id is None or summary.node_id == node_id) and
+                (collection is None or collection in summary.collection)] + \
+            self._find_virtual_experiments(state, node_id, collection)
+
+    def submitted(self):
+        """Returns the experiments that have been submitted to some node"""
+        return [self[summary.id] for summary in self.summaries(virtual=False)
+                if summary.node_id != None]
+
+class JournalDatabase(Database):
+    """An experiment database backed by a YAML snapshot and a journal.
+
+    The experiments are stored as records (see `Experiment.to_record`): the
+    snapshot maps experiment IDs to records and the journal holds one JSON
+    line per change. The summaries of the snapshot experiments are kept in
+    an index file next to the snapshot, and each journal line carries the
+    summary of the experiment along with its record. Opening the database
+    thus reads only the index and the journal. The index also holds the
+    byte range of each record in the snapshot, so accessing an experiment
+    parses only its own record. Snapshots without the byte ranges, e.g.
+    edited by hand, are parsed whole when one of their experiments is first
+    accessed.
+
+    Attributes:
+        filename (str): Name of the snapshot file in the user data directory
+        config_parser (ConfigParser): The parser used to read and write the
+            snapshot
+    """
+
+    class Op:
+        """The journal record operations"""
+        set = 'set'
+        delete = 'del'
+
+    def __init__(self, filename, config_parser):
+        """Initializes the database from the snapshot index and the journal
+
+        Parameters:
+            filename (str): Name of the snapshot file
+            config_parser (ConfigParser): The parser used to read and write
+                the snapshot
+        """
+        self.filename = filename
+        self.config_parser = config_parser
+        self._summaries = {}
+        self._offsets = {}
+        self._records = {}
+        self._experiments = {}
+        self._snapshot_loaded = False
+        self._dirty = set()
+        self._load_index()
+        self._journal_count = self._replay()
+
+    def _read_sweeps(self):
+        if not os.path.exists(self.sweeps_path):
+            return []
+        with open(self.sweeps_path, 'r') as f:
+            return json.load(f)
+
+    def _write_sweeps(self, records, deleted):
+        stored = collections.OrderedDict(
+                (record['definition']['experiment_id'], record)
+                for record in self._read_sweeps())
+        for record in records:
+            stored[record['definition']['experiment_id']] = record
+        for sweep_id in deleted:
+            stored.pop(sweep_id, None)
+        tmp_path = self.sweeps_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(list(stored.values()), f, default=str)
+        os.rename(tmp_path, self.sweeps_path)
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(neronet.core.USER_DATA_DIR_ABS, self.filename)
+
+    @property
+    def journal_path(self):
+        return self.snapshot_path + JOURNAL_SUFFIX
+
+    @property
+    def index_path(self):
+        return self.snapshot_path + INDEX_SUFFIX
+
+    @property
+    def sweeps_path(self):
+        return self.snapshot_path + SWEEPS_SUFFIX
+
+    def _snapshot_stamp(self):
+        """Returns the size and modification time of the snapshot"""
+        stat = os.stat(self.snapshot_path)
+        return [stat.st_size, stat.st_mtime]
+
+    def _load_index(self):
+        """Loads the summaries of the snapshot experiments
+
+        If the index is missing or out of date (e.g. the snapshot was edited
+        by hand) the snapshot is loaded and the index is rebuilt.
+        """
+        if not os.path.exists(self.snapshot_path):
+            self._snapshot_loaded = True
+            return
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            if index['snapshot'] == self._snapshot_stamp():
+                for summary in index['summaries']:
+                    summary = _load_summary(summary)
+                    self._summaries[summary.id] = summary
+                self._offsets = index.get('offsets', {})
+                return
+        except Exception:
+            pass
+        self._offsets = {}
+        self._load_snapshot()
+        self._write_index()
+
+    def _write_index(self):
+        """Writes the summaries and the byte ranges of the records of the
+        snapshot experiments to the index"""
+        index = {'snapshot': self._snapshot_stamp(),
+                 'summaries': list(self._summaries.values()),
+                 'offsets': self._offsets}
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.rename(tmp_path, self.index_path)
+
+    def _load_snapshot(self):
+        """Parses the snapshot and adds the records of the experiments that
+        haven't been replaced or deleted since
+
+        Snapshots written by older versions contain experiment objects
+        instead of records.
+        """
+        snapshot = self.config_parser.load_database(self.filename)
+        for exp_id, record in snapshot.items():
+            is_record = isinstance(record, dict)
+            if not self._snapshot_loaded:
+                self._summaries.setdefault(exp_id, summarize_record(record)
+                        if is_record else summarize(record))
+            if exp_id in self._summaries and exp_id not in self._records \
+                    and exp_id not in self._experiments:
+                if is_record:
+                    self._records[exp_id] = record
+                else:
+                    self._experiments[exp_id] = record
+        self._snapshot_loaded = True
+
+    def _read_record(self, exp_id):
+        """Reads the record of a snapshot experiment from its byte range"""
+        offset, length = self._offsets[exp_id]
+        with open(self.snapshot_path, 'rb') as f:
+            f.seek(offset)
+            block = f.read(length).decode('utf-8')
+        return self.config_parser.parse_yaml(block)[exp_id]
+
+    def _replay(self):
+        """Applies the journal lines to the summaries
+
+        A partially written line at the end of the journal (e.g. due to a
+        crash during `save`) is discarded. A journal of pickles written by an
+        older version is applied and compacted into the snapshot.
+
+        Returns:
+            int: The number of lines in the journal
+        """
+        if not os.path.exists(self.journal_path):
+            return 0
+        with open(self.journal_path, 'rb') as f:
+            if f.read(1) == b'\x80':
+                f.seek(0)
+                self._replay_pickles(f)
+                self.compact()
+                return 0
+        count = 0
+        offset = 0
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('Incomplete journal line')
+                    entry = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    # A torn line at the tail, truncated below
+                    break
+                exp_id = entry['id']
+                self._experiments.pop(exp_id, None)
+                if entry['op'] == JournalDatabase.Op.set:
+                    try:
+                        self._summaries[exp_id] = \
+                            _load_summary(entry['summary'])
+                    except TypeError:
+                        self._summaries[exp_id] = \
+                            summarize_record(entry['record'])
+                    self._records[exp_id] = entry['record']
+                else:
+                    self._summaries.pop(exp_id, None)
+                    self._records.pop(exp_id, None)
+                offset += len(line)
+                count += 1
+        if offset != os.path.getsize(self.journal_path):
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(offset)
+        return count
+
+    def _replay_pickles(self, f):
+        """Applies a journal of pickled (op, exp_id, ...) records"""
+        while True:
+            try:
+                record = pickle.load(f)
+            except Exception:
+                break
+            op, exp_id = record[:2]
+            self._records.pop(exp_id, None)
+            self._experiments.pop(exp_id, None)
+            if op == JournalDatabase.Op.set:
+                experiment = record[-1]
+                if not isinstance(experiment, neronet.experiment.Experiment):
+                    experiment = pickle.loads(experiment)
+                self._experiments[exp_id] = experiment
+                self._summaries[exp_id] = summarize(experiment)
+            else:
+                self._summaries.pop(exp_id, None)
+
+    def __getitem__(self, exp_id):
+        if exp_id not in self._experiments:
+            if exp_id not in self._summaries:
+                return self._virtual_experiment(exp_id)
+            if exp_id not in self._records and not self._snapshot_loaded:
+                if exp_id in self._offsets:
+                    self._records[exp_id] = self._read_record(exp_id)
+                else:
+                    self._load_snapshot()
+            if exp_id in self._records:
+                self._experiments[exp_id] = \
+                    neronet.experiment.Experiment.from_record(
+                        self._records.pop(exp_id))
+        return self._experiments[exp_id]
+
+    def __setitem__(self, exp_id, experiment):
+        if exp_id not in self._summaries:
+            self._store_virtual(exp_id)
+        self._experiments[exp_id] = experiment
+        self._summaries[exp_id] = summarize(experiment)
+        self._records.pop(exp_id, None)
+        self._dirty.add(exp_id)
+
+    def __delitem__(self, exp_id):
+        if exp_id not in self._summaries:
+            self._take_virtual(exp_id)
+            return
+        del self._summaries[exp_id]
+        self._experiments.pop(exp_id, None)
+        self._records.pop(exp_id, None)
+        self._dirty.add(exp_id)
+
+    def __iter__(self):
+        return itertools.chain(list(self._summaries), self._virtual_ids())
+
+    def __len__(self):
+        return len(self._summaries) + self._virtual_count()
+
+    def __contains__(self, exp_id):
+        return exp_id in self._summaries or \
+            self._find_virtual(exp_id) is not None
+
+    def touch(self, exp_id):
+        if exp_id in self._experiments:
+            self._summaries[exp_id] = summarize(self._experiments[exp_id])
+            self._dirty.add(exp_id)
+
+    def summary(self, exp_id):
+        if exp_id in self._summaries:
+            return self._summaries[exp_id]
+        return Database.summary(self, exp_id)
+
+    def summaries(self, virtual=True):
+        summaries = list(self._summaries.values())
+        if virtual:
+            summaries += self._virtual_summaries()
+        return summaries
+
+    def save(self):
+        """Persists the tracked changes by appending them to the journal
+
+        The journal is compacted into the snapshot once it holds more lines
+        than there are experiments (and at least `COMPACT_MIN_RECORDS`), so
+        the cost of the rewrite is amortized over the appended lines.
+        """
+        if not self._dirty:
+            self._save_sweeps()
+            return
+        lines = []
+        for exp_id in self._dirty:
+            if exp_id in self._experiments:
+                experiment = self._experiments[exp_id]
+                summary = self._summaries[exp_id] = summarize(experiment)
+                entry = {'op': JournalDatabase.Op.set, 'id': exp_id,
+                         'summary': summary,
+                         'record': experiment.to_record()}
+            else:
+                entry = {'op': JournalDatabase.Op.delete, 'id': exp_id}
+            lines.append(json.dumps(entry, default=str) + '\n')
+        with open(self.journal_path, 'ab') as f:
+            f.write(''.join(lines).encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_count += len(self._dirty)
+        self._dirty = set()
+        # The sweeps are saved after the experiments materialized from them
+        self._save_sweeps()
+        if self._journal_count > max(COMPACT_MIN_RECORDS,
+                                     len(self._summaries)):
+            self.compact()
+
+    def compact(self):
+        """Writes the records of all the experiments into a new snapshot and
+        truncates the journal
+
+        The snapshot is replaced atomically. Should the process die before the
+        journal is truncated, replaying it on the new snapshot is harmless.
+        """
+        if not self._snapshot_loaded:
+            self._load_snapshot()
+        records = dict(self._records)
+        for exp_id, experiment in self._experiments.items():
+            records[exp_id] = experiment.to_record()
+        tmp_path = self.snapshot_path + '.tmp'
+        self._offsets = self.config_parser.write_yaml_items(tmp_path, records)
+        os.rename(tmp_path, self.snapshot_path)
+        self._write_index()
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._dirty = set()
+        self._journal_count = 0
+
+class SQLiteDatabase(Database):
+    """An experiment database backed by SQLite.
+
+    Each experiment is stored as a JSON record alongside its indexed
+    state, node ID and modification time. The collections of the experiments
+    are stored in a separate indexed table, and the sweep records in a table
+    of their own. Experiments are deserialized when they are first accessed;
+    the summaries are read from the columns alone.
+
+    Attributes:
+        filename (str): Name of the database file in the user data directory
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS experiments (
+            id TEXT PRIMARY KEY,
+            state TEXT,
+            node_id TEXT,
+            time_modified TEXT,
+            has_warnings INTEGER,
+            fingerprint TEXT,
+            cpus INTEGER,
+            mem_mb INTEGER,
+            data TEXT);
+        CREATE INDEX IF NOT EXISTS experiments_state
+            ON experiments (state);
+        CREATE INDEX IF NOT EXISTS experiments_node_state
+            ON experiments (node_id, state);
+        CREATE INDEX IF NOT EXISTS experiments_time_modified
+            ON experiments (time_modified);
+        CREATE TABLE IF NOT EXISTS collections (
+            collection TEXT,
+            exp_id TEXT,
+            PRIMARY KEY (collection, exp_id));
+        CREATE INDEX IF NOT EXISTS collections_exp_id
+            ON collections (exp_id);
+        CREATE TABLE IF NOT EXISTS sweeps (
+            id TEXT PRIMARY KEY,
+            data TEXT);
+        """
+
+    def __init__(self, filename):
+        """Opens the database, creating it if it doesn't exist
+
+        Parameters:
+            filename (str): Name of the database file
+        """
+        self.filename = filename
+        if not os.path.exists(neronet.core.USER_DATA_DIR_ABS):
+            os.makedirs(neronet.core.USER_DATA_DIR_ABS)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.executescript(self.SCHEMA)
+        self._cache = {}
+        self._dirty = set()
+        self._migrate()
+        self._conn.commit()
+
+    def _migrate(self):
+        """Adds the columns missing from databases created by older
+        versions"""
+        columns = [row[1] for row in
+                   self._conn.execute('PRAGMA table_info(experiments)')]
+        missing = [(name, column_type) for name, column_type in
+                   (('has_warnings', 'INTEGER'), ('fingerprint', 'TEXT'),
+                    ('cpus', 'INTEGER'), ('mem_mb', 'INTEGER'))
+                   if name not in columns]
+        for name, column_type in missing:
+            self._conn.execute('ALTER TABLE experiments ADD COLUMN %s %s'
+                               % (name, column_type))
+        if missing:
+            for exp in self._load(self._conn.execute(
+                    'SELECT id, data FROM experiments')):
+                self._dirty.add(exp.id)
+            self._write_dirty()
+
+    @property
+    def path(self):
+        return os.path.join(neronet.core.USER_DATA_DIR_ABS, self.filename)
+
+    def _read_sweeps(self):
+        return [json.loads(data) for (data,) in
+                self._conn.execute('SELECT data FROM sweeps')]
+
+    def _write_sweeps(self, records, deleted):
+        self._conn.executemany('INSERT OR REPLACE INTO sweeps (id, data) '
+                'VALUES (?, ?)', [(record['definition']['experiment_id'],
+                json.dumps(record, default=str)) for record in records])
+        self._conn.executemany('DELETE FROM sweeps WHERE id = ?',
+                               [(sweep_id,) for sweep_id in deleted])
+
+    def _write_dirty(self):
+        """Writes the tracked changes to the database without committing"""
+        for exp_id in self._dirty:
+            self._conn.execute('DELETE FROM collections WHERE exp_id = ?',
+                               (exp_id,))
+            if exp_id not in self._cache:
+                self._conn.execute('DELETE FROM experiments WHERE id = ?',
+                                   (exp_id,))
+                continue
+            exp = self._cache[exp_id]
+            time_modified = exp.time_modified.isoformat() \
+                if exp.time_modified else None
+            cpus, mem_mb = neronet.scheduler.demand(exp)
+            self._conn.execute('INSERT OR REPLACE INTO experiments '
+                    '(id, state, node_id, time_modified, has_warnings, '
+                    'fingerprint, cpus, mem_mb, data) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (exp_id, exp.state, exp.node_id, time_modified,
+                    bool(exp.get_warnings()), exp.fingerprint, cpus, mem_mb,
+                    json.dumps(exp.to_record(), default=str)))
+            self._conn.executemany('INSERT OR IGNORE INTO collections '
+                    '(collection, exp_id) VALUES (?, ?)',
+                    [(collection, exp_id) for collection in
+                    _as_list(exp.collection)])
+        self._dirty = set()
+
+    def _load(self, rows):
+        """Returns the experiments of the (id, data) rows, deserializing only
+        the ones that aren't cached already
+
+        The data is a JSON experiment record, or a pickled experiment in
+        databases written by older versions.
+        """
+        experiments = []
+        for exp_id, data in rows:
+            if exp_id not in self._cache:
+                if isinstance(data, type(u'')):
+                    self._cache[exp_id] = \
+                        neronet.experiment.Experiment.from_record(
+                            json.loads(data))
+                else:
+                    self._cache[exp_id] = pickle.loads(bytes(data))
+            experiments.append(self._cache[exp_id])
+        return experiments
+
+    def __getitem__(self, exp_id):
+        if exp_id not in self._cache:
+            self._write_dirty()
+            row = self._conn.execute('SELECT id, data FROM experiments '
+                                     'WHERE id = ?', (exp_id,)).fetchone()
+            if row is None:
+                return self._virtual_experiment(exp_id)
+            self._load([row])
+        return self._cache[exp_id]
+
+    def __setitem__(self, exp_id, experiment):
+        if not self._stored(exp_id):
+            self._store_virtual(exp_id)
+        self._cache[exp_id] = experiment
+        self._dirty.add(exp_id)
+
+    def __delitem__(self, exp_id):
+        if not self._stored(exp_id):
+            self._take_virtual(exp_id)
+            return
+        self._cache.pop(exp_id, None)
+        self._dirty.add(exp_id)
+
+    def __iter__(self):
+        self._write_dirty()
+        return itertools.chain([row[0] for row in self._conn.execute(
+                                'SELECT id FROM experiments')],
+                               self._virtual_ids())
+
+    def __len__(self):
+        self._write_dirty()
+        return self._conn.execute('SELECT COUNT(*) FROM experiments'
+                                  ).fetchone()[0] + self._virtual_count()
+
+    def _stored(self, exp_id):
+        """Returns whether the experiment is stored, i.e. isn't virtual"""
+        if exp_id in self._cache:
+            return True
+        self._write_dirty()
+        return self._conn.execute('SELECT 1 FROM experiments WHERE id = ?',
+                                  (exp_id,)).fetchone() is not None
+
+    def __contains__(self, exp_id):
+        return self._stored(exp_id) or self._find_virtual(exp_id) is not None
+
+    def touch(self, exp_id):
+        if exp_id in self._cache:
+            self._dirty.add(exp_id)
+
+    def save(self):
+        """Persists the tracked changes in a single transaction"""
+        self._write_dirty()
+        self._save_sweeps()
+        self._conn.commit()
+
+    def summary(self, exp_id):
+        if exp_id in self._cache:
+            return summarize(self._cache[exp_id])
+        self._write_dirty()
+        row = self._conn.execute('SELECT state, node_id, has_warnings, '
+                'fingerprint, cpus, mem_mb FROM experiments WHERE id = ?',
+                (exp_id,)).fetchone()
+        if row is None:
+            return Database.summary(self, exp_id)
+        state, node_id, has_warnings, fingerprint, cpus, mem_mb = row
+        return Summary(exp_id, state, node_id, [collection for (collection,)
+                       in self._conn.execute('SELECT collection FROM '
+                       'collections WHERE exp_id = ?', (exp_id,))],
+                       bool(has_warnings), fingerprint,
+                       neronet.scheduler.Demand(cpus, mem_mb))
+
+    def summaries(self, virtual=True):
+        self._write_dirty()
+        exp_collections = {}
+        for collection, exp_id in self._conn.execute(
+                'SELECT collection, exp_id FROM collections'):
+            exp_collections.setdefault(exp_id, []).append(collection)
+        summaries = [Summary(exp_id, state, node_id,
+                             exp_collections.get(exp_id, []),
+                             bool(has_warnings), fingerprint,
+                             neronet.scheduler.Demand(cpus, mem_mb))
+                     for exp_id, state, node_id, has_warnings, fingerprint,
+                     cpus, mem_mb in self._conn.execute('SELECT id, state, '
+                            'node_id, has_warnings, fingerprint, cpus, mem_mb '
+                            'FROM experiments')]
+        if virtual:
+            summaries += self._virtual_summaries()
+        return summaries
+
+    def find(self, state=None, node_id=None, collection=None):
+        self._write_dirty()
+        query = 'SELECT id, data FROM experiments'
+        conditions = []
+        args = []
+        if collection is not None:
+            query += ' JOIN collections ON collections.exp_id = id'
+            conditions.append('collection = ?')
+            args.append(collection)
+        if state is not None:
+            conditions.append('state = ?')
+            args.append(state)
+        if node_id is not None:
+            conditions.append('node_id = ?')
+            args.append(node_id)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        return self._load(self._conn.execute(query, args)) + \
+            self._find_virtual_experiments(state, node_id, collection)
+
+    def submitted(self):
+        self._write_dirty()
+        return self._load(self._conn.execute('SELECT id, data FROM '
+                'experiments WHERE node_id IS NOT NULL'))
+
+def _as_list(value):
+    """Returns the value as a list, wrapping single values"""
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
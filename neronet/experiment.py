@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
 import datetime
+import hashlib
+import json
 import os
 import shlex
 import time
@@ -14,13 +16,95 @@ MANDATORY_FIELDS = set(['run_command_prefix', 'main_code_file'])
 OPTIONAL_FIELDS = set(['parameters', 'parameters_format', 'outputs', 
                         'output_line_processor', 'output_file_processor', 
                         'plot', 'collection', 'required_files', 'conditions', 
-                        'sbatch_args', 'custom_msg'])
+                        'sbatch_args', 'custom_msg', 'resources'])
 """Set: Fields that Neronet uses but are not necessary"""
 
 AUTOMATIC_FIELDS = set(['path', 'time_created', 'time_modified', 
                         'states_info', 'node_id', 'warnings'])
 """Set: Contains all fields automatically generated by Neronet"""
 
+RESOURCES = ('cpus', 'mem_mb')
+"""tuple: The resources an experiment can request: the number of cores and
+the memory in MiB"""
+
+FIELDS = ('run_command_prefix', 'main_code_file', 'required_files',
+          'outputs', 'output_file_processor', 'output_line_processor',
+          'plot', 'parameters', 'parameters_format', 'collection',
+          'conditions', 'sbatch_args', 'path', 'time_created',
+          'time_modified', 'run_results', 'states_info', 'node_id',
+          'warnings', 'custom_msg', 'log_output', 'fingerprint',
+          'resources')
+"""tuple: All the fields stored in an experiment besides its ID"""
+
+SHARED_FIELDS = ('run_command_prefix', 'main_code_file', 'path',
+                 'parameters_format')
+"""tuple: String fields that are usually the same for many experiments and
+are thus interned"""
+
+SHARED_STRINGS_MAX_SIZE = 10000
+"""int: The number of distinct strings shared before the table is emptied"""
+
+_shared_strings = {}
+
+def _intern(value):
+    """Returns the shared copy of the string so that equal strings share
+    memory
+
+    Unlike the built-in intern, this shares the unicode strings read from
+    JSON and SQLite records in Python 2 too. The table is emptied when it
+    grows past SHARED_STRINGS_MAX_SIZE so that long-running processes don't
+    keep the strings of every experiment they have ever seen.
+    """
+    if isinstance(value, (str, type(u''))):
+        if value not in _shared_strings and \
+                len(_shared_strings) >= SHARED_STRINGS_MAX_SIZE:
+            _shared_strings.clear()
+        return _shared_strings.setdefault(value, value)
+    return value
+
+FINGERPRINT_FIELDS = sorted(MANDATORY_FIELDS | OPTIONAL_FIELDS) + ['path']
+"""list: The fields the fingerprint of an experiment is computed from"""
+
+_file_digests = {}
+
+def file_digest(path):
+    """Returns the SHA-1 hex digest of the file content, or None if the file
+    doesn't exist
+
+    The digests are cached by the modification time and size of the file, so
+    the code files shared by the experiments of a sweep are read only once.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    stamp = (stat.st_mtime, stat.st_size)
+    cached = _file_digests.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    _file_digests[path] = (stamp, digest.hexdigest())
+    return _file_digests[path][1]
+
+RECORD_VERSION = 1
+"""int: Version of the experiment record format, see `Experiment.to_record`"""
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+"""str: The format of the timestamps in experiment records"""
+
+def _time_to_record(timestamp):
+    return timestamp.strftime(TIME_FORMAT) if timestamp else None
+
+def _time_from_record(value):
+    if not value or isinstance(value, datetime.datetime):
+        return value
+    if '.' not in value:
+        value += '.0'
+    return datetime.datetime.strptime(value, TIME_FORMAT)
+
 class OutputReadError(Exception):
     """ Exception raised when output reading failed
     """
@@ -47,6 +131,8 @@ class Experiment(object):
         time_modified (datetime): Timestamp of when the experiment was modified
             last
         path (str): Path to the experiment folder
+        resources (dict): The number of cores ('cpus') and the memory in MiB
+            ('mem_mb') the experiment needs, or None if not requested
     """
 
     class State:
@@ -59,38 +145,110 @@ class Experiment(object):
         running = 'running'
         finished = 'finished'
 
+    __slots__ = ('experiment_id',) + FIELDS
+
     def __init__(self, experiment_id, run_command_prefix, main_code_file,
                     path, parameters=None, parameters_format="", 
                     required_files=None, outputs=None, 
                     output_line_processor=None, output_file_processor=None, 
                     collection=None, custom_msg=None, plot=None, 
-                    conditions=None, sbatch_args=None):
+                    conditions=None, sbatch_args=None, resources=None):
         now = datetime.datetime.now()
-        fields = {'run_command_prefix': run_command_prefix,
-                    'main_code_file': main_code_file,
-                    'required_files': required_files if required_files else [],
-                    'outputs': outputs,
-                    'output_file_processor': output_file_processor,
-                    'output_line_processor': output_line_processor,
-                    'plot': plot,
-                    'parameters': parameters,
-                    'parameters_format': parameters_format,
-                    'collection': collection if collection else \
-                                        [os.path.basename(path)],
-                    'conditions': conditions,
-                    'sbatch_args': sbatch_args,
-                    'path': path,
-                    'time_created': now,
-                    'time_modified': now,
-                    'run_results': [],
-                    'states_info': [(Experiment.State.defined, now)],
-                    'node_id': None,
-                    'warnings' : [],
-                    'custom_msg': custom_msg if custom_msg else "" }
-        #MAGIC: Creates the attributes for the experiment class
-        self.__dict__['_fields'] = fields
-        #super(Experiment, self).__setattr__('_fields', fields)
-        super(Experiment, self).__setattr__('_experiment_id', experiment_id)
+        self.experiment_id = experiment_id
+        self.run_command_prefix = _intern(run_command_prefix)
+        self.main_code_file = _intern(main_code_file)
+        self.required_files = required_files if required_files else []
+        self.outputs = outputs
+        self.output_file_processor = output_file_processor
+        self.output_line_processor = output_line_processor
+        self.plot = plot
+        self.parameters = parameters
+        self.parameters_format = _intern(parameters_format)
+        self.collection = collection if collection else \
+                            [os.path.basename(path)]
+        self.conditions = conditions
+        self.sbatch_args = sbatch_args
+        self.resources = resources
+        self.path = _intern(path)
+        self.time_created = now
+        self.time_modified = now
+        self.run_results = []
+        self.states_info = [(Experiment.State.defined, now)]
+        self.node_id = None
+        self.warnings = []
+        self.custom_msg = custom_msg if custom_msg else ""
+        self.log_output = None
+        self.fingerprint = self.compute_fingerprint()
+
+    def _set_fields(self, experiment_id, fields):
+        """Sets the experiment ID and the fields from a dictionary, used when
+        restoring experiments"""
+        self.experiment_id = experiment_id
+        for field in FIELDS:
+            setattr(self, field, fields.get(field))
+        for field in SHARED_FIELDS:
+            setattr(self, field, _intern(getattr(self, field)))
+
+    def __getstate__(self):
+        return dict((field, getattr(self, field)) for field in
+                    self.__slots__)
+
+    def __setstate__(self, state):
+        """Restores the experiment from a pickle or a YAML object
+
+        Experiments serialized by older versions keep their fields in a
+        '_fields' dictionary.
+        """
+        if '_fields' in state:
+            self._set_fields(state['_experiment_id'], state['_fields'])
+        else:
+            self._set_fields(state['experiment_id'], state)
+
+    def compute_fingerprint(self):
+        """Computes a hash of the definable fields and the content of the
+        code files of the experiment
+
+        Two definitions of an experiment have the same fingerprint only if
+        they would run the same way, so comparing the fingerprints is enough
+        to detect changed experiments.
+
+        Returns:
+            str: The SHA-1 hex digest
+        """
+        definition = dict((field, getattr(self, field)) for field in
+                          FINGERPRINT_FIELDS)
+        # Leave out the unset resources so that the fingerprints of the
+        # experiments defined before resource requests existed still match
+        if self.resources is None:
+            del definition['resources']
+        if self.conditions:
+            definition['conditions'] = dict((name, condition.to_record())
+                    for name, condition in self.conditions.items())
+            for condition in definition['conditions'].values():
+                del condition['start_time']
+        definition['code'] = [(filename,
+                               file_digest(os.path.join(self.path, filename)))
+                              for filename in [self.main_code_file] +
+                              list(self.required_files or [])]
+        return hashlib.sha1(json.dumps(definition, sort_keys=True,
+                                       default=str).encode('utf-8')
+                            ).hexdigest()
+
+    @property
+    def id(self):
+        return self.experiment_id
+
+    @id.setter
+    def id(self, value):
+        self.experiment_id = value
+
+    @property
+    def state(self):
+        return self.states_info[-1][0]
+
+    @property
+    def state_info(self):
+        return self.states_info[-1]
         
     def get_results_dir(self):
         """Returns the location of the directory of the latest experiment results
@@ -116,12 +274,12 @@ class Experiment(object):
         #Prefers processor that read the whole file
         for processor_type in ['output_file_processor',
                                 'output_line_processor']:
-            if not self._fields[processor_type] or \
-                filename not in self._fields[processor_type]:
+            if not getattr(self, processor_type) or \
+                filename not in getattr(self, processor_type):
                 continue
             #Constructs the output reader and arguments
             args = \
-                shlex.split(self._fields[processor_type][filename])
+                shlex.split(getattr(self, processor_type)[filename])
             try:
                 module_name = args[0]
                 reader_name = args[1]
@@ -178,7 +336,7 @@ class Experiment(object):
             PlotError: if plotting failed
             ImportError: When importing a user defined function fails.
         """
-        plots = self._fields['plot']
+        plots = self.plot
         if not plots:
             raise PlotError("%s: no plots defined" % self.id)
         for plot_name in plots:
@@ -237,8 +395,8 @@ class Experiment(object):
     def get_action(self, logrow):
         init_action = ('no action', '')
         try:
-            for key in self._fields['conditions']:
-                action = self._fields['conditions'][key].get_action(logrow)
+            for key in self.conditions:
+                action = self.conditions[key].get_action(logrow)
                 if action == 'kill':
                     return (action, key)
                 elif action != 'no action':
@@ -252,7 +410,7 @@ class Experiment(object):
            attributes:
                warning(str): the name/id of the condition that was met
         """
-        self._fields['warnings'].append(str(datetime.datetime.now()) + ": The condition '" + warning + "' was met")
+        self.warnings.append(str(datetime.datetime.now()) + ": The condition '" + warning + "' was met")
     
     def set_multiple_warnings(self, warnings):
         """Updates self.warnings to be exactly the same as the parameter given to
@@ -260,53 +418,23 @@ class Experiment(object):
            Parameters:
                warnings(list): List of warning messages
         """
-        self._fields['warnings'] = warnings
+        self.warnings = warnings
             
     def has_warnings(self):
-        if self._fields['warnings']:
+        if self.warnings:
             return 'WARNING'
         else:
             return ''
     
     def get_warnings(self):
-        return self._fields['warnings']
-
-    def __getattr__(self, attr):
-        """Getter for the experiment class hides the inner dictionary"""
-        #Gets the inner dictionary
-        fields = super(Experiment, self).__getattribute__('_fields')
-        if attr in fields:
-            return fields[attr]
-        #Gets hidden attributes by adding _
-        if attr == 'id':
-            attr = 'experiment_id'
-        elif attr == 'state':
-            return fields['states_info'][-1][0]
-        elif attr == 'state_info':
-            return fields['states_info'][-1]
-        return super(Experiment, self).__getattribute__('_' + attr)
-
-    def __setattr__(self, attr, value):
-        """Setter for the experiment class
-        
-        Raises:
-            AttributeError: if the attribute doesn't exist
-        """
-        #Gets the inner dictionary
-        fields = super(Experiment, self).__getattribute__('_fields')
-        if attr == 'id' or attr == 'experiment_id':
-            super(Experiment, self).__setattr__('_experiment_id', value)
-        elif attr in fields or attr in ('log_output', ):
-            fields[attr] = value
-        else:
-            raise AttributeError('Experiment has no attribute named "%s"!' % attr)
+        return self.warnings
 
     @property 
     def callstring(self):
-        rcmd = self._fields['run_command_prefix']
-        code_file = self._fields['main_code_file']
-        parameters = self._fields['parameters']
-        param_format = self._fields['parameters_format']
+        rcmd = self.run_command_prefix
+        code_file = self.main_code_file
+        parameters = self.parameters
+        param_format = self.parameters_format
         parameters_string = param_format.format(**parameters)
         callstring = ' '.join([rcmd, code_file, parameters_string])
         return callstring
@@ -315,10 +443,10 @@ class Experiment(object):
         """ Updates the state
         """
         if state == self.state: return
-        if state == 'running' and self._fields['conditions']:
-            for c in self._fields['conditions']:
-                self._fields['conditions'][c].start_time = datetime.datetime.now()
-        self._fields['states_info'].append((state, datetime.datetime.now()))
+        if state == 'running' and self.conditions:
+            for c in self.conditions:
+                self.conditions[c].start_time = datetime.datetime.now()
+        self.states_info.append((state, datetime.datetime.now()))
 
         
     def as_gen(self):
@@ -326,30 +454,30 @@ class Experiment(object):
         Yields:
             str: A line of experiment status
         """
-        yield "%s\n" % self._experiment_id
-        yield "  Run command: %s\n" % self._fields['run_command_prefix']
-        yield "  Main code file: %s\n" % self._fields['main_code_file']
-        params = self._fields['parameters_format'].format( \
-            **self._fields['parameters'])
+        yield "%s\n" % self.experiment_id
+        yield "  Run command: %s\n" % self.run_command_prefix
+        yield "  Main code file: %s\n" % self.main_code_file
+        params = self.parameters_format.format( \
+            **self.parameters)
         yield "  Parameters: %s\n" % params
-        yield "  Parameters format: %s\n" % self._fields['parameters_format']
-        if self._fields['collection']:
-            yield "  Collection: %s\n" % self._fields['collection']
+        yield "  Parameters format: %s\n" % self.parameters_format
+        if self.collection:
+            yield "  Collection: %s\n" % self.collection
         yield "  State: %s\n" % self.state
-        if self._fields['node_id']:
-            yield "  Node: " + self._fields['node_id'] + '\n'
+        if self.node_id:
+            yield "  Node: " + self.node_id + '\n'
         if self.state in (Experiment.State.running, Experiment.State.finished):
             can_process = False
-            for output_file in self._fields['outputs']:
-                if self._fields['output_line_processor']:
-                    if output_file in self._fields['output_line_processor']:
+            for output_file in self.outputs:
+                if self.output_line_processor:
+                    if output_file in self.output_line_processor:
                         can_process = True
-                if self._fields['output_file_processor']:
-                    if output_file in self._fields['output_file_processor']:
+                if self.output_file_processor:
+                    if output_file in self.output_file_processor:
                         can_process = True
             if can_process:
                 yield "  Output:\n"
-                for output_file in self._fields['outputs']:
+                for output_file in self.outputs:
                     try:
                         output = self.get_output(output_file)
                         yield "    " + output_file + ":\n"
@@ -357,20 +485,20 @@ class Experiment(object):
                             yield "      %s: " % field + str(output[field]) + "\n"
                     except OutputReadError as e:
                         pass
-        yield "  Last modified: %s\n" % self._fields['time_modified']
-        if self._fields['conditions']:            
+        yield "  Last modified: %s\n" % self.time_modified
+        if self.conditions:            
             conds = '  Conditions:\n'
-            for condition in self._fields['conditions']:
-                conds +=  '    ' + self._fields['conditions'][condition].name + ':\n'
-                conds +=  '      variablename: ' + self._fields['conditions'][condition].varname + '\n'
-                conds +=  '      killvalue: ' + str(self._fields['conditions'][condition].killvalue) + '\n'
-                conds +=  '      comparator: ' + self._fields['conditions'][condition].comparator + '\n'
-                conds +=  '      when: ' + self._fields['conditions'][condition].when + '\n'
-                conds +=  '      action: ' + self._fields['conditions'][condition].action + '\n'
+            for condition in self.conditions:
+                conds +=  '    ' + self.conditions[condition].name + ':\n'
+                conds +=  '      variablename: ' + self.conditions[condition].varname + '\n'
+                conds +=  '      killvalue: ' + str(self.conditions[condition].killvalue) + '\n'
+                conds +=  '      comparator: ' + self.conditions[condition].comparator + '\n'
+                conds +=  '      when: ' + self.conditions[condition].when + '\n'
+                conds +=  '      action: ' + self.conditions[condition].action + '\n'
             yield conds
-        if self._fields['warnings']:
+        if self.warnings:
             warns = '  Warnings:\n'
-            for warn in self._fields['warnings']:
+            for warn in self.warnings:
                 warns += '    ' + warn + '\n'
             yield warns
         out_file = os.path.join(self.get_results_dir(), 'stdout.log')
@@ -392,15 +520,65 @@ class Experiment(object):
                         yield '      L%04d: %s\n' % (i+1, lines[i].rstrip())
 
     def __str__(self):
-        return "%s %s" % (self._experiment_id, self._fields['state'][-1][0])
+        return "%s %s" % (self.experiment_id, self.state)
+
+    def to_record(self):
+        """Converts the experiment into a versioned record of plain data
+        types that can be stored as safe YAML or JSON
+
+        Returns:
+            dict: The experiment record
+        """
+        record = self.__getstate__()
+        record['version'] = RECORD_VERSION
+        record['experiment_id'] = self.experiment_id
+        record['time_created'] = _time_to_record(record['time_created'])
+        record['time_modified'] = _time_to_record(record['time_modified'])
+        record['states_info'] = [[state, _time_to_record(timestamp)]
+                                 for state, timestamp in record['states_info']]
+        if record['conditions']:
+            record['conditions'] = dict((name, condition.to_record())
+                    for name, condition in record['conditions'].items())
+        return record
+
+    @classmethod
+    def from_record(cls, record):
+        """Creates an experiment from a record made by `to_record`
+
+        Parameters:
+            record (dict): The experiment record
+
+        Returns:
+            Experiment: The experiment
+
+        Raises:
+            ValueError: if the record is of an unknown version
+        """
+        if record.get('version', 0) > RECORD_VERSION:
+            raise ValueError('Unsupported experiment record version %s!'
+                             % record['version'])
+        fields = dict(record)
+        fields.pop('version', None)
+        experiment_id = fields.pop('experiment_id')
+        fields['time_created'] = _time_from_record(fields['time_created'])
+        fields['time_modified'] = _time_from_record(fields['time_modified'])
+        fields['states_info'] = [(state, _time_from_record(timestamp))
+                                 for state, timestamp in fields['states_info']]
+        if fields.get('conditions'):
+            fields['conditions'] = dict((name,
+                    ExperimentWarning.from_record(condition)) for
+                    name, condition in fields['conditions'].items())
+        experiment = cls.__new__(cls)
+        experiment._set_fields(experiment_id, fields)
+        return experiment
 
 def duplicate_experiment(experiment, experiment_id):
     definable_fields = MANDATORY_FIELDS | OPTIONAL_FIELDS
     experiment_data = {}
     for field in definable_fields:
-        experiment_data[field] = experiment._fields[field]
+        experiment_data[field] = getattr(experiment, field)
     experiment_data['experiment_id'] = experiment_id
-    experiment_data['path'] = experiment._fields['path']
+    experiment_data['path'] = experiment.path
     return Experiment(**experiment_data)
 
 class ExperimentWarning:
@@ -442,6 +620,22 @@ class ExperimentWarning:
                 return self.action
         return 'no action'
 
+    def to_record(self):
+        """Converts the warning into a record of plain data types"""
+        return {'name': self.name, 'variablename': self.varname,
+                'killvalue': self.killvalue, 'comparator': self.comparator,
+                'when': self.when, 'action': self.action,
+                'start_time': _time_to_record(self.start_time)}
+
+    @classmethod
+    def from_record(cls, record):
+        """Creates a warning from a record made by `to_record`"""
+        warning = cls(record['name'], record['variablename'],
+                      record['killvalue'], record['comparator'],
+                      record['when'], record['action'])
+        warning.start_time = _time_from_record(record['start_time'])
+        return warning
+
     def __eq__(self, other):
         if not other:
             return False
@@ -20,6 +20,10 @@ def create_argument_parser():
                         nargs=1,
                         help='Creates experiments according to the config'
                         'file found in the folder')
+    parser.add_argument('--recursive', '-r',
+                        action='store_true',
+                        help='With --addexp, creates the experiments of '
+                        'every config file found under the folder')
     parser.add_argument('--delexp',
                         metavar='experiment_id',
                         nargs=1,
@@ -45,7 +49,9 @@ def create_argument_parser():
     parser.add_argument('--submit',
                         metavar=('experiment', 'node'),
                         nargs="+",
-                        help='Submits an experiment to be run')
+                        help='Submits experiments to be run. Takes '
+                        'experiment and collection IDs optionally followed '
+                        'by the node')
     parser.add_argument('--fetch',
                         action='store_true',
                         help='Fetches results of submitted experiments')
@@ -80,21 +86,34 @@ def main():
         else:
             print('Data removal cancelled.')
         return
-    nero = neronet.neroman.Neroman()
     if not any(vars(args).values()):
         parser.print_help()
         sys.exit(1)
+    if args.template:
+        cfgtemplate(*args.template)
+        args.template = None
+        # Creating a template doesn't need the experiment database
+        if not any(vars(args).values()):
+            return
+    nero = neronet.neroman.Neroman()
     if args.addexp:
         experiment_folder = args.addexp[0]
         changed_exps = {}
         try:
-            changed_exps = nero.specify_experiments(experiment_folder)
+            if args.recursive:
+                changed_exps, errors = \
+                    nero.specify_experiment_tree(experiment_folder)
+                for folder in sorted(errors):
+                    print('Failed to specify experiments in %s:' % folder)
+                    print(errors[folder])
+            else:
+                changed_exps = nero.specify_experiments(experiment_folder)
         except (IOError, FormatError) as e:
             print("Failed to specify experiments:")
             print(e)
             return
         print('Experiment(s) successfully defined')
-        if changed_exps:
+        with nero.transaction():
             for experiment in changed_exps.values():
                 print('Changes detected in experiment: %s' % experiment.id)
                 while True:
@@ -156,19 +175,24 @@ def main():
         except IOError as e:
             print(e)
     if args.submit:
-        experiment_id = args.submit[0]
-        try:
-            if len(args.submit) > 1:
-                node_id = args.submit[1]
-                print(''.join(nero.submit(experiment_id, node_id)), end="")
-            else:
-                print(''.join(nero.submit(experiment_id)), end="")
-        except Exception as err:
-            print('Submission failed! Error: %s' % (err))
+        experiment_ids = args.submit
+        node_id = ''
+        last = experiment_ids[-1]
+        if len(experiment_ids) > 1 and (last in nero.nodes['nodes'] or
+                last in nero.nodes['groups']):
+            experiment_ids, node_id = experiment_ids[:-1], last
+        if not node_id and len(experiment_ids) > 1 and \
+                not nero.is_experiment_id(last):
+            print('Submission failed! Error: Unknown node or group "%s"'
+                  % (last))
+        else:
+            try:
+                for line in nero.submit(experiment_ids, node_id):
+                    print(line, end="")
+            except Exception as err:
+                print('Submission failed! Error: %s' % (err))
     if args.fetch:
         print(''.join(nero.fetch()), end="")
-    if args.template:
-        cfgtemplate(*args.template)
     if args.terminate:
         experiment_id = args.terminate[0]
         print(''.join(nero.terminate_experiment(experiment_id)), end="")
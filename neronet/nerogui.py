@@ -87,9 +87,10 @@ class Nerogui(QtGui.QMainWindow, design.Ui_MainWindow):
         if event.mimeData().hasUrls():
             event.setDropAction(QtCore.Qt.CopyAction)
             event.accept()
-            for url in event.mimeData().urls():
-                path =  url.toLocalFile().toLocal8Bit().data()
-                self.nero.specify_experiments(path)
+            with self.nero.transaction():
+                for url in event.mimeData().urls():
+                    path =  url.toLocalFile().toLocal8Bit().data()
+                    self.nero.specify_experiments(path)
             self.init_labels()
             self.init_menu()
             self.add_to_param_table()
@@ -124,9 +125,14 @@ class Nerogui(QtGui.QMainWindow, design.Ui_MainWindow):
     def init_labels(self):
         """initialilze all experiment labels"""
         self.allLabels = set() #prepare label list
-        for exp in self.nero.database.keys():
+        # The virtual experiments of the sweeps are listed by their sweeps
+        # instead of being created one by one
+        for summary in self.nero.database.summaries(virtual=False):
             self.allLabels |= set(
-                self.nero.database[exp]._fields["parameters"].keys())        
+                self.nero.database[summary.id].parameters.keys())
+        for sweep in self.nero.database.sweeps().values():
+            self.allLabels |= set(
+                (sweep.definition.get('parameters') or {}).keys())
 
     def init_nodes(self):
         """add each node to view"""
@@ -178,18 +184,23 @@ class Nerogui(QtGui.QMainWindow, design.Ui_MainWindow):
                   self.paramTable.selectedIndexes()))
         if not rows:
             return
-        for exp in rows:
-            name = str(self.paramTable.item(exp, 0).text())
-            for line in self.nero.submit(name, node):
-                self.experiment_log.insertPlainText(line)
-                QtGui.QApplication.processEvents()
+        names = [str(self.paramTable.item(exp, 0).text()) for exp in rows]
+        for line in self.nero.submit(names, node):
+            self.experiment_log.insertPlainText(line)
+            QtGui.QApplication.processEvents()
 	#self.show_one_experiment()
         self.add_to_param_table()
 
     def add_to_param_table(self):
-        """inserts values from database to comparison table"""
+        """inserts values from database to comparison table
+
+        The stored experiments get a row each and every sweep one row for
+        all of its virtual experiments, which aren't created for the table.
+        """
         self.paramTable.blockSignals(True)
-        expNames = self.nero.database.keys()
+        expNames = [summary.id for summary in
+                    self.nero.database.summaries(virtual=False)]
+        sweeps = self.nero.database.sweeps()
         insertedLabels = set()
         if len(self.filteredLabels) == len(self.allLabels):
             insertedLabels = self.allLabels
@@ -197,54 +208,62 @@ class Nerogui(QtGui.QMainWindow, design.Ui_MainWindow):
             insertedLabels = self.allLabels - self.filteredLabels
         self.paramTable.setRowCount(0)
         self.paramTable.setColumnCount(0)
-        self.paramTable.setRowCount(len(expNames))
+        self.paramTable.setRowCount(len(expNames) + len(sweeps))
         self.paramTable.setColumnCount(len(insertedLabels)+4)
         self.paramTable.setColumnWidth(0,200)
         self.paramTable.setHorizontalHeaderLabels(tuple(["Name", "Note", "Submitted", "status"] + list(insertedLabels)))
-	for yAxis, name in enumerate(expNames):
-            item = MyTableWidgetItem(
-	           QtCore.QString("%1").arg(name))
-            item.setFlags(item.flags() & ~QtCore.Qt.ItemIsEditable)
-            status = self.nero.database[
-	                name]._fields["states_info"][-1][0] #latest status
-            item.setTextColor(color_coding[status])
-            self.paramTable.setItem(yAxis, 0, item)
+        for yAxis, name in enumerate(expNames):
+            experiment = self.nero.database[name]
+            status = experiment.states_info[-1][0] #latest status
             submitted = ""
             try:
-                submitted = str(self.nero.database[
-	                name]._fields["states_info"][1][1])
+                submitted = str(experiment.states_info[1][1])
             except IndexError:
                 pass
-            item = MyTableWidgetItem(QtCore.QString("%1").arg(submitted))
-            item.setFlags(item.flags() & ~QtCore.Qt.ItemIsEditable)
-	    self.paramTable.setItem(yAxis, 2, item)
-            item = MyTableWidgetItem(QtCore.QString("%1").arg(status))
-            item.setFlags(item.flags() & ~QtCore.Qt.ItemIsEditable)
-	    self.paramTable.setItem(yAxis, 3, item)
-            message = str(self.nero.database[
-	                name]._fields["custom_msg"])
-            item = MyTableWidgetItem(QtCore.QString("%1").arg(message))
-	    self.paramTable.setItem(yAxis, 1, item)
-	    for xAxis, param in enumerate(insertedLabels):
-	        try:
-	            value = self.nero.database[
-	                name]._fields["parameters"][param]
-	            self.paramTable.setItem(
-	                yAxis,
-	                xAxis+4,
-	                MyTableWidgetItem(
-	                    QtCore.QString("%1").arg(value)))
-	        except KeyError:
-	            pass
+            self._set_row(yAxis, name, experiment.custom_msg, submitted,
+                          status, experiment.parameters, insertedLabels)
+        for yAxis, sweep_id in enumerate(sorted(sweeps), len(expNames)):
+            sweep = sweeps[sweep_id]
+            self._set_row(yAxis, sweep_id, '%d defined experiments'
+                          % (len(sweep) - len(sweep.taken)), "", 'defined',
+                          sweep.definition.get('parameters') or {},
+                          insertedLabels, editable=False)
         self.paramTable.blockSignals(False)
 
+    def _set_row(self, yAxis, name, message, submitted, status, parameters,
+                 insertedLabels, editable=True):
+        """fills a row of the comparison table"""
+        def add_item(xAxis, value, editable=False):
+            item = MyTableWidgetItem(QtCore.QString("%1").arg(str(value)))
+            if not editable:
+                item.setFlags(item.flags() & ~QtCore.Qt.ItemIsEditable)
+            self.paramTable.setItem(yAxis, xAxis, item)
+            return item
+        add_item(0, name).setTextColor(color_coding[status])
+        add_item(1, message, editable)
+        add_item(2, submitted)
+        add_item(3, status)
+        for xAxis, param in enumerate(insertedLabels):
+            if param in parameters:
+                add_item(xAxis+4, parameters[param], editable)
+
+    def _is_sweep(self, name):
+        """tells if a table row is a sweep instead of an experiment"""
+        return name in self.nero.database.sweeps()
+
     def show_one_experiment(self):
         """prints detailed info of one experiment"""
         self.experiment_log.clear()
         row = self.paramTable.currentRow()
         if self.paramTable.item(row, 0) is None:
             return
-	name = str(self.paramTable.item(row, 0).text())
+        name = str(self.paramTable.item(row, 0).text())
+        if self._is_sweep(name):
+            sweep = self.nero.database.sweeps()[name]
+            self.experiment_log.insertPlainText(
+                'Sweep %s: %d defined experiments\n'
+                % (name, len(sweep) - len(sweep.taken)))
+            return
         for line in self.nero.status_gen(name):
             self.experiment_log.insertPlainText(line)
 
@@ -260,8 +279,11 @@ class Nerogui(QtGui.QMainWindow, design.Ui_MainWindow):
         if x != 0:
             return
         row = self.paramTable.currentRow()
-	name = str(self.paramTable.item(row, 0).text())
-        path = self.nero.database[name]._fields["path"]
+        name = str(self.paramTable.item(row, 0).text())
+        if self._is_sweep(name):
+            path = self.nero.database.sweeps()[name].definition['path']
+        else:
+            path = self.nero.database[name].path
         webbrowser.open(path)
 
     def fetch_exp(self):
@@ -276,9 +298,11 @@ class Nerogui(QtGui.QMainWindow, design.Ui_MainWindow):
     def terminate_exp(self):
         """send terminate command to experiment"""
         self.experiment_log.clear()
-        for exp in self.paramTable.selectionModel().selectedRows():
-            name = str(self.paramTable.item(exp.row(), 0).text())
-            for line in self.nero.terminate_experiment(name):
+        names = [str(self.paramTable.item(exp.row(), 0).text())
+                 for exp in self.paramTable.selectionModel().selectedRows()]
+        names = [name for name in names if not self._is_sweep(name)]
+        with self.nero.transaction():
+            for line in self.nero.terminate_experiments(names):
                 self.experiment_log.insertPlainText(line)
                 QtGui.QApplication.processEvents()  
 	self.add_to_param_table()
@@ -286,11 +310,14 @@ class Nerogui(QtGui.QMainWindow, design.Ui_MainWindow):
     def change_cell(self,y,x):
         """if parameters experiments are edited, check and change them"""
         insertedLabels = set()
+        if self._is_sweep(str(self.paramTable.item(y, 0).text())):
+            return
         if x == 1:
             name = str(self.paramTable.item(y, 0).text())
             newParam = str(self.paramTable.item(y, x).text())
-            self.nero.database[name]._fields["custom_msg"]= newParam
-            self.nero.replace_experiment(self.nnerero.database[name])
+            experiment = self.nero.database[name]
+            experiment.custom_msg = newParam
+            self.nero.replace_experiment(experiment)
             self.add_to_param_table()
             
         if len(self.filteredLabels) == len(self.allLabels):
@@ -300,12 +327,13 @@ class Nerogui(QtGui.QMainWindow, design.Ui_MainWindow):
         if x > 3:
             name = str(self.paramTable.item(y, 0).text())
             param = tuple(insertedLabels)[x-4]
-            if not param in self.nero.database[name]._fields["parameters"]:
+            experiment = self.nero.database[name]
+            if not param in experiment.parameters:
                 self.add_to_param_table()
                 return
             newParam = str(self.paramTable.item(y, x).text())
-            self.nero.database[name]._fields["parameters"][param] = newParam
-            self.nero.replace_experiment(self.nero.database[name])
+            experiment.parameters[param] = newParam
+            self.nero.replace_experiment(experiment)
             self.add_to_param_table()
 
     def del_exp(self):
@@ -315,11 +343,14 @@ class Nerogui(QtGui.QMainWindow, design.Ui_MainWindow):
                   self.paramTable.selectedIndexes()))
         if not rows:
             return
-        for exp in rows:
-            name = str(self.paramTable.item(exp, 0).text())
-            for line in self.nero.delete_experiment(name):
-                self.experiment_log.insertPlainText(line)
-                QtGui.QApplication.processEvents()
+        with self.nero.transaction():
+            for exp in rows:
+                name = str(self.paramTable.item(exp, 0).text())
+                if self._is_sweep(name):
+                    continue
+                for line in self.nero.delete_experiment(name):
+                    self.experiment_log.insertPlainText(line)
+                    QtGui.QApplication.processEvents()
 	self.add_to_param_table()
 
     def highlight_row(self, y, x):
@@ -366,10 +397,11 @@ class Nerogui(QtGui.QMainWindow, design.Ui_MainWindow):
                   self.paramTable.selectedIndexes()))
         if not rows:
             return
-        for exp in rows:
-            name = str(self.paramTable.item(exp, 0).text())
-            for line in self.nero.duplicate_experiment(name, name+"-copy"):
-                self.experiment_log.insertPlainText(line)
+        with self.nero.transaction():
+            for exp in rows:
+                name = str(self.paramTable.item(exp, 0).text())
+                for line in self.nero.duplicate_experiment(name, name+"-copy"):
+                    self.experiment_log.insertPlainText(line)
         self.add_to_param_table()
 
     def exceptionHook(self, type, value, tracebackObj):
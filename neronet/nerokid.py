@@ -6,6 +6,9 @@ Attributes:
     for changes in the log file
   LOG_FILES (tuple): Log files for stdout and stderr
 
+  WORKER_MARGIN (float): how many times the longest experiment run by a
+    packing worker must fit in its remaining time to start another one
+
 Example usage:
     ## Unmanaged node example
     python nerokid exp1 --start
@@ -14,10 +17,14 @@ Example usage:
     #SBATCH --time=60
     python nerokid exp1 --start
     python nerokid exp1 --launch triton 12345
+    ## Packing worker running queued experiments two at a time
+    python nerokid --worker triton 12345 2 worker.sh
 """
 
 from __future__ import print_function
 import os
+import sys
+import time
 import subprocess
 import shlex
 import pickle
@@ -28,6 +35,7 @@ import neronet.experiment
 import neronet.neromum
 
 INTERVAL = 2.0
+WORKER_MARGIN = 1.5
 commands = ("status")
 
 class LogFile(object):
@@ -74,11 +82,12 @@ class Nerokid(neronet.daemon.Daemon):
         self.exp = None
         self.process = None
         self.terminated = False
+        self._doquit = False
         self.add_query('configure', self.qry_configure)
         self.add_query('terminate', self.qry_stop)
 
-    def qry_configure(self, host, port):
-        """Connect with Neromum.
+    def configure(self, host, port):
+        """Set the address of Neromum.
 
         Initializes the query interface.
         """
@@ -86,8 +95,24 @@ class Nerokid(neronet.daemon.Daemon):
                 neronet.neromum.Neromum(), host=host, port=int(port))
         self.log('Mom address: (%s, %d)' % (self.neromum.host,
                 self.neromum.port))
+
+    def qry_configure(self, host, port):
+        """Connect with Neromum."""
+        self.configure(host, port)
         self._reply['rv'] = 0
 
+    def step(self):
+        """Launch or monitor the experiment once in the foreground.
+
+        Used by workers to run experiments without a daemon for each.
+
+        Returns:
+            bool: Whether the experiment is still running
+        """
+        self._reply = {}
+        self.ontimeout()
+        return not self._doquit
+
     def qry_stop(self):
         """Terminate the experiment"""
         if self.process and self.process.poll() == None:
@@ -173,14 +198,152 @@ class Nerokid(neronet.daemon.Daemon):
             self.log('Experiment PID: %s' % (self.process.pid))
             self.exp.update_state(neronet.experiment.Experiment.State.running)
 
+def parse_duration(text):
+    """Parse a Slurm duration of the form [days-][[hours:]minutes:]seconds.
+
+    Returns:
+        int: The duration in seconds or None if it's unlimited or invalid
+    """
+    try:
+        days, _, clock = text.strip().rpartition('-')
+        seconds = 0
+        for part in clock.split(':'):
+            seconds = seconds * 60 + int(part)
+        return (int(days) if days else 0) * 24 * 3600 + seconds
+    except ValueError:
+        return None
+
+def walltime_left():
+    """Return the seconds left of the Slurm job running this process.
+
+    Returns:
+        int: The seconds or None if not in a Slurm job with a time limit
+    """
+    job_id = os.environ.get('SLURM_JOB_ID')
+    if not job_id:
+        return None
+    res = neronet.core.osrunroe('squeue -h -j %s -o %%L' % (job_id))
+    return parse_duration(res.out) if res.rv == 0 else None
+
+def claim_experiment(queue_dir):
+    """Take the next experiment waiting in the queue of the node.
+
+    An experiment is claimed by removing its queue file, which succeeds for
+    only one of the workers trying to claim it.
+
+    Returns:
+        str: The experiment ID or None if the queue is empty
+    """
+    try:
+        exp_ids = sorted(os.listdir(queue_dir))
+    except OSError:
+        return None
+    for exp_id in exp_ids:
+        try:
+            os.remove(os.path.join(queue_dir, exp_id))
+        except OSError:
+            continue # Claimed by another worker
+        return exp_id
+    return None
+
+class Worker(object):
+
+    """Runs queued experiments back to back within one Slurm allocation.
+
+    The worker runs up to `slots` experiments at a time with a Nerokid for
+    each in its own process. It stops when the queue is empty or when the
+    time left of its job is less than WORKER_MARGIN times the longest
+    experiment it has run. If experiments are left in the queue, the worker
+    resubmits its batch script, so the queue is eventually emptied. The job
+    IDs of the workers are recorded in the workers folder, see
+    neronet.neromum.live_workers.
+
+    Attributes:
+        host (str): The host of Neromum
+        port (int): The port of Neromum
+        slots (int): The number of experiments run at once
+        script (str): The batch script to resubmit or None
+    """
+
+    def __init__(self, host, port, slots=1, script=None):
+        self.host = host
+        self.port = int(port)
+        self.slots = int(slots)
+        self.script = script
+
+    def log(self, message):
+        sys.stdout.write('LOG %s  %s\n' % (time.strftime('%Y-%m-%d %H:%M:%S',
+                time.localtime()), message))
+        sys.stdout.flush()
+
+    def run(self):
+        """Run experiments until the queue is empty or the time runs out.
+
+        Returns:
+            int: The number of experiments run
+        """
+        queue_dir = os.path.join(neronet.core.USER_DATA_DIR_ABS,
+                                 neronet.neromum.QUEUE_DIR_NAME)
+        left = walltime_left()
+        deadline = time.time() + left if left is not None else None
+        longest = 0.0
+        running = []
+        count = 0
+        while True:
+            # Fill the free slots while there's time for another experiment
+            while len(running) < self.slots and (deadline is None or
+                    deadline - time.time() > WORKER_MARGIN * longest):
+                exp_id = claim_experiment(queue_dir)
+                if exp_id is None:
+                    break
+                self.log('Running experiment "%s"...' % (exp_id))
+                kid = Nerokid(exp_id)
+                kid.configure(self.host, self.port)
+                running.append((kid, time.time()))
+                count += 1
+            if not running:
+                break
+            for kid, started in list(running):
+                try:
+                    alive = kid.step()
+                except Exception as err:
+                    self.log('Experiment "%s" failed: %s' % (kid.exp_id, err))
+                    alive = False
+                if not alive:
+                    running.remove((kid, started))
+                    longest = max(longest, time.time() - started)
+            if running:
+                time.sleep(INTERVAL)
+        # The worker stops counting as live before the queue is checked, so
+        # experiments queued meanwhile get a new worker from either Neromum
+        # or this worker
+        job_id = os.environ.get('SLURM_JOB_ID')
+        if job_id:
+            try:
+                os.remove(os.path.join(neronet.core.USER_DATA_DIR_ABS,
+                        neronet.neromum.WORKERS_DIR_NAME,
+                        job_id + neronet.neromum.WORKER_JOB_SUFFIX))
+            except OSError:
+                pass
+        if self.script and os.path.isdir(queue_dir) and \
+                os.listdir(queue_dir):
+            self.log('Experiments left in the queue, resubmitting the '
+                     'worker...')
+            neronet.neromum.submit_worker(self.script)
+        return count
+
 def main():
     """Create a CLI interface object and process CLI arguments."""
 
-    import sys
-    
     if len(sys.argv) < 2:
         print('Kid experiment ID required!')
         sys.exit(1)
+    if sys.argv[1] == '--worker':
+        if len(sys.argv) < 5:
+            print('Usage: nerokid --worker HOST PORT SLOTS [SCRIPT]')
+            sys.exit(1)
+        Worker(*sys.argv[2:6]).run()
+        return
     exp_id = sys.argv[1]
     sys.argv.pop(1)
     #sys.argv = [sys.argv[0]] + sys.argv[2:]
@@ -25,42 +25,153 @@ import os
 import time
 import datetime
 import collections
+import contextlib
+import io
+import json
 import pickle
 import shutil
 import random
+import tarfile
+import tempfile
 import sys
+import uuid
 
 import neronet.config_parser
 import neronet.core
+import neronet.database
 import neronet.node
 import neronet.experiment
+import neronet.scheduler
+import neronet.sweep
 
 DATABASE_FILENAME = 'default.yaml'
+SQLITE_DATABASE_FILENAME = 'default.sqlite'
 NODES_FILENAME = 'nodes.yaml'
+PREFERENCES_FILENAME = 'preferences.yaml'
+# Sweeps larger than this are stored as virtual experiments, created only when
+# they are accessed
+VIRTUAL_SWEEP_SIZE = 1000
+# The number of nodes operated on at a time and the time limits in seconds of
+# querying a node and of fetching the results from a node
+NODE_WORKERS = 8
+NODE_QUERY_TIMEOUT = 30.0
+NODE_FETCH_TIMEOUT = 3600.0
 
 def formatstr(s, length):
     """return the string s so that it is lenght characters long adding spaces or truncating as necessary
     """
     return ("{:<"+str(length)+"}").format(s)[:length]
 
+def _exclude_compiled(tarinfo):
+    """Excludes compiled Python files from tar archives"""
+    name = os.path.basename(tarinfo.name)
+    if name == '__pycache__' or name.endswith(('.pyc', '.pyo')):
+        return None
+    return tarinfo
+
+class _PipeWriter(object):
+    """Writes to the standard input of a process, ignoring the errors of a
+    closed pipe
+
+    A process that exits early closes its end of the pipe; the error is then
+    reported by the process itself.
+
+    Attributes:
+        stream (file): The standard input of the process
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, data):
+        try:
+            self.stream.write(data)
+        except (IOError, OSError):
+            pass
+
+    def close(self):
+        try:
+            self.stream.close()
+        except (IOError, OSError):
+            pass
+
 class Neroman:
 
     """The part of Neronet that handles user side things.
 
     Attributes:
         nodes (dict): A dictionary containing the specified nodes
-        database (dict): A dictionary containing the specified experiments
+        database (Database): A dictionary containing the specified experiments
+        preferences (dict): A dictionary containing the user preferences
+
+    The database and the nodes are written to disk by the methods that change
+    them. Inside a transaction() block the writes are deferred and done once
+    when the block ends.
     """
 
     def __init__(self):
         """Initializes Neroman
 
-        Reads the contents of its attributes from yaml files or creates them
+        Reads the contents of its attributes from yaml files or creates them.
+        The experiment database backend is chosen by the 'database'
+        preference. The experiments themselves are loaded only when they are
+        accessed.
         """
         self.config_parser = neronet.config_parser.ConfigParser()
-        self.nodes, self.database = \
-            self.config_parser.load_configurations(NODES_FILENAME, \
-                    DATABASE_FILENAME)
+        self.preferences = \
+            self.config_parser.load_preferences(PREFERENCES_FILENAME)
+        self.nodes = self.config_parser.load_nodes(NODES_FILENAME)
+        if self.preferences['database'] == neronet.database.Backend.sqlite:
+            self.database = neronet.database.SQLiteDatabase( \
+                        SQLITE_DATABASE_FILENAME)
+        else:
+            self.database = neronet.database.JournalDatabase( \
+                        DATABASE_FILENAME, self.config_parser)
+        self.scheduler = neronet.scheduler.Scheduler(self.nodes['nodes'])
+        self._transaction_depth = 0
+        self._nodes_changed = False
+        # The digests of the runtimes known to be installed on the nodes
+        self._node_runtimes = {}
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Groups the database and node writes made inside the block
+
+        The changes are written to disk once when the outermost transaction
+        ends. They are written also when the block raises, as the work done
+        before the exception (e.g. experiments transferred to a node) has
+        already taken effect.
+
+        Example:
+            with nero.transaction():
+                for exp_id in exp_ids:
+                    nero.replace_experiment(nero.database[exp_id])
+        """
+        self._transaction_depth += 1
+        try:
+            yield self
+        finally:
+            self._transaction_depth -= 1
+            if not self._transaction_depth:
+                self._flush()
+
+    def save_database(self):
+        """Saves the experiment database unless inside a transaction"""
+        if not self._transaction_depth:
+            self._flush()
+
+    def save_nodes(self):
+        """Saves the nodes unless inside a transaction"""
+        self._nodes_changed = True
+        if not self._transaction_depth:
+            self._flush()
+
+    def _flush(self):
+        """Writes the pending changes of the nodes and the database"""
+        if self._nodes_changed:
+            self.config_parser.save_nodes(NODES_FILENAME, self.nodes)
+            self._nodes_changed = False
+        self.database.save()
 
     def specify_node(self, node_id, node_type, ssh_address):
         """Specify nodes so that Neroman is aware of them.
@@ -83,7 +194,7 @@ class Neroman:
             node.test_connection()
             yield('Node successfully accessed! Adding it...')
             self.nodes['nodes'][node_id] = node
-            self.config_parser.save_nodes(NODES_FILENAME, self.nodes)
+            self.save_nodes()
         except RuntimeError as e:
             yield('Error: %s' % (e))
 
@@ -97,65 +208,171 @@ class Neroman:
         """
         if node_id in self.nodes['nodes']:
             del self.nodes['nodes'][node_id]
-            self.config_parser.save_nodes(NODES_FILENAME, self.nodes)
+            self.save_nodes()
             yield('Node "%s" deleted.' % (node_id))
 
     def specify_experiments(self, folder):
         """Specify experiments so that Neroman is aware of them.
 
         Reads the contents of the experiment from a config file inside the
-        specified folder.
+        specified folder. Parameter sweeps of more than VIRTUAL_SWEEP_SIZE
+        experiments are added as sweeps whose experiments are created when
+        they are first accessed.
 
         Args:
             folder (str): The path of the folder that includes
                 the experiment that's being specified.
 
         Raises:
-            IOError: If the folder doesn't exists or the config file
-                doesn't exists
+            IOError: If the folder doesn't exists, the config file
+                doesn't exists or some of the experiments are already in the
+                database unchanged. The new experiments are added anyway.
             FormatError: If the config file is badly formated
 
         Returns:
-            changed_exps: A dictionary of changed experiments. 
+            changed_exps: A dictionary of changed experiments and sweeps.
                 This is then later used to prompt the user if they
                 want to replace the old experiment(s) with the new one(s).
         """
         if not os.path.isdir(folder):
             folder = os.path.dirname(folder)
-        experiments = self.config_parser.parse_experiments(folder)
+        sweeps = self.config_parser.parse_sweeps(folder)
+        new_exps, new_sweeps, changed_exps, err = \
+            self._sort_sweeps(sweeps, self._fingerprints())
+        with self.transaction():
+            self._add_sweeps(new_exps, new_sweeps)
+        if err: raise IOError('\n'.join(err))
+        return changed_exps
+
+    def specify_experiment_tree(self, root, processes=None):
+        """Specify the experiments of every experiment folder under a folder.
+
+        The config files are parsed in parallel, see
+        `ConfigParser.parse_sweep_tree`, and the experiments are added to the
+        database in a single write. A folder that can't be parsed or that
+        defines experiments already in the database unchanged is reported and
+        skipped without affecting the other folders.
+
+        Args:
+            root (str): The folder to search for experiment folders
+            processes (int): The number of parser processes, defaults to the
+                number of CPUs
+
+        Raises:
+            IOError: If the folder doesn't exist
+
+        Returns:
+            tuple: A dictionary of the changed experiments and sweeps, as
+            returned by specify_experiments, and a dictionary of the error
+            messages of the skipped folders
+        """
+        parsed, errors = self.config_parser.parse_sweep_tree(root, processes)
+        fingerprints = self._fingerprints()
+        changed_exps = {}
+        with self.transaction():
+            for folder, sweeps in parsed:
+                new_exps, new_sweeps, changed, err = \
+                    self._sort_sweeps(sweeps, fingerprints)
+                if err:
+                    errors[folder] = '\n'.join(err)
+                    continue
+                self._add_sweeps(new_exps, new_sweeps)
+                # Experiments of later folders with the same IDs are
+                # compared against these
+                for experiment in new_exps:
+                    fingerprints[experiment.id] = experiment.fingerprint
+                changed_exps.update(changed)
+        return changed_exps, errors
+
+    def _fingerprints(self):
+        """Returns the fingerprints of the experiments in the database"""
+        return dict((summary.id, summary.fingerprint) for summary in
+                    self.database.summaries(virtual=False))
+
+    def _sort_sweeps(self, sweeps, fingerprints):
+        """Sorts parsed sweeps by how they relate to the database contents
+
+        Parameter sweeps of more than VIRTUAL_SWEEP_SIZE experiments are kept
+        as sweeps and the others are split into experiments.
+
+        Args:
+            sweeps (list): The neronet.sweep.Sweep objects to sort
+            fingerprints (dict): The fingerprints of the experiments in the
+                database, see `_fingerprints`
+
+        Returns:
+            tuple: The lists of the new experiments and new sweeps, a
+            dictionary of the changed experiments and sweeps and a list of
+            error messages of the ones already in the database unchanged
+        """
+        experiments = []
+        large_sweeps = []
+        for sweep in sweeps:
+            if len(sweep) > VIRTUAL_SWEEP_SIZE:
+                large_sweeps.append(sweep)
+            else:
+                experiments.extend(sweep.experiments())
         err = []
-        #Look for changes in the relevant fields and add them to changed_exps.
-        #FIXME: Change this functionality so that the comaprison is done in the
-        #experiment side and not on neroman
+        # Experiments whose fingerprint differs from the one in the database
+        # have changed and are returned in changed_exps
+        has_sweeps = bool(self.database.sweeps())
         changed_exps = {}
-        relevant_fields = neronet.experiment.MANDATORY_FIELDS | \
-                        neronet.experiment.OPTIONAL_FIELDS | set('path')
+        new_exps = []
         for experiment in experiments:
-            if experiment.id in self.database:
-                for key in experiment._fields:
-                    if key in relevant_fields and self.database[experiment.id].__getattr__(key) \
-                                                    != experiment.__getattr__(key):
-                        changed_exps[experiment.id] = experiment
-                        break
+            if experiment.id not in fingerprints and not (has_sweeps and
+                                            experiment.id in self.database):
+                new_exps.append(experiment)
+                continue
+            fingerprint = fingerprints.get(experiment.id)
+            if fingerprint is None:
+                # Experiments defined by older versions and virtual
+                # experiments lack the fingerprint
+                fingerprint = \
+                    self.database[experiment.id].compute_fingerprint()
+            if fingerprint != experiment.fingerprint:
+                changed_exps[experiment.id] = experiment
+            else:
                 err.append("Experiment named %s already in the database" \
                             % experiment.id)
-            else: self.database[experiment.id] = experiment
-        self.config_parser.save_database(DATABASE_FILENAME, \
-                                    self.database)
-        if err: raise IOError('\n'.join(err))
-        return changed_exps
+        new_sweeps = []
+        for sweep in large_sweeps:
+            stored_sweep = self.database.sweeps().get(sweep.id)
+            if not stored_sweep:
+                new_sweeps.append(sweep)
+            elif stored_sweep.fingerprint != sweep.fingerprint:
+                changed_exps[sweep.id] = sweep
+            else:
+                err.append("Sweep named %s already in the database" \
+                            % sweep.id)
+        return new_exps, new_sweeps, changed_exps, err
+
+    def _add_sweeps(self, experiments, sweeps):
+        """Adds new experiments and sweeps to the database"""
+        for experiment in experiments:
+            self.database[experiment.id] = experiment
+        for sweep in sweeps:
+            self.database.add_sweep(sweep)
 
     def replace_experiment(self, new_experiment):
         """Replaces an experiment in the database with a new,
         updated instance of it.
 
+        The fingerprint of the experiment is recomputed, as the experiment
+        may have been edited in place.
+
         Parameters:
             new_experiment (neronet.experiment.Experiment): the experiment object
-                    to be put in the database in place of the old one.
+                    to be put in the database in place of the old one. May
+                    also be a neronet.sweep.Sweep returned by
+                    specify_experiments.
         """
+        if isinstance(new_experiment, neronet.sweep.Sweep):
+            self.database.add_sweep(new_experiment)
+            self.save_database()
+            return
+        new_experiment.fingerprint = new_experiment.compute_fingerprint()
         self.database[new_experiment.id] = new_experiment
-        self.config_parser.save_database(DATABASE_FILENAME, \
-                                        self.database)
+        self.save_database()
 
     def delete_experiment(self, experiment_id):
         """Deletes the experiment with the given experiment id
@@ -167,11 +384,10 @@ class Neroman:
         """
         if experiment_id not in self.database:
             raise IOError("Neroman: %s is not in database" % experiment_id)
-        if self.database[experiment_id]._fields['node_id']:
+        if self.database[experiment_id].node_id:
             self.terminate_experiment(experiment_id)
         self.database.pop(experiment_id)
-        self.config_parser.save_database(DATABASE_FILENAME, \
-                                        self.database)
+        self.save_database()
         yield "Experiment '%s' successfully deleted\n" % experiment_id
 
     def duplicate_experiment(self, experiment_id, new_experiment_id):
@@ -184,8 +400,7 @@ class Neroman:
         duplicated_experiment = neronet.experiment.duplicate_experiment( \
                                             experiment, new_experiment_id)
         self.database[new_experiment_id] = duplicated_experiment
-        self.config_parser.save_database(DATABASE_FILENAME, \
-                                        self.database)
+        self.save_database()
         yield "Copied experiment %s into %s\n" % (experiment_id, \
                                                 new_experiment_id)
 
@@ -239,19 +454,43 @@ class Neroman:
         yield "Successfully plotted experiments\n"
 
     def terminate_experiment(self, experiment_id):
-        if experiment_id in self.database:            
-            node_id = self.database[experiment_id]._fields['node_id']
+        return self.terminate_experiments([experiment_id])
+
+    def terminate_experiments(self, experiment_ids):
+        """Terminates experiments
+
+        The termination messages to each node are sent together.
+
+        Parameters:
+            experiment_ids (list): The IDs of the experiments
+
+        Yields:
+            str: A line for each experiment telling if its termination
+            message was sent, in the order of experiment_ids
+        """
+        lines = {}
+        by_node = collections.OrderedDict()
+        for experiment_id in experiment_ids:
+            if experiment_id not in self.database:
+                lines[experiment_id] = '"%s", No such experiment' % \
+                    (experiment_id)
+                continue
+            node_id = self.database[experiment_id].node_id
             if node_id:
-                node = self.nodes['nodes'][node_id]
-                try:
-                    node.terminate_exp(experiment_id)
-                    yield 'Termination message successfully sent to neromum'
-                except RuntimeError:
-                    yield 'Failed to terminate the given experiment. This could be a result of the experiment already being terminated or finished.'                
+                by_node.setdefault(node_id, []).append(experiment_id)
             else:
-                yield '"%s" hasn\'t been submitted to node or has already finished running' % (experiment_id)
-        else:
-            yield '"%s", No such experiment' % (experiment_id) 
+                lines[experiment_id] = '"%s" hasn\'t been submitted to node or has already finished running' % (experiment_id)
+        for node_id, node_experiment_ids in by_node.items():
+            node = self.nodes['nodes'][node_id]
+            try:
+                node.terminate_experiments(node_experiment_ids)
+                line = 'Termination message successfully sent to neromum'
+            except RuntimeError:
+                line = 'Failed to terminate the given experiment. This could be a result of the experiment already being terminated or finished.'
+            for experiment_id in node_experiment_ids:
+                lines[experiment_id] = line
+        for experiment_id in experiment_ids:
+            yield lines[experiment_id]
 
     def status_gen(self, arg):
         """Creates a generator that generates the polled status
@@ -265,8 +504,15 @@ class Neroman:
                     yield 'No nodes defined\n'
                 else:
                     yield '{0:<11} {1:<11} {2:<15} {3:<6} {4:<4} {5:<4}\n'.format('Name','Type','Address','Load', '%Mem', '%Dsk')
-                    for node in self.nodes['nodes'].values():
-                        resources = node.gather_resource_info()
+                    nodes = list(self.nodes['nodes'].values())
+                    # Query the nodes in parallel
+                    infos = neronet.core.parallel_map(
+                            lambda node: node.gather_resource_info(), nodes,
+                            NODE_WORKERS, NODE_QUERY_TIMEOUT)
+                    for node, (resources, err) in zip(nodes, infos):
+                        if err or resources['avgload'] is None:
+                            yield '{0:<11} {1:<11} {2:<15} unreachable\n'.format(node.cid, node.ctype, node.ssh_address[:15])
+                            continue
                         yield '{0:<11} {1:<11} {2:<15} {3:<6} {4:<4.3} {5:<4}\n'.format(node.cid, node.ctype, node.ssh_address[:15], resources['avgload'], 100.0*int(resources['usedmem'])/int(resources['totalmem']), resources['percentagediskspace'])
 
                 raise StopIteration
@@ -283,11 +529,10 @@ class Neroman:
                 yield "Type: %s\n" % node.ctype
                 yield "Experiments in node:\n"
                 noexperiments = True
-                for exp in self.database:
-                    if self.database[exp].node_id == node.cid:
-                        noexperiments = False
-                        yield "  Experiment id: %s, Status: %s\n" \
-                                % (exp, self.database[exp].state)
+                for exp in self.database.find(node_id=node.cid):
+                    noexperiments = False
+                    yield "  Experiment id: %s, Status: %s\n" \
+                            % (exp.id, exp.state)
                 if noexperiments: yield "  No experiments in node.\n"
                 resources = node.gather_resource_info()
                 yield "Average load 15min: %s\n" % resources['avgload']
@@ -313,116 +558,319 @@ class Neroman:
         if 'default_node' in self.nodes and self.nodes['default_node']:
             yield "Default Node: %s\n" % self.nodes['default_node']
         yield "\n=> Experiments =>\n"
-        if not len(self.database):
+        summaries_by_state = self._summaries_by_state()
+        sweeps = self.database.sweeps()
+        if not summaries_by_state and not sweeps:
             yield "No experiments defined\n"
         else:
-            experiments_by_state = self._experiments_by_state(self.database)
-            current = ""
             # Sort in descending order by state and then by ID
-            for state, experiments in sorted(experiments_by_state.iteritems()):
+            for state, summaries in sorted(summaries_by_state.items()):
                 yield "%s:\n" % state.capitalize()
-                for experiment in sorted(experiments, key=lambda e: e.id):
-                    exp_warnings_exist = experiment.has_warnings()
-                    yield str("- %s" % experiment.id) + ' ' + exp_warnings_exist + '\n'
-
-    def _experiments_by_state(self, experiments, state=None):
-        """Partitions the experiments in the database by state"""
-        experiments_by_state = collections.defaultdict(list)
-        for experiment in experiments.values():
-            if not state or experiment.state == state:
-                experiments_by_state[experiment.state].append(experiment)
-        return experiments_by_state
-
-    def submit(self, exp_id, node_id=""):
-        """Submit an experiment to a node using SSH.
+                for summary in sorted(summaries, key=lambda s: s.id):
+                    exp_warnings_exist = 'WARNING' if summary.warnings else ''
+                    yield str("- %s" % summary.id) + ' ' + exp_warnings_exist + '\n'
+            if sweeps:
+                yield "Sweeps:\n"
+                for sweep_id, sweep in sorted(sweeps.items()):
+                    yield "- %s (%d defined experiments)\n" \
+                            % (sweep_id, len(sweep) - len(sweep.taken))
+
+    def _summaries_by_state(self, state=None):
+        """Partitions the experiment summaries in the database by state"""
+        summaries_by_state = collections.defaultdict(list)
+        for summary in self.database.summaries(virtual=False):
+            if not state or summary.state == state:
+                summaries_by_state[summary.state].append(summary)
+        return summaries_by_state
+
+    def submit(self, exp_ids, node_id=""):
+        """Submit experiments to a node using SSH.
+
+        The experiments submitted to a node group are packed on its nodes by
+        the resources they request, see neronet.scheduler. The experiments of
+        each node are staged and transferred to it at once, after which
+        Neromum is started on the node.
 
         Args:
-            exp_id (str): the ID of the experiment.
-            node_id (str): the ID of the node.
+            exp_ids (str or list): The ID of an experiment or a collection,
+                or a list of them. The experiments of a collection that have
+                already been submitted are skipped.
+            node_id (str): the ID of the node or a node group.
+
+        Raises:
+            AttributeError: If the node or some of the experiments don't
+                exist. Nothing is submitted in that case.
+            Exception: If an experiment has already been submitted.
         """
-        # Determine the node
         if not node_id:
             node_id = self.nodes['default_node']
             if node_id == "":
                 raise AttributeError('No default node defined')
-        #if node_id in self.nodes['groups']:
-           # node_id = random.choice(self.nodes['groups'][node_id])
+        node_ids = self._target_nodes(node_id)
+        exps = self._experiments_to_submit(exp_ids)
+        if not exps:
+            raise AttributeError('No experiments to submit')
         if node_id in self.nodes['groups']:
-            avg_load = 999.0
-            cl_id = None
-            for cl in self.nodes['groups'][node_id]:
-                try:
-                    node = self.nodes['nodes'][cl]
-                    node.update_average_load(node.sshrun('uptime').out[-5:-1])
-                except RuntimeError:
-                    node.update_average_load("undefined")
-                    continue
-                self.config_parser.save_nodes(NODES_FILENAME, self.nodes)
-                if float(node.average_load) < avg_load:
-                    avg_load = node.average_load
-                    cl_id = cl
-                else:
-                    continue
-            if cl_id == None:
+            placement = self.scheduler.place(exps, node_ids,
+                                             self._queued_resources())
+        else:
+            placement = {node_id: exps}
+        with self.transaction():
+            for node_id, node_exps in placement.items():
+                for line in self._submit_to_node(node_exps, node_id):
+                    yield line
+
+    def _submit_to_node(self, exps, node_id):
+        """Transfers the experiments to the node and marks them submitted"""
+        node = self.nodes["nodes"][node_id]
+        # Update experiment info
+        for exp in exps:
+            exp.node_id = node_id
+            exp.update_state(neronet.experiment.Experiment.State.submitted)
+        handed = []
+        try:
+            for line in self._transfer(exps, node, handed):
+                yield line
+        except Exception:
+            # Keep the experiments the node didn't get unsubmitted so that a
+            # later save in the same transaction doesn't record the failed
+            # submission. The ones the node got are run there.
+            handed_ids = set(exp.id for exp in handed)
+            for exp in exps:
+                if exp.id not in handed_ids:
+                    exp.node_id = None
+                    exp.states_info.pop()
+            for exp in handed:
+                self.database[exp.id] = exp
+            # The node may have gone down since it was probed
+            self.scheduler.invalidate(node_id)
+            raise
+        # Assigning stores also the experiments read from virtual sweeps
+        for exp in exps:
+            self.database[exp.id] = exp
+
+    def _target_nodes(self, node_id):
+        """Returns the IDs of the nodes to submit to
+
+        Args:
+            node_id (str): The ID of a node or a node group
+
+        Raises:
+            AttributeError: If there is no such node or the group has no
+                nodes
+        """
+        if node_id in self.nodes['groups']:
+            group = [cl for cl in self.nodes['groups'][node_id]
+                     if cl in self.nodes['nodes']]
+            if not group:
                 raise AttributeError('No valid nodes in the node group')
-            else:
-                node_id = cl_id
+            return group
         elif node_id not in self.nodes['nodes']:
             raise AttributeError('The given node ID "%s" is not valid!' %
                     (node_id))
-        node = self.nodes["nodes"][node_id]
-        # Load the experiment
-        if exp_id not in self.database:
-            raise AttributeError('The given experiment ID "%s" is not valid!' %
-                    (exp_id))
-        exp = self.database[exp_id]
-
-        if exp.node_id != None:
-            raise Exception('Experiment already submitted to "%s"! '
-                    % (exp.node_id)  +
-             'If you wish to re-submit the same experiment, you need to wait for your experiment to finish or terminate it with "nerocli --terminate ID" where ID is the id of your experiment.')
-        # Update experiment info
-        exp.node_id = node_id
-        exp.update_state(neronet.experiment.Experiment.State.submitted)
-        self.config_parser.save_nodes(NODES_FILENAME, self.nodes)
-        # Define local path, where experiment currently exists
-        local_exp_path = exp.path
+        return [node_id]
+
+    def _queued_resources(self):
+        """Returns the resources requested by the experiments each node
+        hasn't started yet as neronet.scheduler.Demand tuples
+
+        The demands are read from the experiment summaries, so the
+        experiments aren't loaded."""
+        queued = collections.defaultdict(lambda: (0, 0))
+        for summary in self.database.summaries(virtual=False):
+            if summary.state in (
+                    neronet.experiment.Experiment.State.submitted,
+                    neronet.experiment.Experiment.State.submitted_to_kid):
+                cpus, mem_mb = summary.demand
+                queued_cpus, queued_mem = queued[summary.node_id]
+                queued[summary.node_id] = neronet.scheduler.Demand(
+                        queued_cpus + cpus, queued_mem + mem_mb)
+        return queued
+
+    def _experiments_to_submit(self, exp_ids):
+        """Returns the experiments of the given experiment and collection IDs
+
+        Raises:
+            AttributeError: If an ID is neither an experiment nor a
+                collection
+            Exception: If one of the experiments has already been submitted
+        """
+        if not isinstance(exp_ids, (list, tuple)):
+            exp_ids = [exp_ids]
+        exps = collections.OrderedDict()
+        for exp_id in exp_ids:
+            if exp_id in self.database:
+                exp = self.database[exp_id]
+                if exp.node_id != None:
+                    raise Exception('Experiment "%s" already submitted to '
+                        '"%s"! ' % (exp.id, exp.node_id) +
+                        'If you wish to re-submit the same experiment, you need to wait for your experiment to finish or terminate it with "nerocli --terminate ID" where ID is the id of your experiment.')
+                exps[exp.id] = exp
+                continue
+            collection = self.database.find(
+                    state=neronet.experiment.Experiment.State.defined,
+                    collection=exp_id)
+            if not collection and not self.is_experiment_id(exp_id):
+                raise AttributeError('The given experiment ID "%s" is not '
+                        'valid!' % (exp_id))
+            for exp in sorted(collection, key=lambda exp: exp.id):
+                if exp.node_id == None:
+                    exps[exp.id] = exp
+        return list(exps.values())
+
+    def is_experiment_id(self, exp_id):
+        """Tells whether the ID names an experiment or a collection
+
+        Args:
+            exp_id (str): An experiment or collection ID.
+
+        Returns:
+            bool: True if the ID is known to the database.
+        """
+        return exp_id in self.database or any(exp_id in summary.collection
+                for summary in self.database.summaries(virtual=False)) or \
+                any(exp_id in sweep.collection for sweep in
+                    self.database.sweeps().values())
+
+    def _transfer(self, exps, node, handed=None):
+        """Transfers the experiments to the node and starts Neromum there
+
+        The transfer method is chosen by the 'transfer' preference, see
+        neronet.node.Transfer.
+
+        Args:
+            exps (list): The experiments
+            node (neronet.node.Node): The node
+            handed (list): The experiments are appended to this list once
+                they have been transferred, after which the node runs them
+                even if starting Neromum fails
+        """
+        # The files to transfer as (path on the node, local path, content)
+        # where either the local path or the content is None
+        files = []
+        # Upload the Neronet source code files and executables only if the
+        # node doesn't already have the same version of them
+        digest = neronet.core.runtime_digest()
+        if self._node_runtimes.get(node.cid) != digest:
+            self._node_runtimes[node.cid] = node.runtime_digest()
+        if self._node_runtimes[node.cid] != digest:
+            files.append(('neronet', neronet.core.NERONET_ROOT_DIR, None))
+            files.append(('neronet/' + neronet.core.RUNTIME_DIGEST_FILENAME,
+                          None, digest))
+        # The experiment files are stored on the node by their digests, so
+        # only the files the node doesn't have yet are transferred and the
+        # files shared by the experiments are transferred once. Neromum links
+        # the files of each experiment into its folder as listed in the
+        # manifest of the experiment.
+        manifests = {}
+        sources = {}
+        for exp in exps:
+            manifest = manifests[exp.id] = {}
+            for file_path in exp.required_files + [exp.main_code_file]:
+                path = os.path.join(exp.path, file_path)
+                file_digest = neronet.experiment.file_digest(path)
+                if file_digest is None:
+                    raise IOError('File "%s" of experiment "%s" not found' %
+                                  (path, exp.id))
+                manifest[os.path.basename(file_path)] = file_digest
+                sources[file_digest] = path
+        for file_digest in node.missing_blobs(sorted(sources)):
+            files.append((neronet.core.BLOBS_DIR_NAME + '/' + file_digest,
+                          sources[file_digest], None))
+        # Serialize the node object
+        files.append(('node.pickle', None, pickle.dumps(node)))
+        for exp in exps:
+            exp_dir = 'experiments/' + exp.id
+            files.append((exp_dir + '/' + neronet.core.MANIFEST_FILENAME,
+                          None, json.dumps(manifests[exp.id])))
+            # Serialize the experiment object into the experiment folder
+            files.append((exp_dir + '/exp.pickle', None, pickle.dumps(exp)))
+        if self.preferences['transfer'] == neronet.node.Transfer.tar:
+            self._send_tar(files, node)
+        else:
+            self._send_rsync(files, node)
+        if handed is not None:
+            handed.extend(exps)
+        self._node_runtimes[node.cid] = digest
+        # Start the Neromum daemon
+        node.start_neromum()
+        for exp in exps:
+            yield("Experiment " + exp.id + " successfully submitted to " + node.cid + "\n")
+
+    def _send_rsync(self, files, node):
+        """Copies the files to a temporary folder and sends them to the node
+        with rsync"""
         # Define the remote path into which the files will be transferred to,
         # assuming it will be under the user's home directory
         remote_dir = neronet.core.USER_DATA_DIR
         # Define a temporary folder to contain all the required files
-        local_tmp_dir = '/tmp/.neronet-%s' % (exp.id)
-        # Define a folder for the files required by the experiment
-        local_tmp_exp_dir = os.path.join(local_tmp_dir, 'experiments', exp.id)
-        # Create the local temporary directories
-        os.makedirs(local_tmp_exp_dir)
-        # Define paths to required Neronet files
-        neronet_root_dir = os.path.dirname(os.path.abspath(__file__))
-        # Add Neronet source code files and executables to the temporary dir
-        neronet.core.osrun('rsync -az "%s" "%s"' %
-                (neronet_root_dir, local_tmp_dir))
-        # Add the experiment files
-        for file_path in exp.required_files + [exp.main_code_file]:
-            neronet.core.osrun('cp -p "%s" "%s"' %
-                (os.path.join(local_exp_path, file_path), local_tmp_exp_dir))
-        # Serialize the experiment object into the experiment folder
-        neronet.core.write_file(os.path.join(local_tmp_exp_dir, 'exp.pickle'),
-                pickle.dumps(exp))
-        # Finally, serialize the node object into the tmp folder
-        neronet.core.write_file(os.path.join(local_tmp_dir, 'node.pickle'),
-                pickle.dumps(node))
-        # Transfer the files to the remote server
+        local_tmp_dir = tempfile.mkdtemp(prefix='.neronet-')
         try:
-            neronet.core.osrun('rsync -az -e "ssh" "%s/" "%s:%s"' %
-                (local_tmp_dir, node.ssh_address, remote_dir))
-            # Start the Neromum daemon
-            node.start_neromum()
-            yield("Experiment " + exp_id + " successfully submitted to " + node_id + "\n")
+            for remote_path, path, data in files:
+                target = os.path.join(local_tmp_dir, remote_path)
+                if not os.path.isdir(os.path.dirname(target)):
+                    os.makedirs(os.path.dirname(target))
+                if data is not None:
+                    neronet.core.write_file(target, data)
+                elif os.path.isdir(path):
+                    neronet.core.osrun('rsync -az "%s/" "%s"' % (path, target))
+                else:
+                    neronet.core.osrun('cp -p "%s" "%s"' % (path, target))
+            # Transfer the files to the remote server. The updated files are
+            # put in place at the end so that an interrupted transfer doesn't
+            # leave a new runtime digest next to old runtime files.
+            neronet.core.osrun('rsync -az --delay-updates -e "%s" "%s/" '
+                '"%s:%s"' % (node.ssh_command(), local_tmp_dir,
+                             node.ssh_address, remote_dir))
         finally:
             # Remove the temporary directory
             shutil.rmtree(local_tmp_dir)
-        # Update the experiment database
-        self.config_parser.save_database(DATABASE_FILENAME, self.database)
+
+    def _send_tar(self, files, node):
+        """Streams the files to the node as a tar archive extracted there
+
+        The experiment folders are extracted into a temporary folder and
+        moved into place once the whole archive has been extracted, so that
+        Neromum doesn't see partially written experiments.
+
+        Raises:
+            IOError: If a local file couldn't be read
+            RuntimeError: If the files couldn't be extracted on the node
+        """
+        incoming_dir = '.incoming/' + uuid.uuid4().hex
+        proc = node.sshopen('mkdir -p experiments %s && tar -x && '
+                'for d in %s/*; do rm -rf experiments/${d##*/}; '
+                'mv $d experiments/; done; rm -rf %s' %
+                (incoming_dir, incoming_dir, incoming_dir))
+        pipe = _PipeWriter(proc.stdin)
+        try:
+            tar = tarfile.open(fileobj=pipe, mode='w|')
+            for remote_path, path, data in files:
+                if remote_path.startswith('experiments/'):
+                    remote_path = incoming_dir + \
+                        remote_path[len('experiments'):]
+                if data is None:
+                    tar.add(path, remote_path, filter=_exclude_compiled)
+                    continue
+                if not isinstance(data, bytes):
+                    data = data.encode('utf-8')
+                info = tarfile.TarInfo(remote_path)
+                info.size = len(data)
+                info.mtime = time.time()
+                info.mode = 0o644
+                tar.addfile(info, io.BytesIO(data))
+            tar.close()
+        except Exception:
+            proc.kill()
+            proc.wait()
+            raise
+        finally:
+            pipe.close()
+        err = proc.stderr.read()
+        proc.stdout.read()
+        if proc.wait() != 0:
+            raise RuntimeError('Failed to transfer the experiments to node '
+                               '"%s"! Err: %s' % (node.cid, err))
 
     def fetch(self):
         """Fetch results of submitted experiments."""
@@ -430,27 +878,27 @@ class Neroman:
         nodes_to_fetch = set()
         # Find out the experiments that have been submitted to some node
         # and the associated nodes
-        for exp in self.database.values():
-            if exp.node_id != None:
-                experiments_to_check.add(exp)
-                nodes_to_fetch.add(exp.node_id)
+        for exp in self.database.submitted():
+            experiments_to_check.add(exp)
+            nodes_to_fetch.add(exp.node_id)
         # Define source and destination directories
         remote_dir = os.path.join(neronet.core.USER_DATA_DIR,
                 'experiments')
         local_dir = os.path.join(neronet.core.USER_DATA_DIR_ABS,
                 'results')
-        # Fetch the changes from the nodes
-        for node_id in nodes_to_fetch:
-            yield('Fetching changes from node "%s"...' % (node_id))
-            # Load node details
-            node = self.nodes['nodes'][node_id]
+        # Fetch the changes from the nodes in parallel
+        nodes = [self.nodes['nodes'][node_id] for node_id in nodes_to_fetch]
+        for node in nodes:
+            yield('Fetching changes from node "%s"...' % (node.cid))
+        def fetch_node(node):
             # Fetch the files from the remote server
-            try:
-                neronet.core.osrun('rsync -az -e "ssh" "%s:%s/" "%s"' %
-                    (node.ssh_address, remote_dir, local_dir))
-            except RuntimeError:
+            neronet.core.osrun('rsync -az -e "%s" "%s:%s/" "%s"' %
+                (node.ssh_command(), node.ssh_address, remote_dir,
+                 local_dir))
+        for node, (_, err) in zip(nodes, neronet.core.parallel_map(
+                fetch_node, nodes, NODE_WORKERS, NODE_FETCH_TIMEOUT)):
+            if err:
                 yield('Err: Failed to fetch experiment results from node "%s".' % (node.cid))
-            # Clean the node
         plot_errors = []
         #Update Neroman database contents from the fetched pickles
         for exp in experiments_to_check:
@@ -460,6 +908,7 @@ class Neroman:
             if not os.path.exists(exp_file):
                 yield('ERR: Experiment pickle missing!')
                 exp.update_state(neronet.experiment.Experiment.State.lost)
+                self.database.touch(exp.id)
                 continue
             exp = self.database[exp.id] = pickle.loads(
                     neronet.core.read_file(exp_file))
@@ -482,19 +931,23 @@ class Neroman:
                             exp.plot_outputs()
                     except Exception as e:
                         yield str(e)
-        self.config_parser.save_database(DATABASE_FILENAME, self.database)
+        self.save_database()
         #Try to clean finished/terminated/lost experiments from remote nodes
-        for node_id in nodes_to_fetch:
-            node = self.nodes['nodes'][node_id]
-            node.start_neromum()
-            exceptions = [exp.id for exp in self.database.values() if exp.state
-                            in (neronet.experiment.Experiment.State.submitted,
+        exceptions = {}
+        for node in nodes:
+            exceptions[node.cid] = [exp.id for exp in
+                            self.database.find(node_id=node.cid)
+                            if exp.state in
+                            (neronet.experiment.Experiment.State.submitted,
                             neronet.experiment.Experiment.State.submitted_to_kid,
-                            neronet.experiment.Experiment.State.running) and exp.node_id == node_id]
-            try:
-                node.clean_experiments(exceptions)
-            except RuntimeError:
-                yield('Note: Failed to clean the experiments at the node.')
+                            neronet.experiment.Experiment.State.running)]
+        def clean_node(node):
+            node.start_neromum()
+            node.clean_experiments(exceptions[node.cid])
+        for node, (_, err) in zip(nodes, neronet.core.parallel_map(
+                clean_node, nodes, NODE_WORKERS, NODE_QUERY_TIMEOUT)):
+            if err:
+                yield('Note: Failed to clean the experiments at the node "%s".' % (node.cid))
 
 
     #def tail_log(self, exp_id=None):
@@ -7,9 +7,15 @@
 import os
 import pickle
 import glob
+import json
 import time
 import datetime
 import shutil
+import multiprocessing
+import collections
+import uuid
+import re
+import getpass
 
 import neronet.core
 import neronet.node
@@ -17,6 +23,141 @@ import neronet.daemon
 from neronet.experiment import Experiment as Exp
 import neronet.nerokid
 
+BLOB_GRACE_PERIOD = datetime.timedelta(minutes=10)
+"""timedelta: How long an unused blob is kept, so that the blobs of an
+experiment being transferred aren't removed before the experiment is loaded
+"""
+
+ARRAYS_DIR_NAME = 'arrays'
+"""str: The folder in the user data folder holding the scripts, index files
+and output of the Slurm job arrays"""
+
+ARRAY_PENDING_DIR_NAME = 'pending'
+"""str: The folder in the arrays folder holding an empty file for each
+experiment whose array task hasn't started yet"""
+
+ARRAY_MAX_SIZE = 1000
+"""int: The most experiments submitted as one job array, the default
+MaxArraySize of Slurm allows 1001"""
+
+QUEUE_DIR_NAME = 'queue'
+"""str: The folder in the user data folder holding an empty file for each
+experiment waiting for a worker in the pack Slurm mode"""
+
+WORKERS_DIR_NAME = 'workers'
+"""str: The folder in the user data folder holding the script and the output
+of the workers of the pack Slurm mode"""
+
+WORKER_JOB_SUFFIX = '.job'
+"""str: The suffix of the empty files in the workers folder named by the job
+IDs of the workers"""
+
+def submit_worker(script):
+    """Submits a worker of the pack Slurm mode
+
+    The job ID of the worker is recorded in the workers folder, so that the
+    workers can be counted, see `live_workers`.
+
+    Parameters:
+        script (str): The batch script of the worker
+
+    Raises:
+        RuntimeError: If sbatch fails
+    """
+    res = neronet.core.osrun('sbatch --parsable "%s"' % (script))
+    # The job ID may be followed by the name of the cluster
+    job_id = res.out.decode('utf-8').strip().split(';')[0]
+    workers_dir = os.path.join(neronet.core.USER_DATA_DIR_ABS,
+                               WORKERS_DIR_NAME)
+    if not os.path.isdir(workers_dir):
+        os.makedirs(workers_dir)
+    if job_id:
+        neronet.core.write_file(os.path.join(workers_dir,
+                                             job_id + WORKER_JOB_SUFFIX), '')
+
+def live_workers():
+    """Returns the job IDs of the workers of the pack Slurm mode that are
+    pending or running
+
+    The recorded jobs that squeue no longer lists are forgotten. If squeue
+    fails, all the recorded jobs are taken to be alive.
+    """
+    workers_dir = os.path.join(neronet.core.USER_DATA_DIR_ABS,
+                               WORKERS_DIR_NAME)
+    try:
+        job_ids = [name[:-len(WORKER_JOB_SUFFIX)] for name in
+                   os.listdir(workers_dir) if name.endswith(WORKER_JOB_SUFFIX)]
+    except OSError:
+        return []
+    if not job_ids:
+        return job_ids
+    res = neronet.core.osrunroe('squeue -h -u %s -o %%i' % (getpass.getuser()))
+    if res.rv != 0:
+        return job_ids
+    listed = set(res.out.decode('utf-8').split())
+    for job_id in job_ids:
+        if job_id not in listed:
+            try:
+                os.remove(os.path.join(workers_dir,
+                                       job_id + WORKER_JOB_SUFFIX))
+            except OSError:
+                pass
+    return [job_id for job_id in job_ids if job_id in listed]
+
+def link_files(exp_dir, blobs_dir):
+    """Creates the files of a submitted experiment from the blob store
+
+    The files listed in the manifest of the experiment are hard linked to
+    their blobs, or copied if the file system doesn't support hard links.
+    Files that already exist are left as they are. The linked files share
+    their content with the blob, so the experiments must not modify them in
+    place.
+
+    Parameters:
+        exp_dir (str): The folder of the experiment
+        blobs_dir (str): The folder of the blobs
+
+    Returns:
+        int: The number of files created
+    """
+    manifest_file = os.path.join(exp_dir, neronet.core.MANIFEST_FILENAME)
+    if not os.path.exists(manifest_file):
+        return 0
+    with open(manifest_file, 'r') as f:
+        manifest = json.load(f)
+    created = 0
+    for filename, digest in manifest.items():
+        path = os.path.join(exp_dir, filename)
+        if os.path.exists(path):
+            continue
+        blob = os.path.join(blobs_dir, digest)
+        try:
+            os.link(blob, path)
+        except (OSError, AttributeError):
+            shutil.copy2(blob, path)
+        created += 1
+    return created
+
+def collect_blobs(blobs_dir, grace_period=BLOB_GRACE_PERIOD):
+    """Removes the blobs that no experiment folder links to anymore
+
+    Parameters:
+        blobs_dir (str): The folder of the blobs
+        grace_period (timedelta): Blobs created or linked more recently are
+            kept
+
+    Returns:
+        int: The number of blobs removed
+    """
+    removed = 0
+    deadline = time.time() - grace_period.total_seconds()
+    for blob in glob.glob(os.path.join(blobs_dir, '*')):
+        stat = os.stat(blob)
+        if stat.st_nlink == 1 and stat.st_ctime < deadline:
+            os.remove(blob)
+            removed += 1
+    return removed
+
 class Neromum(neronet.daemon.Daemon):
 
     """A class to specify the Neromum object.
@@ -31,6 +172,8 @@ class Neromum(neronet.daemon.Daemon):
             experiment ID.
         idling (bool): A boolean that tells if the daemon is idling.
         node (Node): The node object related to this server.
+        slots (int): The number of experiments run at once on an unmanaged
+            node. Slurm nodes hand every experiment to Slurm.
     """
 
     def __init__(self):
@@ -45,6 +188,8 @@ class Neromum(neronet.daemon.Daemon):
         self.node = pickle.loads(neronet.core.read_file(os.path.join(
                 neronet.core.USER_DATA_DIR_ABS, 'node.pickle')))
         self._host = self.node.ssh_address
+        self.slots = getattr(self.node, 'slots', None) or \
+            multiprocessing.cpu_count()
 
     def qry_list_exps(self): # primarily for debugging
         """List all experiments submitted to this mum."""
@@ -73,6 +218,9 @@ class Neromum(neronet.daemon.Daemon):
         # Debugging
         if exp.state == Exp.State.finished:
             self.log('Experiment "%s" has finished!' % (exp.id))
+        # Give the freed slot to the next experiment right away
+        if exp.state in (Exp.State.finished, Exp.State.terminated):
+            self.launch_experiments()
         self._reply['rv'] = 0
     
     def qry_exp_warning(self, exp_id, warnings):
@@ -109,6 +257,13 @@ class Neromum(neronet.daemon.Daemon):
                     del self.exp_dict[exp_id]
                     experiments_cleaned_count += 1
                 msg += '%d experiments cleaned.\n' % (experiments_cleaned_count)
+                # Remove the files no remaining experiment uses. The new
+                # experiments are loaded first so that their files are linked.
+                self.load_experiments()
+                blobs_cleaned_count = collect_blobs(os.path.join(
+                        neronet.core.USER_DATA_DIR_ABS,
+                        neronet.core.BLOBS_DIR_NAME))
+                msg += '%d unused files cleaned.\n' % (blobs_cleaned_count)
             elif action == 'terminate_exp':
                 exp_id = data["exp_id"]
                 if exp_id in self.kids:
@@ -125,9 +280,11 @@ class Neromum(neronet.daemon.Daemon):
         self._reply['msgbody'] = msg
         self._reply['rv'] = 0
     
-    def ontimeout(self):
-        """Load and start any unstarted received experiments."""
-        # Load all experiments into the dict that have not yet been loaded
+    def load_experiments(self):
+        """Load the received experiments that have not yet been loaded and
+        create their files from the blob store."""
+        blobs_dir = os.path.join(neronet.core.USER_DATA_DIR_ABS,
+                                 neronet.core.BLOBS_DIR_NAME)
         for exp_file in glob.glob(os.path.join(neronet.core.USER_DATA_DIR_ABS,
                 'experiments/*/exp.pickle')):
             #self.log('Checking exp "%s"...' % (exp_file))
@@ -135,50 +292,216 @@ class Neromum(neronet.daemon.Daemon):
             if exp_id not in self.exp_dict:
                 exp = pickle.loads(neronet.core.read_file(exp_file))
                 self.log('New experiment detected: "%s" (%s)...' % (exp_id, exp.state))
+                link_files(os.path.dirname(exp_file), blobs_dir)
                 self.exp_dict[exp_id] = exp
-        # Start an experiment if there is any to start
-        for exp in self.exp_dict.values():
-            if exp.state == Exp.State.submitted_to_kid:
-                pass
-            elif exp.state == Exp.State.submitted:
+
+    def launch_experiments(self):
+        """Launch the received experiments that fit in the free slots.
+
+        The experiments are launched in the order they were submitted.
+
+        Returns:
+            int: The number of experiments launched
+        """
+        pending = sorted((exp for exp in self.exp_dict.values()
+                          if exp.state == Exp.State.submitted),
+                         key=lambda exp: (exp.states_info[-1][1], exp.id))
+        if self.node.ctype != neronet.node.Node.Type.slurm:
+            active = sum(1 for exp in self.exp_dict.values() if exp.state in
+                         (Exp.State.submitted_to_kid, Exp.State.running))
+            pending = pending[:max(self.slots - active, 0)]
+        slurm_mode = getattr(self.node, 'slurm_mode', None) \
+            if self.node.ctype == neronet.node.Node.Type.slurm else None
+        if slurm_mode == neronet.node.SlurmMode.array:
+            batches = self._array_batches(pending)
+        elif slurm_mode == neronet.node.SlurmMode.pack:
+            batches = [pending] if pending else []
+        else:
+            batches = [[exp] for exp in pending]
+        for batch in batches:
+            for exp in batch:
                 # Initialize the log output container
                 exp.log_output = {}
-                # Launch experiment
                 self.log('Launching experiment "%s"...' % (exp.id))
-                if self.node.ctype == neronet.node.Node.Type.slurm:
-                    exp_dir = os.path.join(neronet.core.USER_DATA_DIR_ABS,
-                            'experiments', exp.id)
-                    s = '#!/bin/bash\n'
-                    s += '#SBATCH -J %s -D %s -o slurm.log\n' % (exp.id, exp_dir)
-                    if self.node.sbatch_args: s += '#SBATCH %s\n' % (self.node.sbatch_args)
-                    if exp.sbatch_args: s += '#SBATCH %s\n' % (exp.sbatch_args)
-                    s += 'module load python/2.7.4\n'
-                    s += 'nerokid %s --start; sleep 4;\n' % (exp.id)
-                    s += 'nerokid %s --query configure %s %s; sleep 2m\n' % (exp.id, self._host, self._port)
-                    #s += 'srun nerokid %s --query configure %s %s\n' % (exp.id, self._host, self._port)
-                    sbatch_script = os.path.join(exp_dir, 'slurm.sh')
-                    neronet.core.write_file(sbatch_script, s)
-                    neronet.core.osrun('sbatch "%s"' % (sbatch_script))
-                else:
-                    # Launch experiment in the local (umanaged) node
-                    nerokid = neronet.daemon.QueryInterface(neronet.nerokid.Nerokid(exp.id))
-                    # Start the kid daemon
-                    nerokid.start()
-                    # Try to configure the kid
-                    time.sleep(3.0)
-                    nerokid.query('configure', host='localhost', port=self._port)
-                    #Add kid to self.kids so that it's possible to send messages to it later
-                    self.kids[exp.id] = nerokid
-                # Update the experiment state and timestamp
+            if slurm_mode == neronet.node.SlurmMode.array:
+                self.launch_array(batch)
+            elif slurm_mode == neronet.node.SlurmMode.pack:
+                self.launch_packed(batch)
+            else:
+                self.launch(batch[0])
+            # Update the experiment state and timestamp
+            for exp in batch:
                 exp.update_state(Exp.State.submitted_to_kid)
-                exp.time_modified = now = datetime.datetime.now()
-                return # pace submission by launching only one at a time
-        # Compute the number of lost experiments
+                exp.time_modified = datetime.datetime.now()
+        return len(pending)
+
+    def _array_batches(self, exps):
+        """Group experiments into job arrays by their collection and SBATCH
+        arguments, which are shared by the tasks of an array."""
+        groups = collections.OrderedDict()
+        for exp in exps:
+            key = (exp.collection[0] if exp.collection else exp.id,
+                   exp.sbatch_args)
+            groups.setdefault(key, []).append(exp)
+        return [group[i:i + ARRAY_MAX_SIZE] for group in groups.values()
+                for i in range(0, len(group), ARRAY_MAX_SIZE)]
+
+    def _slurm_script(self, directives, sbatch_args, commands):
+        """Return a batch script that runs the commands.
+
+        Slurm reads the SBATCH directives only before the first command, so
+        the commands are placed after them."""
+        s = '#!/bin/bash\n'
+        s += directives
+        if self.node.sbatch_args: s += '#SBATCH %s\n' % (self.node.sbatch_args)
+        if sbatch_args: s += '#SBATCH %s\n' % (sbatch_args)
+        s += 'module load python/2.7.4\n'
+        s += commands
+        return s
+
+    def _kid_commands(self, exp_id):
+        """Return the commands that run the experiment with a Nerokid."""
+        s = 'nerokid %s --start; sleep 4;\n' % (exp_id)
+        s += 'nerokid %s --query configure %s %s; sleep 2m\n' % (exp_id, self._host, self._port)
+        #s += 'srun nerokid %s --query configure %s %s\n' % (exp_id, self._host, self._port)
+        return s
+
+    def launch(self, exp):
+        """Launch an experiment with its own Nerokid."""
+        if self.node.ctype == neronet.node.Node.Type.slurm:
+            exp_dir = os.path.join(neronet.core.USER_DATA_DIR_ABS,
+                    'experiments', exp.id)
+            s = self._slurm_script('#SBATCH -J %s -D %s -o slurm.log\n'
+                    % (exp.id, exp_dir), exp.sbatch_args,
+                    self._kid_commands(exp.id))
+            sbatch_script = os.path.join(exp_dir, 'slurm.sh')
+            neronet.core.write_file(sbatch_script, s)
+            neronet.core.osrun('sbatch "%s"' % (sbatch_script))
+        else:
+            # Launch experiment in the local (umanaged) node. The kid is
+            # configured before it's forked, so it can report to Neromum as
+            # soon as it runs.
+            kid = neronet.nerokid.Nerokid(exp.id)
+            kid.configure('localhost', self._port)
+            nerokid = neronet.daemon.QueryInterface(kid)
+            # Start the kid daemon
+            nerokid.start()
+            #Add kid to self.kids so that it's possible to send messages to it later
+            self.kids[exp.id] = nerokid
+
+    def launch_array(self, exps):
+        """Launch experiments as a single Slurm job array.
+
+        The experiment IDs are written to an index file, one per line, and
+        each task of the array runs the experiment on the line of its array
+        index. An empty file named by the experiment ID is created in the
+        pending folder for each experiment and removed when its task starts,
+        so that the tasks Slurm hasn't started yet aren't taken as lost.
+
+        Parameters:
+            exps (list): The experiments, which share their SBATCH arguments
+        """
+        arrays_dir = os.path.join(neronet.core.USER_DATA_DIR_ABS,
+                                  ARRAYS_DIR_NAME)
+        pending_dir = os.path.join(arrays_dir, ARRAY_PENDING_DIR_NAME)
+        if not os.path.isdir(pending_dir):
+            os.makedirs(pending_dir)
+        for exp in exps:
+            neronet.core.write_file(os.path.join(pending_dir, exp.id), '')
+        collection = exps[0].collection[0] if exps[0].collection \
+            else exps[0].id
+        name = '%s-%s' % (re.sub(r'[^\w.-]', '_', collection),
+                          uuid.uuid4().hex[:8])
+        index_file = os.path.join(arrays_dir, name + '.index')
+        neronet.core.write_file(index_file,
+                                ''.join(exp.id + '\n' for exp in exps))
+        directives = '#SBATCH -J %s -D %s -o %s_%%a.log\n' % (name,
+                arrays_dir, name)
+        directives += '#SBATCH --array=0-%d\n' % (len(exps) - 1)
+        commands = 'EXP_ID=$(sed -n "$((SLURM_ARRAY_TASK_ID + 1))p" "%s")\n' \
+            % (index_file)
+        commands += 'rm -f "%s/$EXP_ID"\n' % (pending_dir)
+        commands += self._kid_commands('"$EXP_ID"')
+        s = self._slurm_script(directives, exps[0].sbatch_args, commands)
+        sbatch_script = os.path.join(arrays_dir, name + '.sh')
+        neronet.core.write_file(sbatch_script, s)
+        neronet.core.osrun('sbatch "%s"' % (sbatch_script))
+
+    def launch_packed(self, exps):
+        """Queue experiments for the workers of the pack Slurm mode.
+
+        An empty file named by the experiment ID is created in the queue
+        folder for each experiment. Worker jobs are submitted until there
+        are pack_workers of them pending or running, but at most one per
+        queued experiment. The workers run the queued experiments until the
+        queue is empty and resubmit themselves if their time runs out before
+        that, see neronet.nerokid.Worker. The SBATCH arguments of the
+        experiments aren't used, as the workers are shared.
+
+        Parameters:
+            exps (list): The experiments
+        """
+        queue_dir = os.path.join(neronet.core.USER_DATA_DIR_ABS,
+                                 QUEUE_DIR_NAME)
+        workers_dir = os.path.join(neronet.core.USER_DATA_DIR_ABS,
+                                   WORKERS_DIR_NAME)
+        for folder in (queue_dir, workers_dir):
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+        for exp in exps:
+            neronet.core.write_file(os.path.join(queue_dir, exp.id), '')
+        sbatch_script = os.path.join(workers_dir, 'worker.sh')
+        s = self._slurm_script('#SBATCH -J neronet-worker -D %s '
+                '-o worker_%%j.log\n' % (workers_dir), None,
+                'nerokid --worker %s %s %d "%s"\n' % (self._host, self._port,
+                getattr(self.node, 'slots', None) or 1, sbatch_script))
+        neronet.core.write_file(sbatch_script, s)
+        wanted = min(getattr(self.node, 'pack_workers', 1),
+                     len(self._queued_ids()))
+        for i in range(wanted - len(live_workers())):
+            submit_worker(sbatch_script)
+
+    def _queued_ids(self):
+        """Return the IDs of the experiments waiting for a worker."""
+        try:
+            return set(os.listdir(os.path.join(
+                    neronet.core.USER_DATA_DIR_ABS, QUEUE_DIR_NAME)))
+        except OSError:
+            return set()
+
+    def _pending_array_ids(self):
+        """Return the IDs of the experiments whose array task hasn't
+        started."""
+        try:
+            return set(os.listdir(os.path.join(neronet.core.USER_DATA_DIR_ABS,
+                    ARRAYS_DIR_NAME, ARRAY_PENDING_DIR_NAME)))
+        except OSError:
+            return set()
+
+    def _reap_kids(self):
+        """Collect the exit statuses of the exited launcher processes."""
+        try:
+            while os.waitpid(-1, os.WNOHANG)[0]:
+                pass
+        except OSError: # No child processes
+            pass
+
+    def ontimeout(self):
+        """Load and start any unstarted received experiments."""
+        # Load all experiments into the dict that have not yet been loaded
+        self.load_experiments()
+        # Start as many experiments as there are free slots
+        self.launch_experiments()
+        self._reap_kids()
+        # Compute the number of lost experiments. The experiments waiting
+        # for a worker or for their array task to start are still alive.
         lost_count = 0
         now = datetime.datetime.now()
+        queued = self._queued_ids() | self._pending_array_ids()
         for exp in self.exp_dict.values():
             if exp.state in (Exp.State.submitted_to_kid, Exp.State.running) \
-                    and exp.time_modified < now - datetime.timedelta(minutes=1):
+                    and exp.time_modified < now - datetime.timedelta(minutes=1) \
+                    and exp.id not in queued:
                 exp.update_state(Exp.State.lost)
                 lost_count += 1
         # Compute the number of finished experiments
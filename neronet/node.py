@@ -1,6 +1,52 @@
+import os
 import pickle
+import shlex
+import subprocess
+import tempfile
 
 import neronet.core
+import neronet.daemon
+
+SSH_CONTROL_DIR_NAME = 'ssh'
+"""str: The folder in the user data folder holding the sockets of the SSH
+master connections to the nodes
+"""
+
+SSH_CONTROL_PERSIST = 600
+"""int: How many seconds an idle SSH master connection is kept open"""
+
+class Transfer:
+    """A simple class to represent the ways to transfer experiments to nodes
+
+    rsync stages the files in a temporary folder and sends the changes with
+    rsync. tar streams them as an archive to tar running on the node without
+    a local copy.
+    """
+    rsync = 'rsync'
+    tar = 'tar'
+    _members = set(['rsync', 'tar'])
+
+    @classmethod
+    def is_member(cls, arg):
+        return arg in cls._members
+
+class SlurmMode:
+    """A simple class to represent the ways to submit experiments to Slurm
+
+    job submits a batch job for each experiment. array submits the
+    experiments of a collection as a single job array, whose tasks look up
+    their experiment IDs in an index file. pack queues the experiments on the
+    node and submits worker jobs that run them back to back until the queue
+    is empty or their time runs out.
+    """
+    job = 'job'
+    array = 'array'
+    pack = 'pack'
+    _members = set(['job', 'array', 'pack'])
+
+    @classmethod
+    def is_member(cls, arg):
+        return arg in cls._members
 
 class Node(object):
     """An object to represent nodes as used by Neronet
@@ -11,6 +57,13 @@ class Node(object):
         ssh_address (str): SSH address or config hostname corresponding to
             the node.
         sbatch_args (str): Slurm SBATCH arguments.
+        slots (int): The number of experiments run at once on an unmanaged
+            node, or None to run as many as the node has cores. In the pack
+            Slurm mode, the number of experiments a worker runs at once.
+        slurm_mode (str): How experiments are submitted to a Slurm node,
+            see SlurmMode
+        pack_workers (int): The most worker jobs submitted at once in the
+            pack Slurm mode
     """
 
 
@@ -25,14 +78,41 @@ class Node(object):
             return arg in cls._members
 
     def __init__(self, cid, ctype, ssh_address, sbatch_args=None, \
-                usr_dir=neronet.core.USER_DATA_DIR):
+                usr_dir=neronet.core.USER_DATA_DIR, slots=None,
+                slurm_mode=SlurmMode.job, pack_workers=1):
         self.cid = cid
         self.ctype = ctype
         self.ssh_address = ssh_address
         self.sbatch_args = sbatch_args
+        self.slots = slots
+        self.slurm_mode = slurm_mode
+        self.pack_workers = pack_workers
         self.dir = usr_dir
         #self.experiment_count = 0    
     
+    def ssh_command(self):
+        """Returns the SSH command used to connect to the node.
+
+        The connections to a node share a master connection, so only the
+        first one pays for connecting and authenticating. The master
+        connection is closed after it has been idle for SSH_CONTROL_PERSIST
+        seconds.
+
+        Returns:
+            str: The command without the address of the node"""
+        control_dir = os.path.join(neronet.core.USER_DATA_DIR_ABS,
+                                   SSH_CONTROL_DIR_NAME)
+        if not os.path.isdir(control_dir):
+            try:
+                os.makedirs(control_dir, 0o700)
+            except OSError:
+                # Created by another thread in the meanwhile
+                if not os.path.isdir(control_dir):
+                    raise
+        return ("ssh -o ControlMaster=auto -o 'ControlPath=%s' "
+                "-o ControlPersist=%d" % (os.path.join(control_dir, '%C'),
+                                          SSH_CONTROL_PERSIST))
+
     def sshrun(self, cmd, inp=None):
         """Execute a shell command via SSH on the remote Neronet node.
 
@@ -46,18 +126,8 @@ class Node(object):
         # Ask SSH to execute a command that starts by changing the working
         # directory to 'self.dir' at the machine served at the specified
         # address and port
-        scmd = 'ssh %s "cd %s;' % (self.ssh_address, self.dir)
-        # Potentially include initialization commands depending on node
-        # type
-        if self.ctype == self.Type.unmanaged:
-            pass
-        elif self.ctype == self.Type.slurm:
-            # Load the python 2.7 module to gain access to the interpreter
-            scmd += ' module load python/2.7.4;'
-        # Run the given command with the PATH and PYTHONPATH environment
-        # variables defined to include the neronet executables and modules
-        scmd += ' PATH="%s/neronet:/usr/local/bin:/usr/bin:/bin" PYTHONPATH="%s" %s"' \
-                % (self.dir, self.dir, cmd)
+        scmd = '%s %s "cd %s;%s"' % (self.ssh_command(), self.ssh_address,
+                                     self.dir, self._environment(cmd))
         # Actual execution
         res = neronet.core.osrunroe(scmd, inp=inp)
         if res.rv != 0:
@@ -69,6 +139,44 @@ class Node(object):
         return res
         # PATH="$HOME/.neronet/neronet:/usr/local/bin:/usr/bin:/bin" PYTHONPATH="$HOME/.neronet"
 
+    def _environment(self, cmd):
+        """Returns the command preceded by the setup of the Python
+        environment on the node"""
+        scmd = ''
+        # Potentially include initialization commands depending on node
+        # type
+        if self.ctype == self.Type.unmanaged:
+            pass
+        elif self.ctype == self.Type.slurm:
+            # Load the python 2.7 module to gain access to the interpreter
+            scmd += ' module load python/2.7.4;'
+        # Run the given command with the PATH and PYTHONPATH environment
+        # variables defined to include the neronet executables and modules
+        scmd += ' PATH=%s/neronet:/usr/local/bin:/usr/bin:/bin PYTHONPATH=%s %s' \
+                % (self.dir, self.dir, cmd)
+        return scmd
+
+    def sshopen(self, cmd, stderr=subprocess.PIPE):
+        """Start a shell command via SSH on the remote Neronet node.
+
+        The command is run in 'self.dir', which is created if needed, and
+        its standard input and output are pipes. Unlike in sshrun the
+        command isn't preceded by the Python environment setup.
+
+        Args:
+            cmd (str): The command
+            stderr (file): Where the standard error of the command goes, a
+                pipe by default
+
+        Returns:
+            subprocess.Popen: The SSH process"""
+        return subprocess.Popen(shlex.split(self.ssh_command()) +
+                                [self.ssh_address,
+                                 'mkdir -p %s && cd %s && %s' %
+                                 (self.dir, self.dir, cmd)],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=stderr)
+
     def test_connection(self):
         """A function to test connectivity to a node
         
@@ -92,7 +200,9 @@ class Node(object):
         try:
             info = self.sshrun('uptime; free -m; df -k .').out.split('\n')
         except RuntimeError:
-            return {avgload: None, totalmem: None, usedmem: None, totaldiskspace:None, useddiskspace: None, percentagediskspace: None}
+            return {'avgload': None, 'totalmem': None, 'usedmem': None,
+                    'totaldiskspace': None, 'useddiskspace': None,
+                    'percentagediskspace': None}
         results['avgload'] = info[0].split()[-1].replace(',', '.')
         memoryusage = info[2].split()
         results['totalmem'] = memoryusage[1]
@@ -103,24 +213,207 @@ class Node(object):
         results['percentagediskspace'] = diskspace[4]
         return results
 
+    def runtime_digest(self):
+        """Returns the digest of the neronet runtime installed on the node
+
+        Returns:
+            str: The digest written when the runtime was uploaded, see
+            `neronet.core.runtime_digest`, or None if there is no runtime or
+            the node can't be reached
+        """
+        try:
+            res = self.sshrun('cat neronet/%s' %
+                              neronet.core.RUNTIME_DIGEST_FILENAME)
+        except RuntimeError:
+            return None
+        return res.out.strip() or None
+
+    def missing_blobs(self, digests):
+        """Returns the digests of the files missing from the blob store of the
+        node
+
+        Args:
+            digests (list): SHA-1 hex digests of files
+
+        Returns:
+            list: The digests that don't have a blob on the node
+
+        Raises:
+            RuntimeError: If the node can't be reached
+        """
+        if not digests:
+            return []
+        res = self.sshrun('mkdir -p %s; cd %s; while read d; do '
+                          '[ -e $d ] || echo $d; done'
+                          % ((neronet.core.BLOBS_DIR_NAME,) * 2),
+                          inp='\n'.join(digests) + '\n')
+        return res.out.split()
+
     def start_neromum(self):
         res = self.sshrun('neromum --start')
 
+    def bridge(self):
+        """Returns a channel to the Neromum of the node
+
+        The channel is opened on first use and kept open, so that the
+        queries to Neromum don't each need an SSH connection. The standard
+        error of the channel goes to a temporary file, as a pipe nobody
+        reads would fill up and stall the remote end.
+
+        Returns:
+            Bridge: The channel
+        """
+        bridge = self.__dict__.get('_bridge')
+        if bridge is None or bridge.closed:
+            errors = tempfile.TemporaryFile()
+            bridge = self._bridge = Bridge(self.sshopen(
+                    self._environment('neromum --bridge'), stderr=errors),
+                    self.cid, errors)
+        return bridge
+
+    def close_bridge(self):
+        """Closes the channel to the Neromum of the node if it's open"""
+        bridge = self.__dict__.pop('_bridge', None)
+        if bridge is not None:
+            bridge.close()
+
+    def __getstate__(self):
+        # The channel to Neromum can't be pickled
+        state = dict(self.__dict__)
+        state.pop('_bridge', None)
+        return state
+
     def clean_experiments(self, exceptions):
         data = {'action': 'clean_experiments', 'exceptions': exceptions}
-        res = self.sshrun('neromum --input', inp=pickle.dumps(data, -1))
-        print(res.out)
-        if res.err:
-            print('Error: %s\n' % (res.err))
-    
+        reply = self.bridge().query('input', data)
+        print(reply.get('msgbody', ''))
+
     def terminate_exp(self, exp_id):
-        data = {'action': 'terminate_exp', 'exp_id': exp_id}
-        res = self.sshrun('neromum --input', inp=pickle.dumps(data, -1))
-        print(res.out)
-        if res.err:
-            print('Error: %s\n' % (res.err))
+        print(self.terminate_experiments([exp_id])[0])
+
+    def terminate_experiments(self, exp_ids):
+        """Asks Neromum to terminate experiments
+
+        The termination queries are pipelined over the channel to Neromum.
+
+        Args:
+            exp_ids (list): The IDs of the experiments
+
+        Returns:
+            list: The message of Neromum for each experiment
+
+        Raises:
+            RuntimeError: If Neromum can't be reached
+        """
+        replies = self.bridge().query_all(
+                [('input', ({'action': 'terminate_exp', 'exp_id': exp_id},),
+                  {}) for exp_id in exp_ids])
+        return [reply.get('msgbody', '') for reply in replies]
 
     def yield_status(self):
         data = {'action': 'fetch', 'msg': 'I love honeybees!'}
-        res = self.sshrun('neromum --input', inp=pickle.dumps(data, -1))
-        yield 'Finished: %d, "%s", "%s"' % (res.rv, res.err, res.out)
+        reply = self.bridge().query('input', data)
+        yield 'Finished: %d, "%s"' % (reply['rv'], reply.get('msgbody', ''))
+
+class Bridge(object):
+    """A channel for querying Neromum through `neromum --bridge`
+
+    The queries and the replies are sent as frames over the standard input
+    and output of the bridge process, see `neronet.daemon.Cli.bridge`. The
+    queries can be pipelined: `send` writes a query without waiting for the
+    reply and `receive` reads the replies in the order of the queries.
+
+    Attributes:
+        closed (bool): Whether the channel has been closed
+    """
+
+    PIPELINE_DEPTH = 64
+    """int: The maximum number of queries `query_all` sends before reading
+    their replies, so that the pipes between the processes don't fill up"""
+
+    def __init__(self, proc, node_id=None, errors=None):
+        """
+        Parameters:
+            proc (subprocess.Popen): The bridge process with piped standard
+                input and output
+            node_id (str): The ID of the node for the error messages
+            errors (file): The file the standard error of the process goes
+                to, if it isn't piped. The channel closes the file.
+        """
+        self._proc = proc
+        self._node_id = node_id
+        self._errors = errors
+        self.closed = False
+
+    def send(self, name, *args, **kwargs):
+        """Sends a query without waiting for its reply
+
+        Raises:
+            RuntimeError: If the channel has been closed
+        """
+        try:
+            neronet.daemon.write_frame(self._proc.stdin, {'name': name,
+                    'args': args, 'kwargs': kwargs})
+        except (IOError, OSError, ValueError):
+            self._fail()
+
+    def receive(self):
+        """Returns the reply of the earliest query whose reply hasn't been
+        received yet
+
+        Raises:
+            RuntimeError: If the channel has been closed
+        """
+        reply = neronet.daemon.read_frame(self._proc.stdout)
+        if reply is None:
+            self._fail()
+        return reply
+
+    def query(self, name, *args, **kwargs):
+        """Sends a query and returns its reply"""
+        self.send(name, *args, **kwargs)
+        return self.receive()
+
+    def query_all(self, queries):
+        """Sends queries pipelined and returns their replies
+
+        Parameters:
+            queries (list): The queries as (name, args, kwargs) tuples
+
+        Returns:
+            list: The replies in the order of the queries
+        """
+        replies = []
+        for start in range(0, len(queries), self.PIPELINE_DEPTH):
+            batch = queries[start:start + self.PIPELINE_DEPTH]
+            for name, args, kwargs in batch:
+                self.send(name, *args, **kwargs)
+            replies.extend(self.receive() for _ in batch)
+        return replies
+
+    def close(self):
+        """Closes the channel and waits for the bridge process to exit"""
+        self._close()
+        if self._errors is not None:
+            self._errors.close()
+
+    def _close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._proc.stdin.close()
+        except (IOError, OSError):
+            pass
+        self._proc.wait()
+
+    def _fail(self):
+        self._close()
+        if self._errors is not None and not self._errors.closed:
+            self._errors.seek(0)
+            err = self._errors.read()
+            self._errors.close()
+        else:
+            err = self._proc.stderr.read() if self._proc.stderr else ''
+        raise RuntimeError('The channel to Neromum at node "%s" was closed!'
+                           ' Err: %s' % (self._node_id, err))
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""This module defines the scheduler that places experiments on the nodes of
+a node group.
+
+The scheduler packs the experiments on the nodes by the cores and memory
+they request, see `Experiment.resources`, so that an experiment is placed on
+a node only if the node has the resources free for it. Among the nodes that
+fit, the one with the least load relative to its number of cores is chosen,
+which spreads the experiments evenly. The experiments that don't fit on any
+node right now are queued on the least loaded node that has enough cores and
+total memory to run them later.
+
+The load, memory and cores of the nodes are probed over SSH in parallel and
+cached for CACHE_TTL seconds in the user data folder, so submitting a whole
+sweep or several sweeps in a row takes at most one probe of each node. The
+experiments submitted to a node that it hasn't started yet are counted as
+used resources, as they aren't visible in the probed load.
+"""
+
+import os
+import json
+import time
+import collections
+
+import neronet.core
+
+CACHE_FILENAME = 'scheduler_cache.json'
+CACHE_TTL = 60.0
+"""float: How many seconds the probed node resources are used"""
+
+PROBE_TIMEOUT = 30.0
+"""float: The time limit of probing a node in seconds"""
+
+NodeInfo = collections.namedtuple('NodeInfo',
+                                  ['load', 'mem_mb', 'cores', 'total_mb'])
+"""namedtuple: The resources of a node: the one minute load average, the
+available memory in MiB, the number of cores and the total memory in MiB"""
+
+Demand = collections.namedtuple('Demand', ['cpus', 'mem_mb'])
+"""namedtuple: The cores and the memory in MiB an experiment needs"""
+
+def demand(experiment):
+    """Returns the resources requested by an experiment
+
+    Experiments that don't request resources need one core and no memory.
+
+    Parameters:
+        experiment (neronet.experiment.Experiment): The experiment
+
+    Returns:
+        Demand: The requested resources
+    """
+    return demand_of(getattr(experiment, 'resources', None))
+
+def demand_of(resources):
+    """Returns the Demand of the resources field of an experiment or its
+    record, see `demand`"""
+    resources = resources or {}
+    return Demand(resources.get('cpus', 1), resources.get('mem_mb', 0))
+
+def probe(node):
+    """Probes the resources of a node over SSH
+
+    Parameters:
+        node (neronet.node.Node): The node
+
+    Returns:
+        NodeInfo: The resources of the node
+
+    Raises:
+        RuntimeError: If the node can't be reached
+        ValueError: If the output of the commands can't be parsed
+    """
+    lines = node.sshrun('nproc; cat /proc/loadavg; free -m').out.split('\n')
+    cores = int(lines[0])
+    load = float(lines[1].split()[0])
+    mem_mb = total_mb = None
+    for line in lines[2:]:
+        fields = line.split()
+        if fields and fields[0] == 'Mem:':
+            total_mb = int(fields[1])
+            # Newer versions of free report the available memory, which
+            # includes the reclaimable caches
+            mem_mb = int(fields[6] if len(fields) > 6 else fields[3])
+    if mem_mb is None:
+        raise ValueError('No memory information from node "%s"' % node.cid)
+    return NodeInfo(load, mem_mb, cores, total_mb)
+
+class Scheduler(object):
+    """Places experiments on the nodes of node groups
+
+    Attributes:
+        nodes (dict): The neronet.node.Node objects by their IDs
+        ttl (float): How many seconds the probed resources are used
+    """
+
+    def __init__(self, nodes, ttl=CACHE_TTL):
+        self.nodes = nodes
+        self.ttl = ttl
+        self._cache = None
+
+    @property
+    def _cache_path(self):
+        return os.path.join(neronet.core.USER_DATA_DIR_ABS, CACHE_FILENAME)
+
+    def _load_cache(self):
+        if self._cache is None:
+            try:
+                with open(self._cache_path, 'r') as f:
+                    self._cache = json.load(f)
+            except (IOError, OSError, ValueError):
+                self._cache = {}
+        return self._cache
+
+    def _save_cache(self):
+        tmp_path = self._cache_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._cache, f)
+        os.rename(tmp_path, self._cache_path)
+
+    def node_info(self, node_ids):
+        """Returns the resources of the nodes
+
+        The nodes whose resources haven't been probed in the last `ttl`
+        seconds are probed in parallel. Failed probes are cached too, so an
+        unreachable node doesn't slow down every submission.
+
+        Parameters:
+            node_ids (list): The IDs of the nodes
+
+        Returns:
+            dict: The NodeInfo of each node, or None for the nodes that
+            couldn't be probed
+        """
+        cache = self._load_cache()
+        now = time.time()
+        # Entries written before a field was added to NodeInfo are stale too
+        stale = [node_id for node_id in node_ids if node_id not in cache or
+                 now - cache[node_id]['time'] >= self.ttl or
+                 len(cache[node_id]['info'] or NodeInfo._fields) !=
+                 len(NodeInfo._fields)]
+        if stale:
+            results = neronet.core.parallel_map(
+                    lambda node_id: probe(self.nodes[node_id]), stale,
+                    timeout=PROBE_TIMEOUT)
+            for node_id, (info, err) in zip(stale, results):
+                cache[node_id] = {'time': now,
+                                  'info': list(info) if err is None else None}
+            self._save_cache()
+        return dict((node_id, NodeInfo(*cache[node_id]['info'])
+                     if cache[node_id]['info'] else None)
+                    for node_id in node_ids)
+
+    def invalidate(self, node_id):
+        """Forgets the resources of the node so that it's probed again"""
+        if self._load_cache().pop(node_id, None) is not None:
+            self._save_cache()
+
+    def place(self, experiments, node_ids, queued=None):
+        """Packs experiments on nodes
+
+        The experiments are placed in the order of decreasing demand, so
+        that the small experiments fill the space left by the large ones.
+        Each experiment goes to the node with the least used cores per core
+        among the nodes that have the cores and memory free for it, counting
+        the load of the node rounded to whole cores, the experiments queued
+        on the node and the ones placed before it. Ties go to the node
+        listed first. If the experiment doesn't fit on any node, it's queued
+        on the least loaded node with the cores and total memory to run it once
+        the node is idle.
+
+        Parameters:
+            experiments (list): The experiments to place
+            node_ids (list): The IDs of the nodes to place them on
+            queued (dict): The Demand of the experiments submitted to each
+                node that it hasn't started yet
+
+        Returns:
+            OrderedDict: The lists of the experiments placed on each node,
+            in the order of node_ids and of experiments. Only nodes that got
+            experiments are included.
+
+        Raises:
+            AttributeError: If none of the nodes can be reached or an
+                experiment needs more resources than any node has
+        """
+        queued = queued or {}
+        infos = self.node_info(node_ids)
+        bins = []
+        for order, node_id in enumerate(node_ids):
+            info = infos[node_id]
+            if info is None:
+                continue
+            queued_cpus, queued_mem = queued.get(node_id, (0, 0))
+            bins.append({'order': order, 'node_id': node_id,
+                         'cores': max(info.cores, 1), 'mem_mb': info.mem_mb,
+                         'total_mb': info.total_mb,
+                         'cpus_used': int(round(info.load)) + queued_cpus,
+                         'mem_used': queued_mem})
+        if not bins:
+            raise AttributeError('No valid nodes in the node group')
+        demands = [demand(experiment) for experiment in experiments]
+        placement = dict((node_id, []) for node_id in node_ids)
+        for index in sorted(range(len(experiments)), key=lambda index:
+                            (-demands[index].cpus, -demands[index].mem_mb,
+                             index)):
+            cpus, mem_mb = demands[index]
+            fitting = [b for b in bins
+                       if b['cores'] - b['cpus_used'] >= cpus and
+                       b['mem_mb'] - b['mem_used'] >= mem_mb]
+            if not fitting:
+                fitting = [b for b in bins
+                           if b['cores'] >= cpus and b['total_mb'] >= mem_mb]
+            if not fitting:
+                experiment = experiments[index]
+                raise AttributeError('No node has the %d cores and %d MiB '
+                                     'of memory requested by experiment %s'
+                                     % (cpus, mem_mb, getattr(experiment,
+                                        'id', experiment)))
+            chosen = min(fitting, key=lambda b: (
+                b['cpus_used'] / float(b['cores']), b['order']))
+            chosen['cpus_used'] += cpus
+            chosen['mem_used'] += mem_mb
+            placement[chosen['node_id']].append(index)
+        return collections.OrderedDict(
+                (node_id, [experiments[index]
+                           for index in sorted(placement[node_id])])
+                for node_id in node_ids if placement[node_id])
@@ -3,8 +3,11 @@
 It is important to make sure the functions work as the error messages can be 
 varied and messy to handle. The software raises ImportError if there is 
 something wrong with importing or running the code.
+
+The module is imported whenever experiments using it are checked, so the
+plotting functions import matplotlib only when they are called.
 """
-import matplotlib.pyplot as plt
+import neronet.core
 
 def line_reader(line, names, sep=', ', *args):
     """ Maps a line of output to names given as string
@@ -69,6 +72,7 @@ def plot(filename, feedback, save_image, y, x=None, *args):
         return feedback
     else:
         #Creates and plots the current figure
+        plt = neronet.core.import_pyplot()
         fig = plt.figure()
         ax = fig.add_subplot(111)
         ax.plot(x[1],y[1])
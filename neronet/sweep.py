@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""This module defines parameter sweeps.
+
+A sweep is the set of experiments defined by one experiment ID of a config
+file: one experiment for each combination of the parameter values. The sweep
+is described compactly by the experiment definition and the value lists of
+the parameters, and its experiments are created one at a time when they are
+needed, so even grids of millions of points take little memory.
+
+The experiments are numbered in the order of `itertools.product` over the
+parameters sorted by name, the last parameter varying fastest. The
+definition of the experiment with a given number is computed directly by
+treating the number as a mixed radix number whose digits are the indices of
+the parameter values.
+"""
+
+import datetime
+import hashlib
+import itertools
+import json
+import os
+
+import neronet.experiment
+
+class Sweep(object):
+    """The experiments defined by varying the parameters of a definition
+
+    Attributes:
+        definition (dict): The Experiment keyword arguments shared by the
+            experiments. The parameters map names to single values or lists
+            of values and the conditions are dictionaries of the
+            ExperimentWarning arguments.
+        time_created (datetime): Timestamp of when the sweep was defined
+        taken (set): Numbers of the experiments that have been created or
+            deleted, used by the database to track virtual experiments
+        fingerprint (str): Hash of the definition and the code files when
+            the sweep was defined, see `compute_fingerprint`
+    """
+
+    def __init__(self, definition, time_created=None, taken=None,
+                 fingerprint=None):
+        self.definition = definition
+        self.time_created = time_created or datetime.datetime.now()
+        self.taken = set(taken) if taken else set()
+        parameters = definition.get('parameters')
+        self._keys = sorted(parameters) if parameters is not None else []
+        self._values = [parameters[key] if isinstance(parameters[key], list)
+                        else [parameters[key]] for key in self._keys]
+        self._strides = []
+        stride = 1
+        for values in reversed(self._values):
+            self._strides.insert(0, stride)
+            stride *= len(values)
+        # A definition without parameters defines no experiments
+        self._length = stride if parameters is not None else 0
+        self.fingerprint = fingerprint or self.compute_fingerprint()
+
+    @property
+    def id(self):
+        return self.definition['experiment_id']
+
+    @property
+    def collection(self):
+        """The collection of the experiments as a list"""
+        collection = self.definition.get('collection') or \
+            [os.path.basename(self.definition['path'])]
+        return collection if isinstance(collection, list) else [collection]
+
+    def __len__(self):
+        return self._length
+
+    def _name(self, parameters):
+        """Returns the experiment ID for the parameter values"""
+        if self._length == 1:
+            return self.id
+        return '_'.join([self.id] + [key + '-' + str(parameters[key])
+                                     for key in self._keys])
+
+    def _create_definition(self, parameters):
+        definition = dict(self.definition)
+        definition['parameters'] = parameters
+        definition['experiment_id'] = self._name(parameters)
+        return definition
+
+    def __getitem__(self, index):
+        """Returns the definition of the experiment with the given number"""
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        parameters = {}
+        for key, values, stride in zip(self._keys, self._values,
+                                       self._strides):
+            parameters[key] = values[index // stride % len(values)]
+        return self._create_definition(parameters)
+
+    def __iter__(self):
+        """Generates the definitions of the experiments in order"""
+        if not self._length:
+            return
+        for values in itertools.product(*self._values):
+            yield self._create_definition(dict(zip(self._keys, values)))
+
+    def ids(self):
+        """Generates the (number, experiment ID) of each experiment"""
+        if not self._length:
+            return
+        for index, values in enumerate(itertools.product(*self._values)):
+            yield index, self._name(dict(zip(self._keys, values)))
+
+    def index(self, exp_id):
+        """Returns the number of the experiment with the given ID, or None if
+        the ID isn't one of the experiments of the sweep"""
+        if self._length == 1:
+            return 0 if exp_id == self.id else None
+        prefix = self.id + '_'
+        if not self._length or not exp_id.startswith(prefix):
+            return None
+        return self._match(exp_id[len(prefix):], 0)
+
+    def _match(self, rest, k):
+        """Matches the remaining "key-value_..." part of an experiment ID
+        starting from the kth parameter and returns the number it encodes"""
+        head = self._keys[k] + '-'
+        if not rest.startswith(head):
+            return None
+        rest = rest[len(head):]
+        last = k == len(self._keys) - 1
+        for position, value in enumerate(self._values[k]):
+            value = str(value)
+            if last:
+                if rest == value:
+                    return position
+            elif rest.startswith(value + '_'):
+                index = self._match(rest[len(value) + 1:], k + 1)
+                if index is not None:
+                    return position * self._strides[k] + index
+        return None
+
+    def _create_experiment(self, definition):
+        if definition.get('conditions'):
+            definition['conditions'] = dict((name,
+                    neronet.experiment.ExperimentWarning(**condition))
+                    for name, condition in definition['conditions'].items())
+        experiment = neronet.experiment.Experiment(**definition)
+        experiment.time_created = self.time_created
+        experiment.time_modified = self.time_created
+        experiment.states_info = [(experiment.state, self.time_created)]
+        return experiment
+
+    def experiment(self, index):
+        """Creates the experiment with the given number"""
+        return self._create_experiment(self[index])
+
+    def experiments(self):
+        """Generates the experiments in order"""
+        for definition in self:
+            yield self._create_experiment(definition)
+
+    def compute_fingerprint(self):
+        """Computes a hash of the definition and the content of the code
+        files, see `Experiment.compute_fingerprint`"""
+        code = [(filename, neronet.experiment.file_digest(
+                    os.path.join(self.definition['path'], filename)))
+                for filename in [self.definition['main_code_file']] +
+                list(self.definition.get('required_files') or [])]
+        return hashlib.sha1(json.dumps([self.definition, code],
+                                       sort_keys=True, default=str
+                                       ).encode('utf-8')).hexdigest()
+
+    def to_record(self):
+        """Converts the sweep into a record of plain data types"""
+        return {'definition': self.definition,
+                'time_created': neronet.experiment._time_to_record(
+                    self.time_created),
+                'taken': sorted(self.taken),
+                'fingerprint': self.fingerprint}
+
+    @classmethod
+    def from_record(cls, record):
+        """Creates a sweep from a record made by `to_record`"""
+        return cls(record['definition'],
+                   neronet.experiment._time_from_record(
+                       record['time_created']),
+                   record['taken'], record['fingerprint'])
@@ -1,5 +1,13 @@
 import unittest
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import yaml
 from neronet.node import Node
+import neronet.experiment
 from neronet.experiment import Experiment, ExperimentWarning
 
 class Neronet_test(unittest.TestCase):
@@ -95,5 +103,74 @@ class Neronet_test(unittest.TestCase):
         e.update_state(Experiment.State.submitted)
         self.assertEqual(len(e._fields['states_info']), 2)
 
+    def test_experiment_record(self):
+
+        c = {'name' : ExperimentWarning("name", "var1", 50.0, "gt", "immediately", "kill")}
+        e = Experiment("exp1", "python", "run.py", "/tmp/exp",
+                    {'param1': 20, 'param2' : 30}, "{param1} {param2}", conditions=c)
+        e.update_state(Experiment.State.submitted)
+        record = e.to_record()
+        self.assertEqual(record['version'], 1)
+        self.assertEqual(record['states_info'][-1][0], 'submitted')
+        self.assertEqual(yaml.safe_load(yaml.safe_dump(record)), record)
+
+        r = Experiment.from_record(json.loads(json.dumps(record)))
+        self.assertEqual(r.id, "exp1")
+        self.assertEqual(r.callstring, "python run.py 20 30")
+        self.assertEqual(r.state, Experiment.State.submitted)
+        self.assertEqual(r.time_created, e.time_created)
+        self.assertEqual(r.conditions, e.conditions)
+        self.assertEqual(r.get_action("var1 60"), ("kill", "name"))
+        # Shared fields of records loaded from JSON share memory
+        other = Experiment.from_record(json.loads(json.dumps(record)))
+        self.assertIs(other.run_command_prefix, r.run_command_prefix)
+        self.assertIs(other.path, r.path)
+
+    def test_shared_strings_are_bounded(self):
+
+        for i in range(neronet.experiment.SHARED_STRINGS_MAX_SIZE + 10):
+            neronet.experiment._intern(u'/tmp/exp%d' % i)
+        self.assertLessEqual(len(neronet.experiment._shared_strings),
+                             neronet.experiment.SHARED_STRINGS_MAX_SIZE)
+
+    def test_experiment_slots(self):
+
+        e = Experiment("exp1", "python", "run.py", "/tmp/exp",
+                    {'param1': 20}, "{param1}")
+        self.assertFalse(hasattr(e, '__dict__'))
+        p = pickle.loads(pickle.dumps(e, 0))
+        self.assertEqual(p.callstring, "python run.py 20")
+        legacy = yaml.load("""!!python/object:neronet.experiment.Experiment
+_experiment_id: exp2
+_fields: {run_command_prefix: python, main_code_file: run.py,
+    parameters: {param1: 20}, parameters_format: '{param1}',
+    path: /tmp/exp, states_info: [[defined, 2016-01-01 00:00:00]]}
+""", Loader=yaml.Loader)
+        self.assertEqual(legacy.id, "exp2")
+        self.assertEqual(legacy.callstring, "python run.py 20")
+        self.assertEqual(legacy.state, Experiment.State.defined)
+
+    def test_experiment_fingerprint(self):
+
+        folder = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(folder, "run.py"), "w") as f:
+                f.write("print(1)")
+            e = Experiment("exp1", "python", "run.py", folder,
+                        {'param1': 20}, "{param1}")
+            same = Experiment("exp1", "python", "run.py", folder,
+                        {'param1': 20}, "{param1}")
+            other = Experiment("exp1", "python", "run.py", folder,
+                        {'param1': 21}, "{param1}")
+            self.assertEqual(e.fingerprint, same.fingerprint)
+            self.assertNotEqual(e.fingerprint, other.fingerprint)
+            with open(os.path.join(folder, "run.py"), "w") as f:
+                f.write("print(2)\n")
+            self.assertNotEqual(e.fingerprint, e.compute_fingerprint())
+            r = Experiment.from_record(e.to_record())
+            self.assertEqual(r.fingerprint, e.fingerprint)
+        finally:
+            shutil.rmtree(folder)
+
 if __name__ == '__main__':
     unittest.main()
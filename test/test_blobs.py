@@ -0,0 +1,59 @@
+import unittest
+import tempfile
+import os
+import shutil
+import json
+import datetime
+
+import neronet.core
+import neronet.neromum
+
+
+class TestBlobs(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.blobs_dir = os.path.join(self.folder, 'blobs')
+        os.mkdir(self.blobs_dir)
+        with open(os.path.join(self.blobs_dir, 'a1'), 'w') as f:
+            f.write('print(1)')
+        with open(os.path.join(self.blobs_dir, 'b2'), 'w') as f:
+            f.write('data')
+        self.exp_dirs = []
+        for exp_id in ('exp1', 'exp2'):
+            exp_dir = os.path.join(self.folder, exp_id)
+            os.mkdir(exp_dir)
+            with open(os.path.join(exp_dir, neronet.core.MANIFEST_FILENAME),
+                      'w') as f:
+                json.dump({'main.py': 'a1'}, f)
+            self.exp_dirs.append(exp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_files_are_linked(self):
+        for exp_dir in self.exp_dirs:
+            self.assertEqual(neronet.neromum.link_files(exp_dir,
+                                                        self.blobs_dir), 1)
+            with open(os.path.join(exp_dir, 'main.py')) as f:
+                self.assertEqual(f.read(), 'print(1)')
+        self.assertEqual(os.stat(os.path.join(self.blobs_dir, 'a1')).st_nlink,
+                         3)
+        self.assertEqual(neronet.neromum.link_files(self.exp_dirs[0],
+                                                    self.blobs_dir), 0)
+
+    def test_unused_blobs_are_collected(self):
+        neronet.neromum.link_files(self.exp_dirs[0], self.blobs_dir)
+        self.assertEqual(neronet.neromum.collect_blobs(self.blobs_dir), 0)
+        no_grace = datetime.timedelta(seconds=-1)
+        self.assertEqual(neronet.neromum.collect_blobs(self.blobs_dir,
+                                                       no_grace), 1)
+        self.assertEqual(os.listdir(self.blobs_dir), ['a1'])
+        shutil.rmtree(self.exp_dirs[0])
+        self.assertEqual(neronet.neromum.collect_blobs(self.blobs_dir,
+                                                       no_grace), 1)
+        self.assertEqual(os.listdir(self.blobs_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import unittest
+import io
+import os
+import pickle
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+import neronet.core
+import neronet.daemon
+import neronet.node
+
+
+class EchoCli(neronet.daemon.Cli):
+    """A daemon interface that replies with the queries it receives"""
+
+    def query(self, name, *args, **kwargs):
+        if name == 'missing':
+            raise self.NoPortFileError('No daemon port file!')
+        return {'rv': 0, 'name': name, 'args': args, 'kwargs': kwargs}
+
+
+class LocalDaemon(neronet.daemon.Daemon):
+    """A daemon run in a thread of the test process with its files in a
+    temporary folder"""
+
+    def __init__(self, folder):
+        super(LocalDaemon, self).__init__('local')
+        self._pdir = folder
+        self._pfout = os.path.join(folder, 'out')
+        self._pferr = os.path.join(folder, 'err')
+        self._pfpid = os.path.join(folder, 'pid')
+        self._pfport = os.path.join(folder, 'port')
+        self._pid = os.getpid()
+        neronet.core.write_file(self._pfpid, self._pid)
+
+    def log(self, message):
+        pass
+
+    def _quit(self):
+        # Stop the thread without exiting the process
+        self._cleanup(outfiles=True)
+
+
+class EchoNode(neronet.node.Node):
+    """A node whose Neromum bridge echoes the queries back"""
+
+    command = ['cat']
+
+    def sshopen(self, cmd, stderr=subprocess.PIPE):
+        return subprocess.Popen(self.command, stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, stderr=stderr)
+
+
+class TestBridge(unittest.TestCase):
+
+    def test_frames(self):
+        stream = io.BytesIO()
+        neronet.daemon.write_frame(stream, {'name': 'status'})
+        neronet.daemon.write_frame(stream, [1, 2])
+        stream.write(b'\x00\x00')
+        stream.seek(0)
+        self.assertEqual(neronet.daemon.read_frame(stream),
+                         {'name': 'status'})
+        self.assertEqual(neronet.daemon.read_frame(stream), [1, 2])
+        self.assertEqual(neronet.daemon.read_frame(stream), None)
+
+    def test_queries_are_forwarded(self):
+        instream = io.BytesIO()
+        neronet.daemon.write_frame(instream, {'name': 'input',
+                                              'args': ({'action': 'x'},)})
+        neronet.daemon.write_frame(instream, {'name': 'missing'})
+        neronet.daemon.write_frame(instream, {'name': 'status'})
+        instream.seek(0)
+        outstream = io.BytesIO()
+        EchoCli(neronet.daemon.Daemon('neromum')).bridge(instream, outstream)
+        outstream.seek(0)
+        replies = []
+        while True:
+            reply = neronet.daemon.read_frame(outstream)
+            if reply is None:
+                break
+            replies.append(reply)
+        self.assertEqual(len(replies), 3)
+        self.assertEqual(replies[0]['args'], ({'action': 'x'},))
+        self.assertEqual(replies[1], {'rv': 1, 'msgbody': 'No port file!'})
+        self.assertEqual(replies[2]['name'], 'status')
+
+    def test_queries_to_a_daemon(self):
+        folder = tempfile.mkdtemp()
+        try:
+            daemon = LocalDaemon(folder)
+            thread = threading.Thread(target=daemon._run)
+            thread.daemon = True
+            thread.start()
+            while not os.path.exists(daemon._pfport):
+                time.sleep(0.01)
+            cli = neronet.daemon.Cli(daemon)
+            started = time.time()
+            self.assertEqual(cli.query('status')['rv'], 0)
+            self.assertTrue(cli.daemon_is_alive())
+            # The replies arrive when sent, not when the socket times out
+            self.assertLess(time.time() - started, neronet.daemon.TIMEOUT)
+            instream = io.BytesIO()
+            neronet.daemon.write_frame(instream, {'name': 'status'})
+            neronet.daemon.write_frame(instream, {'name': 'uptime'})
+            instream.seek(0)
+            outstream = io.BytesIO()
+            cli.bridge(instream, outstream)
+            outstream.seek(0)
+            self.assertEqual(neronet.daemon.read_frame(outstream)['rv'], 0)
+            self.assertIn('uptime', neronet.daemon.read_frame(outstream))
+            cli.query('stop')
+            thread.join(2 * neronet.daemon.TIMEOUT)
+            self.assertFalse(thread.is_alive())
+        finally:
+            shutil.rmtree(folder)
+
+    def test_queries_are_pipelined(self):
+        node = EchoNode('triton', 'unmanaged', 'triton.example')
+        bridge = node.bridge()
+        self.assertIs(node.bridge(), bridge)
+        queries = [('terminate', (str(i),), {}) for i in range(500)]
+        replies = bridge.query_all(queries)
+        self.assertEqual([reply['args'] for reply in replies],
+                         [args for name, args, kwargs in queries])
+        # The channel isn't pickled with the node
+        self.assertNotIn('_bridge', pickle.loads(pickle.dumps(node)).__dict__)
+        node.close_bridge()
+        self.assertTrue(bridge.closed)
+        self.assertRaises(RuntimeError, bridge.query, 'status')
+        self.assertIsNot(node.bridge(), bridge)
+        node.close_bridge()
+
+    def test_terminate_experiments(self):
+        node = EchoNode('triton', 'unmanaged', 'triton.example')
+        bridge = node.bridge()
+        sent = []
+        query_all = bridge.query_all
+        bridge.query_all = lambda queries: sent.append(queries) or \
+            query_all(queries)
+        self.assertEqual(node.terminate_experiments(['exp1', 'exp2']),
+                         ['', ''])
+        self.assertEqual([[args[0]['exp_id'] for name, args, kwargs
+                           in queries] for queries in sent],
+                         [['exp1', 'exp2']])
+        node.close_bridge()
+
+    def test_errors_of_a_chatty_remote_are_kept(self):
+        node = EchoNode('triton', 'unmanaged', 'triton.example')
+        # Writes more to the standard error than a pipe holds
+        node.command = ['sh', '-c', 'yes error | head -c 1000000 >&2; '
+                        'echo fatal >&2']
+        bridge = node.bridge()
+        self.assertIsNone(bridge._proc.stderr)
+        try:
+            bridge.query('status')
+        except RuntimeError as err:
+            self.assertIn('fatal', str(err))
+        else:
+            self.fail('The query should fail')
+
+
+if __name__ == '__main__':
+    unittest.main()
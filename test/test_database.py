@@ -0,0 +1,208 @@
+import unittest
+import tempfile
+import os
+import shutil
+import pickle
+import json
+
+import yaml
+
+import neronet.core
+import neronet.database
+import neronet.config_parser
+from neronet.experiment import Experiment
+
+
+class TestJournalDatabase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.data_dir = neronet.core.USER_DATA_DIR_ABS
+        neronet.core.USER_DATA_DIR_ABS = self.folder
+        self.config_parser = neronet.config_parser.ConfigParser()
+
+    def tearDown(self):
+        neronet.core.USER_DATA_DIR_ABS = self.data_dir
+        shutil.rmtree(self.folder)
+
+    def open_database(self):
+        return neronet.database.JournalDatabase('default.yaml',
+                                                self.config_parser)
+
+    def create_experiment(self, exp_id):
+        return Experiment(exp_id, 'python', 'main.py', self.folder,
+                          parameters={'x': 1}, parameters_format='{x}')
+
+    def test_changes_are_journaled(self):
+        database = self.open_database()
+        database['exp1'] = self.create_experiment('exp1')
+        database['exp2'] = self.create_experiment('exp2')
+        database.save()
+        del database['exp1']
+        database['exp2'].node_id = 'triton'
+        database.touch('exp2')
+        database.save()
+        self.assertFalse(os.path.exists(database.snapshot_path))
+        database = self.open_database()
+        self.assertEqual(list(database), ['exp2'])
+        self.assertEqual(database['exp2'].node_id, 'triton')
+
+    def test_torn_journal_tail_is_discarded(self):
+        database = self.open_database()
+        database['exp1'] = self.create_experiment('exp1')
+        database.save()
+        with open(database.journal_path, 'ab') as f:
+            f.write(b'\x80\x02(garbage')
+        database = self.open_database()
+        self.assertEqual(list(database), ['exp1'])
+        database['exp2'] = self.create_experiment('exp2')
+        database.save()
+        self.assertEqual(sorted(self.open_database()), ['exp1', 'exp2'])
+
+    def test_compaction(self):
+        database = self.open_database()
+        database['exp1'] = self.create_experiment('exp1')
+        database.save()
+        database.compact()
+        self.assertFalse(os.path.exists(database.journal_path))
+        database = self.open_database()
+        self.assertEqual(list(database), ['exp1'])
+        self.assertEqual(database['exp1'].callstring, 'python main.py 1')
+
+    def test_experiments_are_loaded_lazily(self):
+        database = self.open_database()
+        database['exp1'] = self.create_experiment('exp1')
+        database.compact()
+        database['exp2'] = self.create_experiment('exp2')
+        database['exp2'].set_warning('name')
+        database.touch('exp2')
+        database.save()
+        database = self.open_database()
+        summaries = dict((s.id, s) for s in database.summaries())
+        self.assertEqual(sorted(summaries), ['exp1', 'exp2'])
+        self.assertTrue(summaries['exp2'].warnings)
+        self.assertEqual(summaries['exp1'].state, Experiment.State.defined)
+        self.assertEqual(summaries['exp1'].fingerprint,
+                         self.create_experiment('exp1').fingerprint)
+        self.assertEqual(summaries['exp1'].demand, (1, 0))
+        self.assertEqual(database._experiments, {})
+        database['exp2']
+        self.assertEqual(list(database._experiments), ['exp2'])
+        self.assertFalse(database._snapshot_loaded)
+        self.assertEqual(database['exp1'].callstring, 'python main.py 1')
+        self.assertFalse(database._snapshot_loaded)
+
+    def test_snapshot_without_offsets_is_loaded_whole(self):
+        database = self.open_database()
+        database['exp1'] = self.create_experiment('exp1')
+        database['exp2'] = self.create_experiment('exp2')
+        database.compact()
+        with open(database.snapshot_path) as f:
+            self.assertEqual(yaml.safe_load(f.read()),
+                             {'exp1': database['exp1'].to_record(),
+                              'exp2': database['exp2'].to_record()})
+        database._offsets = {}
+        database._write_index()
+        database = self.open_database()
+        self.assertEqual(database['exp1'].callstring, 'python main.py 1')
+        self.assertTrue(database._snapshot_loaded)
+
+    def test_summaries_of_older_journals(self):
+        database = self.open_database()
+        experiment = self.create_experiment('exp1')
+        experiment.resources = {'cpus': 4}
+        database['exp1'] = experiment
+        database.save()
+        with open(database.journal_path, 'rb') as f:
+            entry = json.loads(f.read().decode('utf-8'))
+        entry['summary'] = entry['summary'][:6]
+        with open(database.journal_path, 'wb') as f:
+            f.write((json.dumps(entry) + '\n').encode('utf-8'))
+        database = self.open_database()
+        self.assertEqual(database.summary('exp1').demand, (4, 0))
+
+    def test_index_is_rebuilt_for_edited_snapshot(self):
+        database = self.open_database()
+        database['exp1'] = self.create_experiment('exp1')
+        database.compact()
+        self.config_parser.write_yaml(database.snapshot_path,
+                {'exp2': self.create_experiment('exp2').to_record()})
+        self.assertEqual(list(self.open_database()), ['exp2'])
+
+    def test_legacy_files_are_migrated(self):
+        experiment = self.create_experiment('exp1')
+        with open(os.path.join(self.folder, 'default.yaml'), 'w') as f:
+            f.write(yaml.dump({'exp1': experiment}))
+        with open(os.path.join(self.folder, 'default.yaml.journal'),
+                  'wb') as f:
+            pickle.dump(('set', 'exp2', self.create_experiment('exp2')), f,
+                        pickle.HIGHEST_PROTOCOL)
+        database = self.open_database()
+        self.assertEqual(sorted(database), ['exp1', 'exp2'])
+        self.assertFalse(os.path.exists(database.journal_path))
+        with open(database.snapshot_path) as f:
+            self.assertNotIn('!!python', f.read())
+        database = self.open_database()
+        self.assertEqual(database['exp1'].callstring, 'python main.py 1')
+
+
+class TestSQLiteDatabase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.data_dir = neronet.core.USER_DATA_DIR_ABS
+        neronet.core.USER_DATA_DIR_ABS = self.folder
+
+    def tearDown(self):
+        neronet.core.USER_DATA_DIR_ABS = self.data_dir
+        shutil.rmtree(self.folder)
+
+    def create_experiment(self, exp_id, collection=None):
+        return Experiment(exp_id, 'python', 'main.py', self.folder,
+                          parameters={'x': 1}, parameters_format='{x}',
+                          collection=collection)
+
+    def test_save_and_reopen(self):
+        database = neronet.database.SQLiteDatabase('default.sqlite')
+        database['exp1'] = self.create_experiment('exp1')
+        database['exp2'] = self.create_experiment('exp2')
+        database.save()
+        del database['exp1']
+        database.save()
+        database = neronet.database.SQLiteDatabase('default.sqlite')
+        self.assertEqual(list(database), ['exp2'])
+        self.assertEqual(len(database), 1)
+        self.assertNotIn('exp1', database)
+        self.assertEqual(database['exp2'].callstring, 'python main.py 1')
+
+    def test_find(self):
+        database = neronet.database.SQLiteDatabase('default.sqlite')
+        for exp_id in ('exp1', 'exp2', 'exp3'):
+            database[exp_id] = self.create_experiment(exp_id,
+                    ['sweep'] if exp_id != 'exp3' else ['other'])
+        database['exp1'].node_id = 'triton'
+        database['exp1'].update_state(Experiment.State.running)
+        database.touch('exp1')
+        database['exp2'].resources = {'cpus': 2, 'mem_mb': 512}
+        database.touch('exp2')
+        database.save()
+        database = neronet.database.SQLiteDatabase('default.sqlite')
+        running = database.find(state=Experiment.State.running,
+                                node_id='triton')
+        self.assertEqual([exp.id for exp in running], ['exp1'])
+        self.assertEqual([exp.id for exp in database.submitted()], ['exp1'])
+        self.assertEqual(sorted(exp.id for exp in
+                                database.find(collection='sweep')),
+                         ['exp1', 'exp2'])
+        self.assertEqual(database.find(node_id='kosh'), [])
+        summaries = dict((s.id, s) for s in database.summaries())
+        self.assertEqual(summaries['exp1'].node_id, 'triton')
+        self.assertEqual(summaries['exp3'].collection, ['other'])
+        self.assertEqual(summaries['exp2'].fingerprint,
+                         database['exp2'].fingerprint)
+        self.assertEqual(summaries['exp1'].demand, (1, 0))
+        self.assertEqual(summaries['exp2'].demand, (2, 512))
+
+
+if __name__ == '__main__':
+    unittest.main()
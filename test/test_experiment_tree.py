@@ -0,0 +1,90 @@
+import unittest
+import tempfile
+import os
+import shutil
+
+import neronet.core
+import neronet.neroman
+
+
+class TestExperimentTree(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.data_dir = neronet.core.USER_DATA_DIR_ABS
+        neronet.core.USER_DATA_DIR_ABS = os.path.join(self.folder, 'data')
+        os.mkdir(neronet.core.USER_DATA_DIR_ABS)
+        self.nero = neronet.neroman.Neroman()
+        self.root = os.path.join(self.folder, 'exps')
+        self.create_folder('a', 'exp_a')
+        self.create_folder(os.path.join('a', 'nested'), 'exp_nested')
+        self.create_folder('b', 'exp_b')
+        self.create_folder('.hidden', 'exp_hidden')
+        os.makedirs(os.path.join(self.root, 'broken'))
+        with open(os.path.join(self.root, 'broken', 'config.yaml'),
+                  'w') as f:
+            f.write("run_command_prefix: python\n"
+                    "+exp_broken:\n"
+                    "    parameters:\n"
+                    "        x: 1\n")
+
+    def tearDown(self):
+        neronet.core.USER_DATA_DIR_ABS = self.data_dir
+        shutil.rmtree(self.folder)
+
+    def create_folder(self, name, exp_id):
+        folder = os.path.join(self.root, name)
+        os.makedirs(folder)
+        open(os.path.join(folder, 'main.py'), 'w').close()
+        with open(os.path.join(folder, 'config.yaml'), 'w') as f:
+            f.write("run_command_prefix: python\n"
+                    "main_code_file: main.py\n"
+                    "parameters_format: '{x}'\n"
+                    "+%s:\n"
+                    "    parameters:\n"
+                    "        x: [1, 2]\n" % exp_id)
+        return folder
+
+    def test_folders_are_found(self):
+        folders = self.nero.config_parser.find_experiment_folders(self.root)
+        self.assertEqual([os.path.relpath(folder, self.root)
+                          for folder in folders],
+                         ['a', os.path.join('a', 'nested'), 'b', 'broken'])
+
+    def test_tree_is_specified(self):
+        changed, errors = self.nero.specify_experiment_tree(self.root,
+                                                            processes=2)
+        self.assertEqual(changed, {})
+        self.assertEqual(list(errors), [os.path.join(self.root, 'broken')])
+        self.assertEqual(sorted(self.nero.database),
+                         ['exp_a_x-1', 'exp_a_x-2', 'exp_b_x-1', 'exp_b_x-2',
+                          'exp_nested_x-1', 'exp_nested_x-2'])
+        nero = neronet.neroman.Neroman()
+        self.assertEqual(len(nero.database), 6)
+
+    def test_duplicates_only_skip_their_folder(self):
+        self.nero.specify_experiments(os.path.join(self.root, 'a'))
+        self.create_folder('c', 'exp_c')
+        changed, errors = self.nero.specify_experiment_tree(self.root,
+                                                            processes=1)
+        self.assertEqual(changed, {})
+        self.assertEqual(sorted(errors),
+                         [os.path.join(self.root, 'a'),
+                          os.path.join(self.root, 'broken')])
+        self.assertIn('exp_a_x-1', errors[os.path.join(self.root, 'a')])
+        self.assertIn('exp_c_x-1', self.nero.database)
+        self.assertIn('exp_nested_x-1', self.nero.database)
+
+    def test_same_id_in_two_folders(self):
+        self.create_folder('c', 'exp_b')
+        changed, errors = self.nero.specify_experiment_tree(self.root)
+        self.assertEqual(list(errors), [os.path.join(self.root, 'broken')])
+        self.assertEqual(sorted(changed), ['exp_b_x-1', 'exp_b_x-2'])
+        self.assertEqual(changed['exp_b_x-1'].path,
+                         os.path.join(self.root, 'c'))
+        self.assertEqual(self.nero.database['exp_b_x-1'].path,
+                         os.path.join(self.root, 'b'))
+
+
+if __name__ == '__main__':
+    unittest.main()
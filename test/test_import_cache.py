@@ -0,0 +1,75 @@
+import unittest
+import tempfile
+import os
+import sys
+import shutil
+import importlib
+
+import neronet.core
+
+
+class TestImportCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        sys.path.insert(0, self.folder)
+        self.module = 'plugin_' + os.path.basename(self.folder)
+        self.path = os.path.join(self.folder, self.module + '.py')
+        self.write('def reader(f):\n    return 1\n')
+        self.imports = []
+        self.import_module = importlib.import_module
+        def import_module(name):
+            self.imports.append(name)
+            return self.import_module(name)
+        importlib.import_module = import_module
+
+    def tearDown(self):
+        importlib.import_module = self.import_module
+        sys.path.remove(self.folder)
+        sys.modules.pop(self.module, None)
+        shutil.rmtree(self.folder)
+
+    def write(self, text):
+        with open(self.path, 'w') as f:
+            f.write(text)
+        stat = os.stat(self.path)
+        os.utime(self.path, (stat.st_atime, stat.st_mtime + 10))
+        # Don't let a stale byte-compiled file shadow the source
+        for compiled in (self.path + 'c', self.path + 'o'):
+            if os.path.exists(compiled):
+                os.remove(compiled)
+
+    def test_imports_are_cached(self):
+        for _ in range(100):
+            self.assertTrue(neronet.core.can_import(self.module,
+                                                    'reader'))
+            self.assertFalse(neronet.core.can_import(self.module,
+                                                     'plotter'))
+        self.assertEqual(self.imports.count(self.module), 1)
+        self.assertEqual(neronet.core.import_from(self.module,
+                                                  'reader')(None), 1)
+        self.assertRaises(ImportError, neronet.core.import_from,
+                          self.module, 'plotter')
+
+    def test_changed_module_is_reloaded(self):
+        self.assertEqual(neronet.core.import_from(self.module,
+                                                  'reader')(None), 1)
+        self.assertFalse(neronet.core.can_import(self.module, 'plotter'))
+        self.write('def reader(f):\n    return 2\n'
+                   'def plotter(f):\n    return 3\n')
+        self.assertEqual(neronet.core.import_from(self.module,
+                                                  'reader')(None), 2)
+        self.assertTrue(neronet.core.can_import(self.module, 'plotter'))
+
+    def test_missing_object_of_a_script_is_not_looked_up_elsewhere(self):
+        self.assertFalse(neronet.core.can_import('example', 'no_such_reader'))
+        self.assertNotIn('example', self.imports)
+
+    def test_readers_import_without_plotting_libraries(self):
+        self.assertTrue(neronet.core.can_import('example', 'line_reader'))
+        self.assertTrue(neronet.core.can_import('example', 'plot'))
+        self.assertNotIn('matplotlib.pyplot', sys.modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import unittest
+import tempfile
+import os
+import shutil
+import pickle
+import multiprocessing
+import subprocess
+
+import neronet.core
+import neronet.node
+import neronet.neromum
+from neronet.experiment import Experiment
+
+
+class RecordingNeromum(neronet.neromum.Neromum):
+    """A Neromum that records the launches instead of starting Nerokids"""
+
+    def __init__(self):
+        super(RecordingNeromum, self).__init__()
+        self.launched = []
+
+    def launch(self, exp):
+        self.launched.append(exp.id)
+
+    def log(self, message):
+        pass
+
+
+class TestSlots(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.data_dir = neronet.core.USER_DATA_DIR_ABS
+        neronet.core.USER_DATA_DIR_ABS = self.folder
+        self.write_node(slots=2)
+        for i in range(5):
+            exp = Experiment('exp%d' % i, 'python', 'main.py', self.folder,
+                             parameters={'x': i}, parameters_format='{x}')
+            exp.node_id = 'kosh'
+            exp.update_state(Experiment.State.submitted)
+            exp_dir = os.path.join(self.folder, 'experiments', exp.id)
+            os.makedirs(exp_dir)
+            neronet.core.write_file(os.path.join(exp_dir, 'exp.pickle'),
+                                    pickle.dumps(exp))
+
+    def tearDown(self):
+        neronet.core.USER_DATA_DIR_ABS = self.data_dir
+        shutil.rmtree(self.folder)
+
+    def write_node(self, slots=None):
+        node = neronet.node.Node('kosh', 'unmanaged', 'kosh.example',
+                                 slots=slots)
+        neronet.core.write_file(os.path.join(self.folder, 'node.pickle'),
+                                pickle.dumps(node))
+
+    def test_slots_default_to_cores(self):
+        self.write_node()
+        self.assertEqual(RecordingNeromum().slots,
+                         multiprocessing.cpu_count())
+
+    def test_experiments_fill_the_slots(self):
+        mum = RecordingNeromum()
+        mum.ontimeout()
+        self.assertEqual(mum.launched, ['exp0', 'exp1'])
+        mum.ontimeout()
+        self.assertEqual(mum.launched, ['exp0', 'exp1'])
+        self.assertEqual(mum.exp_dict['exp2'].state,
+                         Experiment.State.submitted)
+
+    def test_freed_slot_is_used_at_once(self):
+        mum = RecordingNeromum()
+        mum.ontimeout()
+        mum._reply = {}
+        mum.qry_exp_update('exp0', Experiment.State.running, {})
+        self.assertEqual(mum.launched, ['exp0', 'exp1'])
+        mum.qry_exp_update('exp0', Experiment.State.finished, {})
+        self.assertEqual(mum.launched, ['exp0', 'exp1', 'exp2'])
+        mum.qry_exp_update('exp1', Experiment.State.terminated, {})
+        self.assertEqual(mum.launched, ['exp0', 'exp1', 'exp2', 'exp3'])
+
+
+class TestJobArrays(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.data_dir = neronet.core.USER_DATA_DIR_ABS
+        neronet.core.USER_DATA_DIR_ABS = self.folder
+        self.path = os.environ['PATH']
+        # Stubs of sbatch and the commands run by the batch scripts
+        self.bin_dir = os.path.join(self.folder, 'bin')
+        os.mkdir(self.bin_dir)
+        self.write_stub('sbatch', 'echo "$1" >> "%s"\n'
+                        'echo "Submitted batch job 1"\n'
+                        % os.path.join(self.folder, 'sbatch.calls'))
+        self.write_stub('nerokid', 'echo "$@" >> "%s"\n'
+                        % os.path.join(self.folder, 'nerokid.calls'))
+        self.write_stub('module', '')
+        self.write_stub('sleep', '')
+        os.environ['PATH'] = self.bin_dir + os.pathsep + self.path
+        node = neronet.node.Node('triton', 'slurm', 'triton.example',
+                                 sbatch_args='-t 10',
+                                 slurm_mode=neronet.node.SlurmMode.array)
+        neronet.core.write_file(os.path.join(self.folder, 'node.pickle'),
+                                pickle.dumps(node))
+        for i in range(5):
+            exp = Experiment('exp%d' % i, 'python', 'main.py', self.folder,
+                             parameters={'x': i}, parameters_format='{x}',
+                             collection=['sweep' if i < 3 else 'other'],
+                             sbatch_args='--mem=1G' if i < 3 else None)
+            exp.node_id = 'triton'
+            exp.update_state(Experiment.State.submitted)
+            exp_dir = os.path.join(self.folder, 'experiments', exp.id)
+            os.makedirs(exp_dir)
+            neronet.core.write_file(os.path.join(exp_dir, 'exp.pickle'),
+                                    pickle.dumps(exp))
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        neronet.core.USER_DATA_DIR_ABS = self.data_dir
+        shutil.rmtree(self.folder)
+
+    def write_stub(self, name, body):
+        path = os.path.join(self.bin_dir, name)
+        neronet.core.write_file(path, '#!/bin/sh\n' + body)
+        os.chmod(path, 0o755)
+
+    def read_lines(self, filename):
+        with open(os.path.join(self.folder, filename)) as f:
+            return f.read().splitlines()
+
+    def test_collections_are_submitted_as_arrays(self):
+        mum = RecordingNeromum()
+        mum.ontimeout()
+        self.assertEqual(mum.launched, [])
+        self.assertEqual(set(exp.state for exp in mum.exp_dict.values()),
+                         set([Experiment.State.submitted_to_kid]))
+        scripts = self.read_lines('sbatch.calls')
+        self.assertEqual(len(scripts), 2)
+        with open(scripts[0]) as f:
+            script = f.read()
+        self.assertIn('#SBATCH --array=0-2\n', script)
+        self.assertIn('#SBATCH -t 10\n#SBATCH --mem=1G\n', script)
+        self.assertEqual(script.index('#SBATCH --mem=1G'),
+                         script.rindex('#SBATCH'))
+        with open(scripts[1]) as f:
+            self.assertIn('#SBATCH --array=0-1\n', f.read())
+        # Each task runs the experiment of its index
+        env = dict(os.environ, SLURM_ARRAY_TASK_ID='1')
+        subprocess.check_call(['bash', scripts[0]], env=env)
+        env = dict(os.environ, SLURM_ARRAY_TASK_ID='0')
+        subprocess.check_call(['bash', scripts[1]], env=env)
+        calls = self.read_lines('nerokid.calls')
+        self.assertEqual(calls[0], 'exp1 --start')
+        self.assertTrue(calls[1].startswith('exp1 --query configure '))
+        self.assertEqual(calls[2], 'exp3 --start')
+        # The tasks Slurm hasn't started yet aren't lost
+        self.assertEqual(mum._pending_array_ids(),
+                         set(['exp0', 'exp2', 'exp4']))
+        for exp in mum.exp_dict.values():
+            exp.time_modified -= neronet.neromum.datetime.timedelta(hours=1)
+        mum.ontimeout()
+        # The started ones never reported back to the stubbed Nerokid
+        self.assertEqual(sorted(exp.id for exp in mum.exp_dict.values()
+                                if exp.state == Experiment.State.lost),
+                         ['exp1', 'exp3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
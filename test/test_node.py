@@ -0,0 +1,48 @@
+import unittest
+import tempfile
+import os
+import shutil
+import stat
+
+import neronet.core
+import neronet.node
+
+
+class TestNode(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.data_dir = neronet.core.USER_DATA_DIR_ABS
+        neronet.core.USER_DATA_DIR_ABS = self.folder
+        self.osrunroe = neronet.core.osrunroe
+        neronet.core.osrunroe = self.fake_osrunroe
+        self.commands = []
+        self.node = neronet.node.Node('triton', 'unmanaged', 'triton.example')
+
+    def tearDown(self):
+        neronet.core.osrunroe = self.osrunroe
+        neronet.core.USER_DATA_DIR_ABS = self.data_dir
+        shutil.rmtree(self.folder)
+
+    def fake_osrunroe(self, cmd, inp=None):
+        self.commands.append(cmd)
+        res = neronet.core.Runresult()
+        res.rv, res.out, res.err = 0, '', ''
+        return res
+
+    def test_ssh_connections_are_multiplexed(self):
+        self.node.sshrun('uptime')
+        self.node.sshrun('free -m')
+        control_dir = os.path.join(self.folder,
+                                   neronet.node.SSH_CONTROL_DIR_NAME)
+        self.assertEqual(stat.S_IMODE(os.stat(control_dir).st_mode), 0o700)
+        for cmd in self.commands:
+            self.assertTrue(cmd.startswith(self.node.ssh_command() +
+                                           ' triton.example '))
+        self.assertIn('ControlMaster=auto', self.node.ssh_command())
+        self.assertIn("'ControlPath=%s/%%C'" % control_dir,
+                      self.node.ssh_command())
+
+
+if __name__ == '__main__':
+    unittest.main()
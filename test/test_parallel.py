@@ -0,0 +1,56 @@
+import unittest
+import threading
+import time
+
+import neronet.core
+
+
+class TestParallelMap(unittest.TestCase):
+
+    def test_results_are_in_order(self):
+        def square(x):
+            if x == 3:
+                raise RuntimeError('unreachable')
+            time.sleep(0.01 * (5 - x))
+            return x * x
+        results = neronet.core.parallel_map(square, range(5), workers=3)
+        self.assertEqual([result for result, err in results],
+                         [0, 1, 4, None, 16])
+        self.assertTrue(isinstance(results[3][1], RuntimeError))
+        self.assertEqual([err for result, err in results if err is None],
+                         [None] * 4)
+
+    def test_workers_are_bounded(self):
+        lock = threading.Lock()
+        counts = {'running': 0, 'max': 0}
+        def work(x):
+            with lock:
+                counts['running'] += 1
+                counts['max'] = max(counts['max'], counts['running'])
+            time.sleep(0.02)
+            with lock:
+                counts['running'] -= 1
+        start = time.time()
+        neronet.core.parallel_map(work, range(12), workers=4)
+        self.assertEqual(counts['max'], 4)
+        self.assertLess(time.time() - start, 12 * 0.02)
+
+    def test_slow_calls_time_out(self):
+        def work(x):
+            time.sleep(2.0 if x == 'dead' else 0.01)
+            return x
+        start = time.time()
+        results = neronet.core.parallel_map(work, ['a', 'dead', 'b', 'c'],
+                                            workers=2, timeout=0.2)
+        self.assertLess(time.time() - start, 1.0)
+        self.assertEqual(results[0], ('a', None))
+        self.assertTrue(isinstance(results[1][1],
+                                   neronet.core.OperationTimeout))
+        self.assertEqual([results[2], results[3]], [('b', None), ('c', None)])
+
+    def test_no_items(self):
+        self.assertEqual(neronet.core.parallel_map(len, []), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
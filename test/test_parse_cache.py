@@ -0,0 +1,88 @@
+import unittest
+import tempfile
+import os
+import shutil
+
+import neronet.core
+import neronet.config_parser
+
+
+class TestParseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.data_dir = neronet.core.USER_DATA_DIR_ABS
+        neronet.core.USER_DATA_DIR_ABS = os.path.join(self.folder, 'data')
+        self.config_parser = neronet.config_parser.ConfigParser()
+        self.expfolder = os.path.join(self.folder, 'exps')
+        os.mkdir(self.expfolder)
+        self.write('main.py', 'print(1)')
+        self.write('config.yaml', "run_command_prefix: python\n"
+                                  "main_code_file: main.py\n"
+                                  "parameters_format: '{x}'\n"
+                                  "+exp:\n"
+                                  "    parameters:\n"
+                                  "        x: [1, 2]\n"
+                                  "    conditions:\n"
+                                  "        error:\n"
+                                  "            variablename: loss\n"
+                                  "            killvalue: 1\n"
+                                  "            comparator: gt\n"
+                                  "            when: immediately\n"
+                                  "            action: kill\n")
+
+    def tearDown(self):
+        neronet.core.USER_DATA_DIR_ABS = self.data_dir
+        shutil.rmtree(self.folder)
+
+    def write(self, filename, text):
+        path = os.path.join(self.expfolder, filename)
+        with open(path, 'w') as f:
+            f.write(text)
+        # Make sure the modification time changes
+        stat = os.stat(path)
+        os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+    def parse(self):
+        experiments = self.config_parser.parse_experiments(self.expfolder)
+        return dict((exp.id, exp) for exp in experiments)
+
+    def test_unchanged_folder_is_not_parsed(self):
+        experiments = self.parse()
+        self.assertEqual(sorted(experiments), ['exp_x-1', 'exp_x-2'])
+
+        def fail(folder, data):
+            self.fail('The configuration was parsed again')
+        self.config_parser.parse_experiment_sweeps = fail
+        cached = self.parse()
+        self.assertEqual(sorted(cached), sorted(experiments))
+        for exp_id in experiments:
+            self.assertEqual(cached[exp_id].fingerprint,
+                             experiments[exp_id].fingerprint)
+            self.assertEqual(cached[exp_id].callstring,
+                             experiments[exp_id].callstring)
+        self.assertEqual(cached['exp_x-1'].conditions['error'].killvalue, 1.0)
+
+    def test_changed_files_are_parsed(self):
+        self.parse()
+        self.write('main.py', 'print(2)')
+        parsed = []
+        parse = self.config_parser.parse_experiment_sweeps
+        def record(folder, data):
+            parsed.append(folder)
+            return parse(folder, data)
+        self.config_parser.parse_experiment_sweeps = record
+        self.parse()
+        self.assertEqual(len(parsed), 1)
+        self.write('config.yaml', "run_command_prefix: python\n"
+                                  "main_code_file: main.py\n"
+                                  "parameters_format: '{x}'\n"
+                                  "+exp:\n"
+                                  "    parameters:\n"
+                                  "        x: 1\n")
+        self.assertEqual(list(self.parse()), ['exp'])
+        self.assertEqual(len(parsed), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import unittest
+import tempfile
+import shutil
+import os
+import collections
+
+import neronet.core
+import neronet.node
+import neronet.config_parser
+import neronet.scheduler
+
+
+Job = collections.namedtuple('Job', ['id', 'resources'])
+
+
+class ProbedNode(neronet.node.Node):
+    """A node that answers the resource probes with fixed output"""
+
+    probes = []
+
+    def __init__(self, cid, cores, load, reachable=True, mem_mb=11000,
+                 total_mb=15942):
+        super(ProbedNode, self).__init__(cid, 'unmanaged', cid + '.example')
+        self.cores = cores
+        self.load = load
+        self.reachable = reachable
+        self.mem_mb = mem_mb
+        self.total_mb = total_mb
+
+    def sshrun(self, cmd, inp=None):
+        self.probes.append(self.cid)
+        if not self.reachable:
+            raise RuntimeError('Connection refused')
+        res = neronet.core.Runresult()
+        res.rv, res.err = 0, ''
+        res.out = ('%d\n%.2f 0.50 0.40 1/234 5678\n'
+                   '              total        used        free      shared'
+                   '  buff/cache   available\n'
+                   'Mem:          %5d        4000        8000         100'
+                   '        3942       %d\n'
+                   'Swap:          2047           0        2047\n'
+                   % (self.cores, self.load, self.total_mb, self.mem_mb))
+        return res
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.data_dir = neronet.core.USER_DATA_DIR_ABS
+        neronet.core.USER_DATA_DIR_ABS = self.folder
+        ProbedNode.probes = []
+        self.nodes = {'a': ProbedNode('a', 4, 0.0),
+                      'b': ProbedNode('b', 2, 1.0),
+                      'dead': ProbedNode('dead', 8, 0.0, reachable=False)}
+
+    def tearDown(self):
+        neronet.core.USER_DATA_DIR_ABS = self.data_dir
+        shutil.rmtree(self.folder)
+
+    def test_probe(self):
+        info = neronet.scheduler.probe(self.nodes['b'])
+        self.assertEqual(info, neronet.scheduler.NodeInfo(1.0, 11000, 2,
+                                                              15942))
+
+    def test_experiments_are_spread_by_load_per_core(self):
+        scheduler = neronet.scheduler.Scheduler(self.nodes)
+        placement = scheduler.place(list(range(10)), ['a', 'b', 'dead'])
+        self.assertEqual(list(placement), ['a', 'b'])
+        self.assertEqual(len(placement['a']), 7)
+        self.assertEqual(len(placement['b']), 3)
+        self.assertEqual(sorted(ProbedNode.probes), ['a', 'b', 'dead'])
+
+    def test_queued_experiments_count_as_load(self):
+        scheduler = neronet.scheduler.Scheduler(self.nodes)
+        placement = scheduler.place(['exp'], ['a', 'b'], {'a': (4, 0)})
+        self.assertEqual(dict(placement), {'b': ['exp']})
+
+    def test_memory_hungry_experiments_are_spread(self):
+        scheduler = neronet.scheduler.Scheduler(self.nodes)
+        jobs = [Job('big1', {'mem_mb': 6000}), Job('big2', {'mem_mb': 6000})]
+        placement = scheduler.place(jobs, ['a', 'b'])
+        self.assertEqual(dict(placement), {'a': [jobs[0]], 'b': [jobs[1]]})
+        placement = scheduler.place(jobs, ['a', 'b'], {'b': (0, 6000)})
+        self.assertEqual(dict(placement), {'a': jobs})
+
+    def test_experiments_larger_than_free_memory_are_queued(self):
+        self.nodes['b'].total_mb = 32000
+        scheduler = neronet.scheduler.Scheduler(self.nodes)
+        placement = scheduler.place([Job('big', {'mem_mb': 14000})],
+                                    ['a', 'b'])
+        self.assertEqual(list(placement), ['a'])
+        placement = scheduler.place([Job('bigger', {'mem_mb': 20000})],
+                                    ['a', 'b'])
+        self.assertEqual(list(placement), ['b'])
+
+    def test_large_experiments_are_packed_first(self):
+        scheduler = neronet.scheduler.Scheduler(self.nodes)
+        jobs = [Job('small1', None), Job('wide', {'cpus': 4}),
+                Job('small2', None)]
+        placement = scheduler.place(jobs, ['a', 'b'])
+        self.assertEqual(dict(placement),
+                         {'a': [jobs[1], jobs[2]], 'b': [jobs[0]]})
+
+    def test_experiment_larger_than_any_node(self):
+        scheduler = neronet.scheduler.Scheduler(self.nodes)
+        self.assertRaises(AttributeError, scheduler.place,
+                          [Job('huge', {'cpus': 16})], ['a', 'b'])
+        self.assertRaises(AttributeError, scheduler.place,
+                          [Job('huge', {'mem_mb': 64000})], ['a', 'b'])
+
+    def test_resources_are_cached(self):
+        scheduler = neronet.scheduler.Scheduler(self.nodes)
+        scheduler.place(['exp1'], ['a', 'b'])
+        scheduler.place(['exp2'], ['a', 'b'])
+        # A new scheduler uses the cache file
+        neronet.scheduler.Scheduler(self.nodes).place(['exp3'], ['a', 'b'])
+        self.assertEqual(sorted(ProbedNode.probes), ['a', 'b'])
+        scheduler.invalidate('a')
+        scheduler.place(['exp4'], ['a', 'b'])
+        self.assertEqual(sorted(ProbedNode.probes), ['a', 'a', 'b'])
+        expired = neronet.scheduler.Scheduler(self.nodes, ttl=0)
+        expired.place(['exp5'], ['a', 'b'])
+        self.assertEqual(len(ProbedNode.probes), 5)
+
+    def test_no_reachable_nodes(self):
+        scheduler = neronet.scheduler.Scheduler(self.nodes)
+        self.assertRaises(AttributeError, scheduler.place, ['exp'], ['dead'])
+
+
+class TestResourceRequests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.data_dir = neronet.core.USER_DATA_DIR_ABS
+        neronet.core.USER_DATA_DIR_ABS = os.path.join(self.folder, 'data')
+        open(os.path.join(self.folder, 'main.py'), 'w').close()
+
+    def tearDown(self):
+        neronet.core.USER_DATA_DIR_ABS = self.data_dir
+        shutil.rmtree(self.folder)
+
+    def parse(self, resources):
+        with open(os.path.join(self.folder, 'config.yaml'), 'w') as f:
+            f.write("run_command_prefix: python\n"
+                    "main_code_file: main.py\n"
+                    "parameters_format: '{x}'\n"
+                    "+exp:\n"
+                    "    parameters:\n"
+                    "        x: 1\n"
+                    "    resources: %s\n" % resources)
+        return neronet.config_parser.ConfigParser().parse_experiments(
+                self.folder)
+
+    def test_resources_are_stored(self):
+        experiment, = self.parse('{cpus: 2, mem_mb: 4096}')
+        self.assertEqual(experiment.resources, {'cpus': 2, 'mem_mb': 4096})
+        self.assertEqual(neronet.scheduler.demand(experiment), (2, 4096))
+
+    def test_invalid_resources(self):
+        for resources in ('4', '{gpus: 1}', '{cpus: 0}', '{mem_mb: 1.5}'):
+            self.assertRaises(neronet.config_parser.FormatError, self.parse,
+                              resources)
+
+
+if __name__ == '__main__':
+    unittest.main()
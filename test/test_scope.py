@@ -0,0 +1,63 @@
+import unittest
+import tempfile
+import os
+import shutil
+
+import yaml
+
+import neronet.config_parser
+from neronet.config_parser import Scope
+
+
+class TestScope(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        with open(os.path.join(self.folder, 'main.py'), 'w') as f:
+            f.write('print(1)')
+        self.config_parser = neronet.config_parser.ConfigParser()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_lookups_fall_through_to_parent(self):
+        parent = Scope({'plot': {'loss': 1}, '+exp': {'custom_msg': 'a'}})
+        child = Scope(parent.data['+exp'], parent, ['plot'],
+                      {'outputs': ['stdout.log']})
+        self.assertEqual(dict(child), {'plot': {'loss': 1}, 'custom_msg': 'a',
+                                       'outputs': ['stdout.log']})
+        self.assertIs(child['plot'], parent['plot'])
+        self.assertNotIn('+exp', child)
+        self.assertRaises(KeyError, lambda: child['+exp'])
+
+    def test_nested_experiments(self):
+        data = yaml.safe_load("""
+run_command_prefix: python
+main_code_file: main.py
+parameters_format: '{a} {b}'
+outputs: [out.txt]
+parameters:
+    a: 1
+    b: 2
++parent:
+    parameters:
+        b: 3
+    +child:
+        parameters:
+            a: [4, 5]
+""")
+        sweeps = dict((sweep.id, sweep) for sweep in
+                      self.config_parser.parse_experiment_sweeps(
+                          self.folder, data))
+        self.assertEqual(sorted(sweeps), ['child', 'parent'])
+        self.assertEqual(sweeps['parent'][0]['parameters'], {'a': 1, 'b': 3})
+        self.assertEqual([d['parameters'] for d in sweeps['child']],
+                         [{'a': 4, 'b': 3}, {'a': 5, 'b': 3}])
+        self.assertEqual(sweeps['child'][0]['outputs'],
+                         ['out.txt', 'stdout.log'])
+        self.assertEqual(data['outputs'], ['out.txt'])
+        self.assertEqual(data['parameters'], {'a': 1, 'b': 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
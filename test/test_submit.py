@@ -0,0 +1,232 @@
+import unittest
+import tempfile
+import os
+import shutil
+import subprocess
+import pickle
+import json
+
+import neronet.core
+import neronet.database
+import neronet.neroman
+import neronet.node
+import neronet.experiment
+import neronet.scheduler
+from neronet.experiment import Experiment
+
+
+class FakeNode(neronet.node.Node):
+    """A node that records the Neromum starts instead of using SSH"""
+
+    neromums = []
+    fail = False
+    runtime = None
+    blobs = set()
+
+    def runtime_digest(self):
+        return self.runtime
+
+    def missing_blobs(self, digests):
+        return [digest for digest in digests if digest not in self.blobs]
+
+    def sshopen(self, cmd, stderr=subprocess.PIPE):
+        # Run the command locally in the node folder
+        return subprocess.Popen(['sh', '-c', 'mkdir -p %s && cd %s && %s' %
+                                 (self.dir, self.dir, cmd)],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=stderr)
+
+    def start_neromum(self):
+        if self.fail:
+            raise RuntimeError('Connection refused')
+        self.neromums.append(self.cid)
+
+
+class TestSubmit(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.data_dir = neronet.core.USER_DATA_DIR_ABS
+        neronet.core.USER_DATA_DIR_ABS = self.folder
+        self.osrun = neronet.core.osrun
+        neronet.core.osrun = self.fake_osrun
+        self.transfers = []
+        self.runtime_uploads = []
+        self.blob_uploads = []
+        FakeNode.runtime = None
+        FakeNode.blobs = set()
+        FakeNode.neromums = self.neromums = []
+        self.nero = neronet.neroman.Neroman()
+        self.nero.nodes['nodes']['triton'] = FakeNode('triton', 'unmanaged',
+                                                      'triton.example')
+        open(os.path.join(self.folder, 'main.py'), 'w').close()
+        for exp_id, collection in (('exp1', 'sweep'), ('exp2', 'sweep'),
+                                   ('exp3', 'other')):
+            self.nero.database[exp_id] = Experiment(exp_id, 'python',
+                    'main.py', self.folder, parameters={'x': 1},
+                    parameters_format='{x}', collection=collection)
+
+    def tearDown(self):
+        neronet.core.osrun = self.osrun
+        neronet.core.USER_DATA_DIR_ABS = self.data_dir
+        shutil.rmtree(self.folder)
+
+    def fake_osrun(self, cmd):
+        if cmd.startswith('rsync'):
+            if ' -e "ssh ' in cmd:
+                # Record the staged experiments of the transfer to the node
+                staging_dir = cmd.split('"')[3].rstrip('/')
+                self.transfers.append(sorted(os.listdir(
+                        os.path.join(staging_dir, 'experiments'))))
+                self.runtime_uploads.append(os.path.exists(os.path.join(
+                        staging_dir, 'neronet',
+                        neronet.core.RUNTIME_DIGEST_FILENAME)))
+                blobs_dir = os.path.join(staging_dir,
+                                         neronet.core.BLOBS_DIR_NAME)
+                blobs = os.listdir(blobs_dir) \
+                    if os.path.exists(blobs_dir) else []
+                self.blob_uploads.append(blobs)
+                FakeNode.blobs.update(blobs)
+            else:
+                source, target = cmd.split('"')[1::2]
+                shutil.copytree(source.rstrip('/'), target)
+            return
+        return self.osrun(cmd)
+
+    def test_experiments_are_transferred_together(self):
+        lines = list(self.nero.submit(['sweep', 'exp3'], 'triton'))
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(self.transfers, [['exp1', 'exp2', 'exp3']])
+        self.assertEqual(self.neromums, ['triton'])
+        self.assertEqual(sorted(exp.id for exp in self.nero.database.find(
+                state=Experiment.State.submitted, node_id='triton')),
+                ['exp1', 'exp2', 'exp3'])
+        # Submitted experiments of a collection are skipped
+        self.assertRaises(AttributeError, list,
+                          self.nero.submit('sweep', 'triton'))
+        self.assertRaises(Exception, list,
+                          self.nero.submit(['exp1'], 'triton'))
+
+    def test_runtime_is_uploaded_only_when_changed(self):
+        list(self.nero.submit('exp1', 'triton'))
+        list(self.nero.submit('exp2', 'triton'))
+        # A new session asks the node for the runtime it has installed
+        self.nero._node_runtimes = {}
+        FakeNode.runtime = neronet.core.runtime_digest()
+        list(self.nero.submit('exp3', 'triton'))
+        self.assertEqual(self.runtime_uploads, [True, False, False])
+
+    def test_shared_files_are_uploaded_once(self):
+        list(self.nero.submit(['exp1', 'exp2'], 'triton'))
+        digest = neronet.experiment.file_digest(os.path.join(self.folder,
+                                                             'main.py'))
+        self.assertEqual(self.blob_uploads, [[digest]])
+        list(self.nero.submit('exp3', 'triton'))
+        self.assertEqual(self.blob_uploads, [[digest], []])
+
+    def test_tar_transfer(self):
+        node_dir = os.path.join(self.folder, 'node')
+        self.nero.nodes['nodes']['triton'].dir = node_dir
+        self.nero.preferences['transfer'] = neronet.node.Transfer.tar
+        lines = list(self.nero.submit(['sweep'], 'triton'))
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(self.transfers, [])
+        self.assertEqual(self.neromums, ['triton'])
+        self.assertEqual(sorted(os.listdir(node_dir)),
+                         ['.incoming', 'blobs', 'experiments', 'neronet',
+                          'node.pickle'])
+        self.assertEqual(os.listdir(os.path.join(node_dir, '.incoming')), [])
+        with open(os.path.join(node_dir, 'neronet',
+                  neronet.core.RUNTIME_DIGEST_FILENAME)) as f:
+            self.assertEqual(f.read(), neronet.core.runtime_digest())
+        self.assertTrue(os.path.exists(os.path.join(node_dir, 'neronet',
+                                                    'neroman.py')))
+        exp_dir = os.path.join(node_dir, 'experiments', 'exp1')
+        with open(os.path.join(exp_dir, 'exp.pickle'), 'rb') as f:
+            self.assertEqual(pickle.load(f).id, 'exp1')
+        with open(os.path.join(exp_dir, neronet.core.MANIFEST_FILENAME)) as f:
+            digest = json.load(f)['main.py']
+        self.assertEqual(os.listdir(os.path.join(node_dir, 'blobs')),
+                         [digest])
+
+    def test_group_submission_is_spread(self):
+        self.nero.nodes['nodes']['kosh'] = FakeNode('kosh', 'unmanaged',
+                                                    'kosh.example')
+        self.nero.nodes['groups']['cluster'] = ['triton', 'kosh']
+        info = neronet.scheduler.NodeInfo(0.0, 1000, 1, 1000)
+        self.nero.scheduler.node_info = lambda node_ids: dict(
+                (node_id, info) for node_id in node_ids)
+        list(self.nero.submit(['sweep', 'exp3'], 'cluster'))
+        self.assertEqual(self.transfers, [['exp1', 'exp3'], ['exp2']])
+        self.assertEqual(self.neromums, ['triton', 'kosh'])
+        self.assertEqual(self.nero.database['exp2'].node_id, 'kosh')
+
+    def test_invalid_id_submits_nothing(self):
+        self.assertRaises(AttributeError, list,
+                          self.nero.submit(['exp1', 'nonexistent'], 'triton'))
+        self.assertEqual(self.transfers, [])
+        self.assertEqual(self.nero.database['exp1'].node_id, None)
+
+    def test_experiment_ids_are_told_from_node_ids(self):
+        self.assertTrue(self.nero.is_experiment_id('exp1'))
+        self.assertTrue(self.nero.is_experiment_id('sweep'))
+        self.assertFalse(self.nero.is_experiment_id('triton'))
+        self.assertFalse(self.nero.is_experiment_id('trtion'))
+
+    def test_tar_transfer_errors(self):
+        node = self.nero.nodes['nodes']['triton']
+        node.dir = os.path.join(self.folder, 'node')
+        missing = os.path.join(self.folder, 'missing.py')
+        self.assertRaises((IOError, OSError), self.nero._send_tar,
+                          [('experiments/exp1/missing.py', missing, None)],
+                          node)
+        # The node closing the pipe early is reported as a failed transfer
+        node.sshopen = lambda cmd: FakeNode.sshopen(node, 'exit 1')
+        self.assertRaises(RuntimeError, self.nero._send_tar,
+                          [('experiments/exp1/data', None, b'x' * 2 ** 20)],
+                          node)
+
+    def test_queued_resources_are_read_from_summaries(self):
+        list(self.nero.submit(['exp1', 'exp2'], 'triton'))
+        self.nero.save_database()
+        self.nero.database = neronet.database.JournalDatabase(
+                neronet.neroman.DATABASE_FILENAME, self.nero.config_parser)
+        self.assertEqual(self.nero._queued_resources()['triton'], (2, 0))
+        self.assertEqual(self.nero.database._experiments, {})
+
+    def test_terminations_are_sent_together(self):
+        list(self.nero.submit(['exp1', 'exp2'], 'triton'))
+        terminated = []
+        node = self.nero.nodes['nodes']['triton']
+        node.terminate_experiments = terminated.append
+        lines = list(self.nero.terminate_experiments(['exp1', 'exp3',
+                                                      'exp2', 'exp4']))
+        self.assertEqual(terminated, [['exp1', 'exp2']])
+        self.assertEqual(len(lines), 4)
+        self.assertIn('successfully', lines[2])
+        self.assertIn('No such experiment', lines[3])
+
+    def test_failed_transfer_is_reverted(self):
+        def send_rsync(files, node):
+            raise RuntimeError('Connection refused')
+        self.nero._send_rsync = send_rsync
+        self.assertRaises(RuntimeError, list,
+                          self.nero.submit('sweep', 'triton'))
+        for exp_id in ('exp1', 'exp2'):
+            self.assertEqual(self.nero.database[exp_id].node_id, None)
+            self.assertEqual(self.nero.database[exp_id].state,
+                             Experiment.State.defined)
+
+    def test_transferred_experiments_stay_submitted(self):
+        # Neromum fails to start after the experiments reached the node
+        self.nero.nodes['nodes']['triton'].fail = True
+        self.assertRaises(RuntimeError, list,
+                          self.nero.submit('sweep', 'triton'))
+        for exp_id in ('exp1', 'exp2'):
+            self.assertEqual(self.nero.database[exp_id].node_id, 'triton')
+            self.assertEqual(self.nero.database[exp_id].state,
+                             Experiment.State.submitted)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import unittest
+import tempfile
+import os
+import shutil
+
+import neronet.core
+import neronet.database
+import neronet.config_parser
+import neronet.neroman
+from neronet.sweep import Sweep
+from neronet.experiment import Experiment
+
+
+class TestSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.data_dir = neronet.core.USER_DATA_DIR_ABS
+        neronet.core.USER_DATA_DIR_ABS = os.path.join(self.folder, 'data')
+        os.mkdir(neronet.core.USER_DATA_DIR_ABS)
+        with open(os.path.join(self.folder, 'main.py'), 'w') as f:
+            f.write('print(1)')
+
+    def tearDown(self):
+        neronet.core.USER_DATA_DIR_ABS = self.data_dir
+        shutil.rmtree(self.folder)
+
+    def create_sweep(self, parameters):
+        return Sweep({'experiment_id': 'sweep',
+                      'run_command_prefix': 'python',
+                      'main_code_file': 'main.py',
+                      'parameters_format': '{a} {b} {c}',
+                      'parameters': parameters,
+                      'path': self.folder})
+
+    def test_expansion(self):
+        sweep = self.create_sweep({'a': [1, 2, 3], 'b': ['x', 'x_y'],
+                                   'c': 0.5})
+        self.assertEqual(len(sweep), 6)
+        definitions = list(sweep)
+        self.assertEqual(definitions[1]['experiment_id'],
+                         'sweep_a-1_b-x_y_c-0.5')
+        for index, definition in enumerate(definitions):
+            self.assertEqual(sweep[index], definition)
+            self.assertEqual(sweep.index(definition['experiment_id']), index)
+        self.assertEqual([exp_id for _, exp_id in sweep.ids()],
+                         [d['experiment_id'] for d in definitions])
+        self.assertEqual(sweep.index('sweep_a-4_b-x_c-0.5'), None)
+        self.assertEqual(sweep.experiment(5).callstring,
+                         'python main.py 3 x_y 0.5')
+        single = self.create_sweep({'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual([d['experiment_id'] for d in single], ['sweep'])
+        self.assertEqual(single.index('sweep'), 0)
+
+    def test_large_sweep_is_not_expanded(self):
+        sweep = self.create_sweep({'a': list(range(1000)),
+                                   'b': list(range(1000)), 'c': 0})
+        self.assertEqual(len(sweep), 1000000)
+        self.assertEqual(sweep[999999]['parameters'],
+                         {'a': 999, 'b': 999, 'c': 0})
+        self.assertEqual(sweep.index('sweep_a-12_b-34_c-0'), 12034)
+
+    def check_virtual_experiments(self, open_database):
+        database = open_database()
+        database['exp'] = Experiment('exp', 'python', 'main.py',
+                                     self.folder, {'a': 1}, '{a}')
+        database.add_sweep(self.create_sweep({'a': [1, 2], 'b': [1, 2],
+                                              'c': 0}))
+        database.save()
+        database = open_database()
+        self.assertEqual(len(database), 5)
+        self.assertIn('sweep_a-2_b-1_c-0', database)
+        self.assertEqual(len(database.summaries(virtual=False)), 1)
+        # Reading a virtual experiment doesn't store it
+        for exp_id in database.keys():
+            database[exp_id]
+        self.assertEqual(len(database.find(
+                collection=os.path.basename(self.folder))), 5)
+        self.assertEqual(database.find(node_id='triton'), [])
+        database.save()
+        self.assertEqual(len(open_database().summaries(virtual=False)), 1)
+        experiment = database['sweep_a-2_b-1_c-0']
+        experiment.node_id = 'triton'
+        database['sweep_a-2_b-1_c-0'] = experiment
+        del database['sweep_a-1_b-1_c-0']
+        database.save()
+        database = open_database()
+        self.assertEqual(sorted(database), ['exp', 'sweep_a-1_b-2_c-0',
+                                            'sweep_a-2_b-1_c-0',
+                                            'sweep_a-2_b-2_c-0'])
+        self.assertEqual([exp.id for exp in database.submitted()],
+                         ['sweep_a-2_b-1_c-0'])
+        self.assertEqual(len(database.summaries(virtual=False)), 2)
+        self.assertEqual(database.summary('sweep_a-2_b-2_c-0').state,
+                         Experiment.State.defined)
+
+    def test_virtual_experiments_in_journal_database(self):
+        config_parser = neronet.config_parser.ConfigParser()
+        self.check_virtual_experiments(lambda:
+                neronet.database.JournalDatabase('default.yaml',
+                                                 config_parser))
+
+    def test_virtual_experiments_in_sqlite_database(self):
+        self.check_virtual_experiments(lambda:
+                neronet.database.SQLiteDatabase('default.sqlite'))
+
+    def test_specify_large_sweep(self):
+        with open(os.path.join(self.folder, 'config.yaml'), 'w') as f:
+            f.write("run_command_prefix: python\n"
+                    "main_code_file: main.py\n"
+                    "parameters_format: '{a} {b}'\n"
+                    "+sweep:\n"
+                    "    parameters:\n"
+                    "        a: [1, 2, 3]\n"
+                    "        b: [1, 2]\n")
+        size = neronet.neroman.VIRTUAL_SWEEP_SIZE
+        neronet.neroman.VIRTUAL_SWEEP_SIZE = 4
+        try:
+            nero = neronet.neroman.Neroman()
+            nero.specify_experiments(self.folder)
+            self.assertEqual(list(nero.database.sweeps()), ['sweep'])
+            self.assertEqual(len(nero.database), 6)
+            self.assertRaises(IOError, nero.specify_experiments, self.folder)
+            with open(os.path.join(self.folder, 'main.py'), 'w') as f:
+                f.write('print(2) # changed')
+            changed = nero.specify_experiments(self.folder)
+            self.assertEqual(list(changed), ['sweep'])
+        finally:
+            neronet.neroman.VIRTUAL_SWEEP_SIZE = size
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import tempfile
+import os
+import shutil
+
+import neronet.core
+import neronet.neroman
+from neronet.experiment import Experiment
+
+
+class TestTransaction(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.data_dir = neronet.core.USER_DATA_DIR_ABS
+        neronet.core.USER_DATA_DIR_ABS = self.folder
+        self.nero = neronet.neroman.Neroman()
+        self.expfolder = os.path.join(self.folder, 'exps')
+        os.mkdir(self.expfolder)
+        open(os.path.join(self.expfolder, 'main.py'), 'w').close()
+        with open(os.path.join(self.expfolder, 'config.yaml'), 'w') as f:
+            f.write("run_command_prefix: python\n"
+                    "main_code_file: main.py\n"
+                    "parameters_format: '{x}'\n"
+                    "+exp1:\n"
+                    "    parameters:\n"
+                    "        x: 1\n")
+
+    def tearDown(self):
+        neronet.core.USER_DATA_DIR_ABS = self.data_dir
+        shutil.rmtree(self.folder)
+
+    def create_experiment(self, exp_id):
+        return Experiment(exp_id, 'python', 'main.py', self.expfolder,
+                          parameters={'x': 1}, parameters_format='{x}')
+
+    def test_writes_are_deferred(self):
+        with self.nero.transaction():
+            for exp_id in ('exp2', 'exp3'):
+                self.nero.replace_experiment(self.create_experiment(exp_id))
+                self.assertFalse(os.path.exists(
+                        self.nero.database.journal_path))
+            with self.nero.transaction():
+                ''.join(self.nero.delete_experiment('exp2'))
+            self.assertFalse(os.path.exists(self.nero.database.journal_path))
+        self.assertEqual(list(neronet.neroman.Neroman().database), ['exp3'])
+
+    def test_writes_are_flushed_on_error(self):
+        try:
+            with self.nero.transaction():
+                self.nero.replace_experiment(self.create_experiment('exp2'))
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(list(neronet.neroman.Neroman().database), ['exp2'])
+
+    def test_specify_experiments_adds_new_ones_besides_existing(self):
+        self.nero.specify_experiments(self.expfolder)
+        with open(os.path.join(self.expfolder, 'config.yaml'), 'a') as f:
+            f.write("+exp2:\n"
+                    "    parameters:\n"
+                    "        x: 2\n")
+        # The unchanged experiment is reported after the new one is added
+        self.assertRaises(IOError, self.nero.specify_experiments,
+                          self.expfolder)
+        self.assertEqual(sorted(neronet.neroman.Neroman().database),
+                         ['exp1', 'exp2'])
+
+    def test_changed_experiments_are_detected(self):
+        self.nero.specify_experiments(self.expfolder)
+        with open(os.path.join(self.expfolder, 'main.py'), 'w') as f:
+            f.write('print(1)')
+        changed_exps = self.nero.specify_experiments(self.expfolder)
+        self.assertEqual(list(changed_exps), ['exp1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import unittest
+import tempfile
+import os
+import shutil
+import pickle
+import sys
+
+import neronet.core
+import neronet.node
+import neronet.nerokid
+import neronet.neromum
+from neronet.experiment import Experiment
+
+
+class TestWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        # The worker and the kids log to the standard output
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        self.data_dir = neronet.core.USER_DATA_DIR_ABS
+        neronet.core.USER_DATA_DIR_ABS = self.folder
+        self.interval = neronet.nerokid.INTERVAL
+        neronet.nerokid.INTERVAL = 0.05
+        self.walltime_left = neronet.nerokid.walltime_left
+        self.update_neromum = neronet.nerokid.Nerokid.update_neromum
+        self.updates = updates = []
+
+        def update_neromum(kid, log_output):
+            updates.append((kid.exp_id, kid.exp.state))
+        neronet.nerokid.Nerokid.update_neromum = update_neromum
+        self.path = os.environ['PATH']
+        bin_dir = os.path.join(self.folder, 'bin')
+        os.mkdir(bin_dir)
+        # sbatch numbers the jobs by the calls and squeue lists the jobs in
+        # the squeue.out file
+        calls = os.path.join(self.folder, 'sbatch.calls')
+        neronet.core.write_file(os.path.join(bin_dir, 'sbatch'),
+                                '#!/bin/sh\necho "$@" >> "%s"\n'
+                                'wc -l < "%s"\n' % (calls, calls))
+        self.squeue_out = os.path.join(self.folder, 'squeue.out')
+        neronet.core.write_file(os.path.join(bin_dir, 'squeue'),
+                                '#!/bin/sh\ncat "%s" 2>/dev/null\n'
+                                % self.squeue_out)
+        for command in ('sbatch', 'squeue'):
+            os.chmod(os.path.join(bin_dir, command), 0o755)
+        os.environ['PATH'] = bin_dir + os.pathsep + self.path
+        node = neronet.node.Node('triton', 'slurm', 'triton.example',
+                                 slurm_mode=neronet.node.SlurmMode.pack)
+        neronet.core.write_file(os.path.join(self.folder, 'node.pickle'),
+                                pickle.dumps(node))
+        self.queue_dir = os.path.join(self.folder,
+                                      neronet.neromum.QUEUE_DIR_NAME)
+        os.mkdir(self.queue_dir)
+        for i in range(3):
+            exp = Experiment('exp%d' % i, 'sh', 'main.sh', self.folder,
+                             parameters={'x': i}, parameters_format='{x}')
+            exp.update_state(Experiment.State.submitted_to_kid)
+            exp_dir = os.path.join(self.folder, 'experiments', exp.id)
+            os.makedirs(exp_dir)
+            neronet.core.write_file(os.path.join(exp_dir, 'main.sh'),
+                                    'echo "result $1"\n')
+            neronet.core.write_file(os.path.join(exp_dir, 'exp.pickle'),
+                                    pickle.dumps(exp))
+            neronet.core.write_file(os.path.join(self.queue_dir, exp.id), '')
+
+    def tearDown(self):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+        os.environ['PATH'] = self.path
+        neronet.nerokid.INTERVAL = self.interval
+        neronet.nerokid.walltime_left = self.walltime_left
+        neronet.nerokid.Nerokid.update_neromum = self.update_neromum
+        neronet.core.USER_DATA_DIR_ABS = self.data_dir
+        shutil.rmtree(self.folder)
+
+    def test_parse_duration(self):
+        self.assertEqual(neronet.nerokid.parse_duration('45'), 45)
+        self.assertEqual(neronet.nerokid.parse_duration('10:30\n'), 630)
+        self.assertEqual(neronet.nerokid.parse_duration('1-02:00:05'),
+                         93605)
+        self.assertEqual(neronet.nerokid.parse_duration('UNLIMITED'), None)
+
+    def test_queue_is_emptied(self):
+        worker = neronet.nerokid.Worker('localhost', 1234, 2, 'worker.sh')
+        self.assertEqual(worker.run(), 3)
+        self.assertEqual(os.listdir(self.queue_dir), [])
+        self.assertEqual(sorted(exp_id for exp_id, state in self.updates
+                                if state == Experiment.State.finished),
+                         ['exp0', 'exp1', 'exp2'])
+        for i in range(3):
+            with open(os.path.join(self.folder, 'experiments', 'exp%d' % i,
+                                   'stdout.log')) as f:
+                self.assertEqual(f.read(), 'result %d\n' % i)
+        self.assertFalse(os.path.exists(os.path.join(self.folder,
+                                                     'sbatch.calls')))
+
+    def test_worker_is_resubmitted_when_out_of_time(self):
+        neronet.nerokid.walltime_left = lambda: 0
+        worker = neronet.nerokid.Worker('localhost', 1234, 1, 'worker.sh')
+        self.assertEqual(worker.run(), 0)
+        self.assertEqual(sorted(os.listdir(self.queue_dir)),
+                         ['exp0', 'exp1', 'exp2'])
+        with open(os.path.join(self.folder, 'sbatch.calls')) as f:
+            self.assertEqual(f.read(), '--parsable worker.sh\n')
+        self.assertEqual(os.listdir(os.path.join(
+                self.folder, neronet.neromum.WORKERS_DIR_NAME)), ['1.job'])
+
+    def test_experiments_are_queued_for_workers(self):
+        shutil.rmtree(self.queue_dir)
+        mum = neronet.neromum.Neromum()
+        mum.load_experiments()
+        for exp in mum.exp_dict.values():
+            exp.update_state(Experiment.State.submitted)
+        mum.ontimeout()
+        self.assertEqual(sorted(os.listdir(self.queue_dir)),
+                         ['exp0', 'exp1', 'exp2'])
+        with open(os.path.join(self.folder, 'sbatch.calls')) as f:
+            script = f.read().split()[-1]
+        with open(script) as f:
+            self.assertIn('nerokid --worker', f.read())
+        # Workers are submitted only when fewer than wanted are alive
+        mum.node.pack_workers = 2
+        neronet.core.write_file(self.squeue_out, '1\n')
+        mum.launch_packed([])
+        neronet.core.write_file(self.squeue_out, '1\n2\n')
+        mum.launch_packed([])
+        self.assertEqual(sorted(neronet.neromum.live_workers()), ['1', '2'])
+        neronet.core.write_file(self.squeue_out, '2\n')
+        self.assertEqual(neronet.neromum.live_workers(), ['2'])
+        mum.launch_packed([])
+        with open(os.path.join(self.folder, 'sbatch.calls')) as f:
+            self.assertEqual(len(f.readlines()), 3)
+        # The experiments waiting for a worker aren't lost
+        for exp in mum.exp_dict.values():
+            exp.time_modified -= neronet.neromum.datetime.timedelta(hours=1)
+        mum.ontimeout()
+        self.assertEqual(set(exp.state for exp in mum.exp_dict.values()),
+                         set([Experiment.State.submitted_to_kid]))
+
+
+if __name__ == '__main__':
+    unittest.main()